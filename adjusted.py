@@ -0,0 +1,246 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from typing import Dict, List, Tuple
+from features import STAT_COLUMNS, sort_fights, to_fighter_rows
+from instrument import count, timed
+
+# Ridge penalty of the ratings, in fights: a fighter's rating is shrunk towards the league as if they had
+# this many extra fights at the league average. 2 is the Colley method's choice
+PRIOR_FIGHTS = 2.0
+TOLERANCE = 1e-4
+MAX_ITERATIONS = 200
+
+ADJUSTED_KINDS = ['adj', 'adj_def', 'sos']
+
+
+## Columns ##
+def adjusted_columns(stat_columns: List[str] = STAT_COLUMNS) -> List[str]:
+    """
+    Args:
+        stat_columns (List[str]): stats to adjust
+
+    Returns:
+        List[str]: the columns add_adjusted adds, f<corner>_adj_<stat>, f<corner>_adj_def_<stat>,
+                   f<corner>_sos_<stat>, f<corner>_adj_win_score and f<corner>_sos for both corners
+    """
+    return [f'f{corner}_{kind}_{stat}' for corner in (1, 2) for kind in ADJUSTED_KINDS for stat in stat_columns] \
+        + [f'f{corner}_{name}' for corner in (1, 2) for name in ('adj_win_score', 'sos')]
+
+
+## Solver ##
+def ridge_solve(A: sp.csr_matrix, y: np.ndarray, weights: np.ndarray, penalty: float, x0: np.ndarray,
+                tolerance: float = TOLERANCE, max_iterations: int = MAX_ITERATIONS) -> Tuple[np.ndarray, int]:
+    """
+    Solves min_x |W^(1/2) (A x - y)|^2 + penalty |x|^2 for every column of y
+    at once, by Jacobi-preconditioned conjugate gradients on the normal equations
+    (A^T W A + penalty I) x = A^T W y. Each column keeps its own step sizes,
+    so the columns converge as if solved one at a time, but every iteration is
+    a single sparse product for all of them.
+
+    Args:
+        A (sp.csr_matrix): (rows, unknowns) design matrix
+        y (np.ndarray): (rows, columns) targets
+        weights (np.ndarray): (rows, columns) row weights, 0 to leave a row out of a column's fit
+        penalty (float): ridge penalty, positive so the system is definite
+        x0 (np.ndarray): (unknowns, columns) starting point, e.g. the previous solution
+        tolerance (float): stop once every column's residual is this fraction of its right-hand side
+        max_iterations (int): stop after this many iterations regardless
+
+    Returns:
+        Tuple[np.ndarray, int]: (unknowns, columns) solution and the number of iterations run
+    """
+    At = A.T
+
+    def normal(v: np.ndarray) -> np.ndarray:
+        product = A @ v
+        product *= weights
+        product = At @ product
+        product += penalty * v
+        return product
+
+    # Jacobi preconditioner: the inverse diagonal of the normal equations, one over a fighter's number of
+    # fights plus the penalty, which ranges from a debut to a long career
+    inverse_diagonal = 1.0 / (A.power(2).T @ weights + penalty)
+    b = At @ (weights * y)
+    limit = tolerance ** 2 * np.einsum('ij,ij->j', b, b)
+    x = x0.copy()
+    r = b - normal(x)
+    z = r * inverse_diagonal
+    p = z.copy()
+    rz = np.einsum('ij,ij->j', r, z)
+    iterations = 0
+    while iterations < max_iterations and np.any(np.einsum('ij,ij->j', r, r) > limit):
+        Ap = normal(p)
+        curvature = np.einsum('ij,ij->j', p, Ap)
+        # A column without data has p = 0; its step is 0 rather than 0 / 0
+        alpha = np.divide(rz, curvature, out=np.zeros_like(rz), where=curvature > 0)
+        x += alpha * p
+        Ap *= alpha
+        r -= Ap
+        np.multiply(r, inverse_diagonal, out=z)
+        rz_next = np.einsum('ij,ij->j', r, z)
+        p *= np.divide(rz_next, rz, out=np.zeros_like(rz), where=rz > 0)
+        p += z
+        rz = rz_next
+        iterations += 1
+
+    return x, iterations
+
+def _prefix(matrix: sp.csr_matrix, n_rows: int, n_columns: int) -> sp.csr_matrix:
+    # The first rows and columns of a matrix whose first n_rows rows have no entries past n_columns,
+    # sharing its buffers
+    end = matrix.indptr[n_rows]
+    return sp.csr_matrix((matrix.data[:end], matrix.indices[:end], matrix.indptr[:n_rows + 1]),
+                         shape=(n_rows, n_columns), copy=False)
+
+
+## Engine ##
+@timed()
+def add_adjusted(fight_df: pd.DataFrame, stat_columns: List[str] = STAT_COLUMNS,
+                 prior_fights: float = PRIOR_FIGHTS) -> pd.DataFrame:
+    """
+    Adds opponent-adjusted averages, strength of schedule and an opponent-
+    adjusted win rate as of each fight date. Each stat a fighter lands is
+    modelled as the league mean plus the fighter's offense plus the
+    opponent's defense, fit by ridge regression on the fights before the
+    date:
+
+    - f<corner>_adj_<stat> is the mean plus the offense, what the fighter
+      lands against an average opponent;
+    - f<corner>_adj_def_<stat> is the mean plus the defense, what an average
+      opponent lands against them;
+    - f<corner>_sos_<stat> is the mean of the adj_def values of the
+      fighter's earlier opponents, how much the schedule gave up.
+
+    The results, +1/2 for a win, -1/2 for a loss and 0 for a draw, are fit
+    the same way, the setup of the Colley matrix method: f<corner>_adj_win_score
+    is 0.5 plus the fighter's rating, which counts wins over strong opponents
+    for more, and f<corner>_sos the mean score of the earlier opponents. It
+    is a score, not a rate: it is centred on 0.5 but not bounded to [0, 1]
+    (about 0.16 to 1.23 over the full history).
+
+    The design matrix is the sparse fighter x fight incidence matrix of the
+    fight history, ordered by date, so the fights before a date are a prefix
+    of its rows. The regression is solved once per date by conjugate
+    gradients started from the previous date's ratings, which a card changes
+    little, so each date takes a few sparse products.
+
+    Only fights before the current fight's date are used, so fights on the
+    same card do not see each other. Each fighter's own stats are used in
+    both corners, and missing stats are left out of that stat's fit. The
+    columns are NaN for a fighter without earlier fights.
+
+    Args:
+        fight_df (pd.DataFrame): fight table with f1/f2, date, winner and the f1_/f2_ stats
+        stat_columns (List[str]): stats to adjust
+        prior_fights (float): ridge penalty in fights, see PRIOR_FIGHTS
+
+    Returns:
+        pd.DataFrame: fight_df sorted by date with adjusted_columns(stat_columns) added
+    """
+    fight_df = sort_fights(fight_df)
+    n_fights = len(fight_df)
+    count('add_adjusted.rows', n_fights)
+
+    # Fighter rows, ordered by fight then corner, so the rows of the first m fights are the first 2m. The
+    # fighters are numbered in order of their first fight, so those seen in the first m fights are the
+    # first few, and the fits on a prefix of the history are prefixes of the full matrices' rows and columns
+    long_df = to_fighter_rows(fight_df, stat_columns)
+    fight = long_df['fight'].to_numpy()
+    corner = long_df['corner'].to_numpy()
+    codes, fighters = pd.factorize(long_df['fighter'])
+    n_fighters = len(fighters)
+    n_rows = len(long_df)
+    pairs = codes.reshape(n_fights, 2)
+    opponent = pairs[:, ::-1].reshape(-1)
+    known = np.maximum.accumulate(codes) + 1
+
+    # Incidence of each row's fighter and opponent. The design interleaves the fighters' offense (even
+    # columns) and defense (odd columns)
+    rows = np.arange(n_rows)
+    ones = np.ones(n_rows)
+    own = sp.csr_matrix((ones, (rows, codes)), shape=(n_rows, n_fighters))
+    faced = sp.csr_matrix((ones, (rows, opponent)), shape=(n_rows, n_fighters))
+    design = sp.csr_matrix((np.r_[ones, ones], (np.r_[rows, rows], np.r_[2 * codes, 2 * opponent + 1])),
+                           shape=(n_rows, 2 * n_fighters))
+
+    # The results are the last target: +1/2 for the winner's row, -1/2 for the loser's. Their defense
+    # comes out as minus their offense, so each fight is fit twice and each rating penalised twice, as in
+    # the Colley system with the penalty as its 2
+    n_stats = len(stat_columns)
+    values = long_df[stat_columns].to_numpy(dtype=float)
+    present = ~np.isnan(values)
+    winner = fight_df['winner'].to_numpy(dtype=object)[fight]
+    names = np.where(corner == 1, fight_df['f1'].to_numpy(dtype=object)[fight],
+                     fight_df['f2'].to_numpy(dtype=object)[fight])
+    opponent_names = np.where(corner == 1, fight_df['f2'].to_numpy(dtype=object)[fight],
+                              fight_df['f1'].to_numpy(dtype=object)[fight])
+    margin = 0.5 * (winner == names) - 0.5 * (winner == opponent_names)
+    targets = np.column_stack([np.where(present, values, 0.0), margin])
+    weights = np.column_stack([present, np.ones(n_rows, dtype=bool)]).astype(float)
+    totals = np.vstack([np.zeros((1, n_stats + 1)), np.cumsum(targets, axis=0)])
+    counts = np.vstack([np.zeros((1, n_stats + 1)), np.cumsum(weights, axis=0)])
+
+    days = fight_df['date'].to_numpy().astype('datetime64[D]').astype(np.int64)
+    starts = np.r_[0, np.flatnonzero(np.diff(days)) + 1]
+    ends = np.r_[starts[1:], n_fights]
+
+    ratings = np.zeros((0, n_stats + 1))
+    adjusted = {kind: np.full((n_rows, n_stats + 1), np.nan) for kind in ADJUSTED_KINDS}
+    iterations = 0
+
+    for start, end in zip(starts, ends):
+        if start == 0:
+            continue
+        day_rows = slice(2 * start, 2 * end)
+        prior = 2 * start
+        k = known[prior - 1]
+        # The results have mean 0 by construction, the stats are fit around the league mean so far
+        mean = totals[prior] / np.maximum(counts[prior], 1.0)
+        mean[-1] = 0.0
+        # Fighters new since the last date start at the league average
+        ratings = np.vstack([ratings, np.zeros((2 * k - len(ratings), n_stats + 1))])
+        ratings, n = ridge_solve(_prefix(design, prior, 2 * k), targets[:prior] - mean, weights[:prior],
+                                 prior_fights, ratings)
+        iterations += n
+
+        # Schedules: the defense of each earlier opponent through the incidence of the prefix
+        earlier = _prefix(own, prior, k).T
+        fought = earlier @ weights[:prior]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            schedule = earlier @ (weights[:prior] * (_prefix(faced, prior, k) @ ratings[1::2])) / fought
+
+        # Debuts today are numbered from k on and stay NaN
+        fighters_today = codes[day_rows]
+        seen = fighters_today < k
+        fighters_today = np.where(seen, fighters_today, 0)
+        seen = seen[:, None] & (fought[fighters_today] > 0)
+        adjusted['adj'][day_rows] = np.where(seen, mean + ratings[2 * fighters_today], np.nan)
+        adjusted['adj_def'][day_rows] = np.where(seen, mean + ratings[2 * fighters_today + 1], np.nan)
+        adjusted['sos'][day_rows] = np.where(seen, mean + schedule[fighters_today], np.nan)
+
+    count('add_adjusted.dates', len(starts))
+    count('add_adjusted.iterations', iterations)
+
+    # The results' defense is minus their offense (a fighter's rating), so the schedule's strength is
+    # 0.5 minus the defense the opponents gave up
+    win_score = 0.5 + adjusted['adj'][:, -1]
+    win_sos = 0.5 - adjusted['sos'][:, -1]
+
+    results: Dict[str, np.ndarray] = {}
+    for c in (1, 2):
+        in_corner = corner == c
+        for kind in ADJUSTED_KINDS:
+            wide = np.empty((n_fights, n_stats))
+            wide[fight[in_corner]] = adjusted[kind][in_corner, :n_stats]
+            for i, stat in enumerate(stat_columns):
+                results[f'f{c}_{kind}_{stat}'] = wide[:, i]
+        for name, column in (('adj_win_score', win_score), ('sos', win_sos)):
+            wide = np.empty(n_fights)
+            wide[fight[in_corner]] = column[in_corner]
+            results[f'f{c}_{name}'] = wide
+
+    columns = adjusted_columns(stat_columns)
+    return pd.concat([fight_df, pd.DataFrame({column: results[column] for column in columns},
+                                             index=fight_df.index)], axis=1)
@@ -0,0 +1,219 @@
+import re
+import numpy as np
+import pandas as pd
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from features import FINISH_METHODS, STAT_COLUMNS, sort_fights, to_fighter_rows
+from instrument import count, timed
+
+# Per-fight outcomes aggregated like the stats, so e.g. last5_won is the win rate over the last five fights
+OUTCOME_COLUMNS = ['won', 'finished']
+AGGREGATE_STATS = STAT_COLUMNS + OUTCOME_COLUMNS
+
+# Decayed sums are kept relative to each fighter's first fight, 2 ** (days / half_life) must stay finite
+MAX_DECAY_EXPONENT = 900
+
+COLUMN_PATTERN = re.compile(r'^f([12])_(mean|pm|last(\d+)(_pm)?|decay(\d+(?:\.\d+)?)(_pm)?)_(.+)$')
+
+
+class Aggregate(NamedTuple):
+    kind: str                           # 'mean', 'last' or 'decay'
+    n: Optional[int] = None             # fights in the window of 'last'
+    half_life: Optional[float] = None   # days after which a fight of 'decay' counts half
+    per_minute: bool = False            # per minute fought instead of per fight
+
+    @property
+    def name(self) -> str:
+        """
+        Returns:
+            str: name used in the feature columns, e.g. 'last5', 'decay365_pm' or 'pm' (all-time per minute)
+        """
+        if self.kind == 'mean':
+            return 'pm' if self.per_minute else 'mean'
+        if self.kind == 'last':
+            base = f'last{self.n}'
+        elif self.kind == 'decay':
+            base = f'decay{self.half_life:g}'
+        else:
+            raise ValueError(f"kind must be 'mean', 'last' or 'decay', not {self.kind!r}")
+        return base + '_pm' if self.per_minute else base
+
+DEFAULT_AGGREGATES = [
+    Aggregate('last', n=3),
+    Aggregate('last', n=5),
+    Aggregate('decay', half_life=365),
+    Aggregate('mean', per_minute=True),
+    Aggregate('last', n=3, per_minute=True),
+]
+
+
+## Columns ##
+def aggregate_columns(aggregates: List[Aggregate] = DEFAULT_AGGREGATES,
+                      stat_columns: List[str] = AGGREGATE_STATS) -> List[str]:
+    """
+    Args:
+        aggregates (List[Aggregate]): aggregates to compute
+        stat_columns (List[str]): stats and outcomes to aggregate
+
+    Returns:
+        List[str]: f<corner>_<aggregate name>_<stat> for both corners, the columns add_aggregates adds
+    """
+    return [f'f{corner}_{aggregate.name}_{stat}' for corner in (1, 2) for aggregate in aggregates
+            for stat in stat_columns]
+
+def parse_column(column: str) -> Optional[Tuple[int, Aggregate, str]]:
+    """
+    Args:
+        column (str): name of a feature column, e.g. 'f2_last5_sig_str_landed'
+
+    Returns:
+        Optional[Tuple[int, Aggregate, str]]: (corner, aggregate, stat), None if it is not an aggregate column
+    """
+    match = COLUMN_PATTERN.match(column)
+    if match is None or match.group(7) not in AGGREGATE_STATS:
+        return None
+    corner, name, n, last_pm, half_life, decay_pm, stat = match.groups()
+    if n is not None:
+        aggregate = Aggregate('last', n=int(n), per_minute=bool(last_pm))
+    elif half_life is not None:
+        aggregate = Aggregate('decay', half_life=float(half_life), per_minute=bool(decay_pm))
+    else:
+        aggregate = Aggregate('mean', per_minute=name == 'pm')
+
+    return int(corner), aggregate, stat
+
+
+## Engine ##
+def _exclusive_cumsum(values: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    # Sum of the earlier rows of the same fighter, rows grouped by fighter in fight order. The stats and
+    # seconds are integers, so the difference of running totals is exact
+    totals = np.cumsum(values, axis=0)
+    exclusive = totals - values
+    return exclusive - exclusive[starts]
+
+def _window_sum(prior: np.ndarray, positions: np.ndarray, starts: np.ndarray, n: int) -> np.ndarray:
+    # prior holds sums over all earlier rows of the fighter; the last n of them are those since row - n
+    back = positions - n
+    inside = back >= starts
+    windowed = prior.copy()
+    windowed[inside] -= prior[back[inside]]
+    return windowed
+
+def _ratio(numerator: np.ndarray, denominator: np.ndarray, scale: float = 1.0) -> np.ndarray:
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(denominator > 0, scale * numerator / denominator, np.nan)
+
+@timed()
+def add_aggregates(fight_df: pd.DataFrame, aggregates: List[Aggregate] = DEFAULT_AGGREGATES,
+                   stat_columns: List[str] = AGGREGATE_STATS) -> pd.DataFrame:
+    """
+    Adds windowed, time-decayed and per-minute aggregates of every fighter's
+    earlier fights for both corners. The fight table is reshaped once to one
+    row per fighter per fight, grouped by fighter; every aggregate is then a
+    difference of running totals over that ordering, so the cost is linear in
+    the number of fights whatever the windows.
+
+    Each fighter's own stats are aggregated in both corners (unlike the f2
+    averages of calculate_fighter_historical_averages). Missing stats are
+    skipped, and per-minute aggregates also skip fights without a length.
+    Only fights before the current one in fight order are used.
+
+    Args:
+        fight_df (pd.DataFrame): fight table with f1/f2, winner, method, fight_length and the f1_/f2_ stats
+        aggregates (List[Aggregate]): aggregates to compute
+        stat_columns (List[str]): stats to aggregate, and 'won' or 'finished' for outcomes
+
+    Returns:
+        pd.DataFrame: fight_df sorted by date with aggregate_columns(aggregates, stat_columns) added. mean and
+                      last are per fight, per_minute ones per minute fought, decay weights a fight
+                      2 ** (-days since / half_life) as of the current fight's date
+    """
+    fight_df = sort_fights(fight_df)
+    n_fights = len(fight_df)
+    count('add_aggregates.rows', n_fights)
+
+    stats = [stat for stat in stat_columns if stat not in OUTCOME_COLUMNS]
+    long_df = to_fighter_rows(fight_df, stats)
+    fight = long_df['fight'].to_numpy()
+    corner = long_df['corner'].to_numpy()
+
+    values = long_df[stats].to_numpy(dtype=float)
+    if any(stat in OUTCOME_COLUMNS for stat in stat_columns):
+        winner = fight_df['winner'].to_numpy(dtype=object)
+        names = np.where(corner == 1, fight_df['f1'].to_numpy(dtype=object)[fight],
+                         fight_df['f2'].to_numpy(dtype=object)[fight])
+        won = winner[fight] == names
+        outcomes = {'won': won, 'finished': won & fight_df['method'].isin(FINISH_METHODS).to_numpy()[fight]}
+        values = np.column_stack([values] + [outcomes[stat].astype(float) for stat in stat_columns
+                                             if stat in OUTCOME_COLUMNS])
+        stats = stats + [stat for stat in stat_columns if stat in OUTCOME_COLUMNS]
+    values = values[:, [stats.index(stat) for stat in stat_columns]]
+    seconds = fight_df['fight_length'].to_numpy(dtype=float, na_value=np.nan)[fight]
+    days = fight_df['date'].to_numpy().astype('datetime64[D]').astype(np.int64)[fight].astype(float)
+
+    # Group the rows by fighter, keeping fight order within each fighter
+    codes, _ = pd.factorize(long_df['fighter'])
+    order = np.argsort(codes, kind='stable')
+    codes = codes[order]
+    values = values[order]
+    seconds = seconds[order]
+    days = days[order]
+    positions = np.arange(len(order))
+    first = np.r_[True, codes[1:] != codes[:-1]]
+    starts = np.maximum.accumulate(np.where(first, positions, 0))
+
+    present = ~np.isnan(values)
+    timed_present = present & ~np.isnan(seconds)[:, None]
+    x = np.where(present, values, 0.0)
+    x_timed = np.where(timed_present, values, 0.0)
+    s_timed = np.where(timed_present, np.nan_to_num(seconds)[:, None], 0.0)
+
+    prior_x = _exclusive_cumsum(x, starts)
+    prior_n = _exclusive_cumsum(present.astype(float), starts)
+    prior_x_timed = _exclusive_cumsum(x_timed, starts)
+    prior_s = _exclusive_cumsum(s_timed, starts)
+
+    results: Dict[str, np.ndarray] = {}
+    for aggregate in aggregates:
+        if aggregate.kind == 'mean':
+            numerator, denominator = (prior_x_timed, prior_s) if aggregate.per_minute else (prior_x, prior_n)
+        elif aggregate.kind == 'last':
+            if aggregate.per_minute:
+                numerator = _window_sum(prior_x_timed, positions, starts, aggregate.n)
+                denominator = _window_sum(prior_s, positions, starts, aggregate.n)
+            else:
+                numerator = _window_sum(prior_x, positions, starts, aggregate.n)
+                denominator = _window_sum(prior_n, positions, starts, aggregate.n)
+        elif aggregate.kind == 'decay':
+            elapsed = (days - days[starts]) / aggregate.half_life
+            if elapsed.size and elapsed.max() > MAX_DECAY_EXPONENT:
+                raise ValueError(f'half_life {aggregate.half_life:g} is too short for careers this long')
+            weight = np.exp2(elapsed)[:, None]
+            source = (x_timed, s_timed) if aggregate.per_minute else (x, present.astype(float))
+            # sum_j w_j x_j over earlier fights, brought to the current date
+            numerator = _decayed_sum(source[0] * weight, starts) / weight
+            denominator = _decayed_sum(source[1] * weight, starts) / weight
+        else:
+            raise ValueError(f"kind must be 'mean', 'last' or 'decay', not {aggregate.kind!r}")
+
+        ratios = _ratio(numerator, denominator, 60.0 if aggregate.per_minute else 1.0)
+        placed = np.empty_like(ratios)
+        placed[order] = ratios
+        for c in (1, 2):
+            in_corner = corner == c
+            wide = np.empty((n_fights, len(stat_columns)))
+            wide[fight[in_corner]] = placed[in_corner]
+            for i, stat in enumerate(stat_columns):
+                results[f'f{c}_{aggregate.name}_{stat}'] = wide[:, i]
+
+    columns = aggregate_columns(aggregates, stat_columns)
+    return pd.concat([fight_df, pd.DataFrame({column: results[column] for column in columns},
+                                             index=fight_df.index)], axis=1)
+
+def _decayed_sum(weighted: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    # Weighted values are not integers and grow along a career, so the running totals restart at each
+    # fighter and are shifted by a row rather than having the current row subtracted
+    totals = pd.DataFrame(weighted).groupby(starts, sort=False).cumsum().to_numpy()
+    prior = np.zeros_like(totals)
+    prior[1:] = totals[:-1]
+    prior[starts == np.arange(len(starts))] = 0.0
+    return prior
@@ -0,0 +1,271 @@
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from features import STAT_COLUMNS, add_additional_fighter_metrics, calculate_fighter_historical_averages, sort_fights
+from model import FEATURE_COLUMNS, LogisticModel
+from pipeline import CODE_FOLDER, FileHashes, module_closure
+
+MATRIX_FOLDER = 'backtest'
+# The matrix is rebuilt when these modules, or any module they import, change
+FEATURE_MODULES = ['features.py']
+MIN_TRAIN = 500
+CALIBRATION_BINS = 10
+SUMMARY_COLUMNS = ['start', 'n_train', 'n_test', 'accuracy', 'log_loss', 'brier', 'mean_p', 'win_rate', 'ece']
+
+
+## Feature Matrix ##
+def fight_fingerprint(fight_df: pd.DataFrame, own_stats_only: bool = False) -> str:
+    """
+    Args:
+        fight_df (pd.DataFrame): fight table
+        own_stats_only (bool): see features.calculate_fighter_historical_averages
+
+    Returns:
+        str: hash of the columns the features are computed from, changes whenever a fight is added, removed
+             or edited
+    """
+    columns = ['date', 'event', 'f1', 'f2', 'winner', 'method'] + [f'{corner}_{stat}' for corner in ('f1', 'f2')
+                                                                   for stat in STAT_COLUMNS]
+    hashes = pd.util.hash_pandas_object(fight_df[columns], index=False).to_numpy()
+    return hashlib.sha1(hashes.tobytes() + str(own_stats_only).encode('utf-8')).hexdigest()
+
+def code_fingerprint(modules: List[str]) -> str:
+    """
+    Args:
+        modules (List[str]): source files next to this one
+
+    Returns:
+        str: hash of the modules and every module they import, changes whenever that code is edited
+    """
+    hashes = FileHashes()
+    closure = module_closure(modules, hashes, {})
+    digest = hashlib.sha1()
+    for module in closure:
+        digest.update(module.encode('utf-8'))
+        digest.update(hashes.file(os.path.join(CODE_FOLDER, module)).encode('ascii'))
+
+    return digest.hexdigest()
+
+def build_matrix(fight_df: pd.DataFrame, folder: str = MATRIX_FOLDER, own_stats_only: bool = False) -> str:
+    """
+    Computes the model features of every fight once, in date order, and saves
+    them as arrays for the folds to memory-map.
+
+    Args:
+        fight_df (pd.DataFrame): fight table
+        folder (str): folder to write the matrix to
+        own_stats_only (bool): see features.calculate_fighter_historical_averages
+
+    Returns:
+        str: the matrix folder
+    """
+    fingerprint = fight_fingerprint(fight_df, own_stats_only)
+    fight_df = sort_fights(fight_df)
+    final_df = add_additional_fighter_metrics(calculate_fighter_historical_averages(fight_df, STAT_COLUMNS, own_stats_only))
+
+    event_codes, events = pd.factorize(final_df['event'].astype(str))
+    os.makedirs(folder, exist_ok=True)
+    np.save(os.path.join(folder, 'X.npy'), final_df[FEATURE_COLUMNS].to_numpy(dtype=float, na_value=np.nan))
+    np.save(os.path.join(folder, 'y.npy'), (final_df['winner'] == final_df['f1']).to_numpy(dtype=np.int8))
+    np.save(os.path.join(folder, 'days.npy'), final_df['date'].to_numpy().astype('datetime64[D]').astype(np.int64))
+    np.save(os.path.join(folder, 'events.npy'), event_codes.astype(np.int32))
+    meta = {
+        'columns': FEATURE_COLUMNS,
+        'events': list(events),
+        'fingerprint': fingerprint,
+        'code': code_fingerprint(FEATURE_MODULES),
+    }
+    with open(os.path.join(folder, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+    return folder
+
+def load_matrix(folder: str = MATRIX_FOLDER) -> Dict[str, np.ndarray]:
+    """
+    Args:
+        folder (str): folder written by build_matrix
+
+    Returns:
+        Dict[str, np.ndarray]: memory-mapped X, y, days and events (event codes), and event_names
+    """
+    matrix = {name: np.load(os.path.join(folder, f'{name}.npy'), mmap_mode='r') for name in ('X', 'y', 'days', 'events')}
+    with open(os.path.join(folder, 'meta.json'), 'r') as f:
+        matrix['event_names'] = np.asarray(json.load(f)['events'], dtype=object)
+
+    return matrix
+
+def ensure_matrix(fight_df: pd.DataFrame, folder: str = MATRIX_FOLDER, own_stats_only: bool = False) -> str:
+    """
+    Args:
+        fight_df (pd.DataFrame): fight table
+        folder (str): matrix folder
+        own_stats_only (bool): see features.calculate_fighter_historical_averages
+
+    Returns:
+        str: the matrix folder, rebuilt only if it is missing or was built from different fights, feature
+             code or FEATURE_COLUMNS
+    """
+    meta_path = os.path.join(folder, 'meta.json')
+    if os.path.exists(meta_path):
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+        if (meta.get('fingerprint') == fight_fingerprint(fight_df, own_stats_only)
+                and meta.get('code') == code_fingerprint(FEATURE_MODULES)
+                and meta.get('columns') == FEATURE_COLUMNS):
+            return folder
+
+    return build_matrix(fight_df, folder, own_stats_only)
+
+
+## Folds ##
+def make_folds(matrix: Dict[str, np.ndarray], unit: str = 'year', min_train: int = MIN_TRAIN) -> List[Tuple[str, str, int, np.ndarray]]:
+    """
+    Args:
+        matrix (Dict[str, np.ndarray]): arrays from load_matrix
+        unit (str): 'year' or 'event', what each fold predicts
+        min_train (int): folds with fewer earlier fights to train on are skipped, as are folds before both
+                         outcomes have been seen (the early events list every winner as fighter 1)
+
+    Returns:
+        List[Tuple[str, str, int, np.ndarray]]: (year or event name, first date, number of training rows, rows
+                                                to predict) in date order. The rows are date-sorted, so a fold
+                                                trains on the prefix of fights before its first day
+    """
+    days = np.asarray(matrix['days'])
+    y = np.asarray(matrix['y'])
+    both_outcomes = int(np.argmax(y != y[0])) + 1 if np.any(y != y[0]) else len(y) + 1
+    if unit == 'year':
+        keys = days.astype('datetime64[D]').astype('datetime64[Y]').astype(np.int64)
+    elif unit == 'event':
+        keys = np.asarray(matrix['events'])
+    else:
+        raise ValueError(f"unit must be 'year' or 'event', not {unit!r}")
+
+    order = np.argsort(keys, kind='stable')
+    boundaries = np.flatnonzero(np.diff(keys[order])) + 1
+    folds = []
+    for rows in np.split(order, boundaries):
+        start = days[rows].min()
+        first_day = start.astype('datetime64[D]')
+        n_train = int(np.searchsorted(days, start, side='left'))
+        if n_train < max(min_train, both_outcomes):
+            continue
+        if unit == 'year':
+            label = str(first_day.astype('datetime64[Y]'))
+        else:
+            label = matrix['event_names'][keys[rows[0]]]
+        folds.append((label, str(first_day), n_train, rows))
+
+    folds.sort(key=lambda fold: fold[1])
+    return folds
+
+def evaluate(y: np.ndarray, p: np.ndarray, bins: int = CALIBRATION_BINS) -> Dict[str, float]:
+    """
+    Args:
+        y (np.ndarray): 1 if fighter 1 won, 0 otherwise
+        p (np.ndarray): predicted probability that fighter 1 wins
+        bins (int): number of equal-width probability bins of the calibration error
+
+    Returns:
+        Dict[str, float]: accuracy, log_loss, brier, mean_p, win_rate and ece, the expected calibration error
+    """
+    y = np.asarray(y, dtype=float)
+    clipped = np.clip(p, 1e-15, 1 - 1e-15)
+    bin_codes = np.minimum((p * bins).astype(int), bins - 1)
+    counts = np.bincount(bin_codes, minlength=bins)
+    gaps = np.abs(np.bincount(bin_codes, weights=p - y, minlength=bins))
+
+    return {
+        'accuracy': float(np.mean((p >= 0.5) == (y == 1))),
+        'log_loss': float(-np.mean(y * np.log(clipped) + (1 - y) * np.log(1 - clipped))),
+        'brier': float(np.mean((p - y) ** 2)),
+        'mean_p': float(np.mean(p)),
+        'win_rate': float(np.mean(y)),
+        'ece': float(np.sum(gaps[counts > 0]) / len(y)),
+    }
+
+
+## Workers ##
+_matrix: Optional[Dict[str, np.ndarray]] = None
+
+def _init_worker(folder: str) -> None:
+    global _matrix
+    _matrix = load_matrix(folder)
+
+def _run_fold(fold: Tuple[str, str, int, np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    _, _, n_train, rows = fold
+    X, y = _matrix['X'], _matrix['y']
+    model = LogisticModel(FEATURE_COLUMNS).fit(X[:n_train], y[:n_train])
+    return rows, model.predict_proba(X[rows])
+
+
+def backtest(folder: str = MATRIX_FOLDER, unit: str = 'year', min_train: int = MIN_TRAIN,
+             processes: Optional[int] = None) -> pd.DataFrame:
+    """
+    Walk-forward evaluation: every fold is predicted by a model trained only
+    on the fights before it. The folds run across worker processes that each
+    memory-map the same feature matrix.
+
+    Args:
+        folder (str): matrix folder written by build_matrix
+        unit (str): 'year' or 'event', what each fold predicts
+        min_train (int): folds with fewer earlier fights to train on are skipped
+        processes (Optional[int]): worker processes, one per CPU if not given
+
+    Returns:
+        pd.DataFrame: one row per fold indexed by year or event name with SUMMARY_COLUMNS, and an 'all' row
+                      scoring every predicted fight together
+    """
+    matrix = load_matrix(folder)
+    folds = make_folds(matrix, unit, min_train)
+    processes = processes or os.cpu_count() or 1
+
+    if processes > 1 and len(folds) > 1:
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(folder,)) as executor:
+            results = list(executor.map(_run_fold, folds, chunksize=max(1, len(folds) // (4 * processes))))
+    else:
+        _init_worker(folder)
+        results = [_run_fold(fold) for fold in folds]
+
+    y = np.asarray(matrix['y'])
+    summary = {}
+    for (label, start, n_train, rows), (_, p) in zip(folds, results):
+        summary[label] = {'start': start, 'n_train': n_train, 'n_test': len(rows), **evaluate(y[rows], p)}
+    if results:
+        rows = np.concatenate([rows for rows, _ in results])
+        p = np.concatenate([p for _, p in results])
+        summary['all'] = {'start': folds[0][1], 'n_train': folds[0][2], 'n_test': len(rows), **evaluate(y[rows], p)}
+
+    return pd.DataFrame.from_dict(summary, orient='index', columns=SUMMARY_COLUMNS)
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+    from loader import load_fight_df
+    from instrument import add_profile_arguments, profiling
+
+    parser = argparse.ArgumentParser(description='Walk-forward backtest of the logistic regression')
+    parser.add_argument('--unit', choices=['year', 'event'], default='year', help='what each fold predicts')
+    parser.add_argument('--min-train', type=int, default=MIN_TRAIN, help='skip folds with fewer earlier fights')
+    parser.add_argument('--processes', type=int, default=None, help='worker processes, one per CPU by default')
+    parser.add_argument('--folder', default=MATRIX_FOLDER, help='feature matrix folder')
+    parser.add_argument('--own-stats-only', action='store_true', help='see features.calculate_fighter_historical_averages')
+    parser.add_argument('--out', default=None, help='also write the summary to this CSV')
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    with profiling(args.profile, args.cprofile):
+        ensure_matrix(load_fight_df(), args.folder, args.own_stats_only)
+        start = time.perf_counter()
+        summary_df = backtest(args.folder, args.unit, args.min_train, args.processes)
+        elapsed = time.perf_counter() - start
+        with pd.option_context('display.max_rows', None, 'display.float_format', '{:.3f}'.format):
+            print(summary_df)
+        print(f'{len(summary_df) - 1} folds in {elapsed:.2f}s')
+        if args.out:
+            summary_df.to_csv(args.out, index_label='fold')
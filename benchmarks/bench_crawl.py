@@ -0,0 +1,53 @@
+import time
+from typing import Optional
+import fetcher
+import scraper
+from benchmarks.stub_server import StubServer
+from throttle import RateLimiter
+
+EVENT_PATH = 'event-details/a6a9ab5a824e8f66'
+
+def run_crawl_benchmark(latency: float = 0.05, jitter: float = 0.0, error_rate: float = 0.0, copies: int = 10,
+                        workers: int = fetcher.MAX_CONNECTIONS, rate: Optional[float] = None,
+                        seed: Optional[int] = 0) -> dict:
+    """
+    Scrapes one event end to end with get_event_data against a local stub server.
+
+    Args:
+        latency (float): seconds each stub response is delayed by
+        jitter (float): extra random delay of up to this many seconds
+        error_rate (float): fraction of stub requests answered with an error
+        copies (int): number of times each fight of the event is repeated
+        workers (int): concurrency limit of the fetcher
+        rate (Optional[float]): initial requests per second of the adaptive rate limiter, None for no limit
+        seed (Optional[int]): seed of the stub's error and jitter randomness
+
+    Returns:
+        dict: pages fetched, seconds, pages per second and the error if the scrape failed
+    """
+    cache = fetcher.get_cache()
+    limiter = fetcher.get_rate_limiter()
+    fetcher.set_cache(None)
+    fetcher.set_rate_limiter(RateLimiter(rate=rate, capacity=rate) if rate else None)
+    fetcher.configure(workers)
+    try:
+        with StubServer(latency=latency, jitter=jitter, error_rate=error_rate, copies=copies, seed=seed) as stub:
+            error = None
+            start = time.perf_counter()
+            try:
+                scraper.get_event_data(stub.url + EVENT_PATH)
+            except Exception as e:
+                error = f'{type(e).__name__}: {e}'
+            seconds = time.perf_counter() - start
+
+            return {
+                'pages': stub.requests,
+                'injected_errors': stub.errors,
+                'bytes': stub.bytes_sent,
+                'seconds': seconds,
+                'pages_per_sec': stub.requests / seconds if seconds else 0.0,
+                'error': error,
+            }
+    finally:
+        fetcher.set_cache(cache)
+        fetcher.set_rate_limiter(limiter)
@@ -0,0 +1,80 @@
+import os
+import timeit
+from typing import Callable, Dict, List, Tuple
+from bs4 import BeautifulSoup
+import scraper
+from benchmarks.stub_server import FIXTURES_FOLDER
+
+## Fixtures ##
+def load_pages(kind: str) -> List[str]:
+    """
+    Args:
+        kind (str): fixture folder, e.g. 'fight-details', 'event-details', 'statistics/events'
+
+    Returns:
+        List[str]: saved pages of that kind
+    """
+    folder = os.path.join(FIXTURES_FOLDER, kind)
+    pages = []
+    for filename in sorted(os.listdir(folder)):
+        if filename.endswith('.html'):
+            with open(os.path.join(folder, filename), 'r') as f:
+                pages.append(f.read())
+    return pages
+
+## Benchmarks ##
+# (name, fixture kind, takes soup (True) or HTML (False), function)
+BENCHMARKS: List[Tuple[str, str, bool, Callable]] = [
+    ('BeautifulSoup[html.parser]', 'fight-details', False, lambda html: BeautifulSoup(html, 'html.parser')),
+    ('get_fighters', 'fight-details', True, scraper.get_fighters),
+    ('get_winner', 'fight-details', True, scraper.get_winner),
+    ('get_method', 'fight-details', True, scraper.get_method),
+    ('get_time_end', 'fight-details', True, scraper.get_time_end),
+    ('get_round_end', 'fight-details', True, scraper.get_round_end),
+    ('get_score', 'fight-details', True, scraper.get_score),
+    ('get_fighter_fight_stats', 'fight-details', True, scraper.get_fighter_fight_stats),
+    ('get_fight_data_from_soup', 'fight-details', True, scraper.get_fight_data_from_soup),
+    ('parse_fight_page[html.parser]', 'fight-details', False, lambda html: scraper.parse_fight_page(html, 'html.parser')),
+    (f'parse_fight_page[{scraper.PARSER}]', 'fight-details', False, scraper.parse_fight_page),
+    ('get_event_name', 'event-details', True, scraper.get_event_name),
+    ('get_event_date', 'event-details', True, scraper.get_event_date),
+    ('parse_fight_urls', 'event-details', True, scraper.parse_fight_urls),
+    ('parse_event_urls', 'statistics/events', True, scraper.parse_event_urls),
+    ('parse_event_listing', 'statistics/events', True, scraper.parse_event_listing),
+]
+
+def time_call(func: Callable, arg, repeat: int, round_seconds: float = 0.05) -> float:
+    """
+    Args:
+        func (Callable): function to time
+        arg: argument func is called with
+        repeat (int): number of timing rounds, the best one is kept
+        round_seconds (float): approximate length of one timing round
+
+    Returns:
+        float: microseconds per call
+    """
+    timer = timeit.Timer(lambda: func(arg))
+    once = timer.timeit(number=1)
+    number = max(1, int(round_seconds / once)) if once else 1000
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e6
+
+def run_parse_benchmarks(repeat: int = 5) -> Dict[str, float]:
+    """
+    Args:
+        repeat (int): number of timing rounds per function
+
+    Returns:
+        Dict[str, float]: benchmark name -> mean microseconds per page over the fixtures
+    """
+    pages = {}
+    soups = {}
+    results = {}
+    for name, kind, takes_soup, func in BENCHMARKS:
+        if kind not in pages:
+            pages[kind] = load_pages(kind)
+            soups[kind] = [BeautifulSoup(html, 'html.parser') for html in pages[kind]]
+        args = soups[kind] if takes_soup else pages[kind]
+        results[name] = sum(time_call(func, arg, repeat) for arg in args) / len(args)
+
+    return results
@@ -0,0 +1,95 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+from typing import Optional
+import scraper
+from benchmarks.bench_crawl import run_crawl_benchmark
+from benchmarks.bench_parse import run_parse_benchmarks
+
+RESULTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results.jsonl')
+
+def git_revision() -> Optional[str]:
+    try:
+        output = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True)
+        return output.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def load_previous(path: str, config: dict) -> Optional[dict]:
+    """
+    Args:
+        path (str): results file
+        config (dict): configuration of the current run
+
+    Returns:
+        Optional[dict]: most recent earlier run with the same configuration
+    """
+    if not os.path.exists(path):
+        return None
+    previous = None
+    with open(path, 'r') as f:
+        for line in f:
+            record = json.loads(line)
+            if record.get('config') == config:
+                previous = record
+    return previous
+
+def change(current: float, before: Optional[float]) -> str:
+    if not before:
+        return ''
+    return f'{100 * (current - before) / before:+.1f}%'
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark the scraper against saved pages and a local stub server')
+    parser.add_argument('--repeat', type=int, default=5, help='timing rounds per parse function')
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds each stub response is delayed by')
+    parser.add_argument('--jitter', type=float, default=0.0, help='extra random stub delay in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of stub requests that fail')
+    parser.add_argument('--copies', type=int, default=10, help='times each fixture fight is repeated on the card')
+    parser.add_argument('--workers', type=int, default=16, help='concurrency limit of the fetcher')
+    parser.add_argument('--rate', type=float, default=None, help='initial requests/sec of the adaptive rate limiter')
+    parser.add_argument('--no-parse', action='store_true', help='skip the parse micro-benchmarks')
+    parser.add_argument('--no-crawl', action='store_true', help='skip the end-to-end benchmark')
+    parser.add_argument('--results', default=RESULTS_PATH, help='JSON lines file runs are appended to')
+    args = parser.parse_args()
+
+    config = {
+        'repeat': args.repeat, 'latency': args.latency, 'jitter': args.jitter, 'error_rate': args.error_rate,
+        'copies': args.copies, 'workers': args.workers, 'rate': args.rate, 'parse': not args.no_parse, 'crawl': not args.no_crawl,
+    }
+    record = {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'parser': scraper.PARSER,
+        'config': config,
+    }
+    previous = load_previous(args.results, config)
+
+    if not args.no_parse:
+        record['parse_us'] = run_parse_benchmarks(args.repeat)
+        before = (previous or {}).get('parse_us', {})
+        print(f'{"function":<36}{"us/page":>12}{"change":>10}')
+        for name, us in record['parse_us'].items():
+            print(f'{name:<36}{us:>12.1f}{change(us, before.get(name)):>10}')
+
+    if not args.no_crawl:
+        record['crawl'] = run_crawl_benchmark(args.latency, args.jitter, args.error_rate, args.copies, args.workers,
+                                              args.rate)
+        crawl = record['crawl']
+        before = (previous or {}).get('crawl', {}).get('pages_per_sec')
+        print()
+        print(f'get_event_data: {crawl["pages"]} pages in {crawl["seconds"]:.2f}s, '
+              f'{crawl["pages_per_sec"]:.1f} pages/sec {change(crawl["pages_per_sec"], before)}')
+        if crawl['error']:
+            print(f'failed: {crawl["error"]}')
+
+    with open(args.results, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+
+
+if __name__ == '__main__':
+    main()
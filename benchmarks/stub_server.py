@@ -0,0 +1,149 @@
+import hashlib
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+FIXTURES_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+SITE_URL = 'http://ufcstats.com/'
+
+FIGHT_ROW = re.compile(r'<tr class="b-fight-details__table-row b-fight-details__table-row__hover.*?</tr>', re.DOTALL)
+FIGHT_LINK = re.compile(r'(fight-details/[0-9a-f]+)')
+
+
+class StubServer:
+    """
+    Local stand-in for ufcstats.com serving the saved pages in fixtures/, with
+    configurable latency and error injection. Links in the served pages point
+    back at the stub. Pages carry an ETag, and a request whose If-None-Match
+    matches it is answered 304 Not Modified.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 error_status: int = 503, copies: int = 1, seed: Optional[int] = 0,
+                 folder: str = FIXTURES_FOLDER, port: int = 0):
+        """
+        Args:
+            latency (float): seconds each response is delayed by
+            jitter (float): extra random delay of up to this many seconds
+            error_rate (float): fraction of requests answered with error_status
+            error_status (int): status code of injected errors
+            copies (int): number of times each fight of an event page is repeated, to make bigger cards
+            seed (Optional[int]): seed of the error and jitter randomness
+            folder (str): folder of the saved pages
+            port (int): port to listen on, 0 for any free port
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.copies = copies
+        self.folder = folder
+        self.requests = 0
+        self.errors = 0
+        self.not_modified = 0
+        self.bytes_sent = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/'
+
+    def start(self) -> 'StubServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> 'StubServer':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def page(self, path: str) -> Optional[str]:
+        """
+        Args:
+            path (str): URL path, e.g. '/fight-details/6b7b9f0c8e3d1a25'
+
+        Returns:
+            Optional[str]: page served for path, None if there is no fixture for it
+        """
+        path = path.split('?', 1)[0].strip('/')
+        file_path = os.path.join(self.folder, path + '.html')
+        if not os.path.exists(file_path) and path.startswith('fight-details/'):
+            # Copies of a fight made for bigger cards, fight-details/<id>-<n>
+            file_path = os.path.join(self.folder, path.rsplit('-', 1)[0] + '.html')
+        if not os.path.exists(file_path):
+            return None
+
+        with open(file_path, 'r') as f:
+            html = f.read()
+        if path.startswith('event-details/') and self.copies > 1:
+            html = FIGHT_ROW.sub(self._repeat_fight_row, html)
+
+        return html.replace(SITE_URL, self.url)
+
+    def _repeat_fight_row(self, match: re.Match) -> str:
+        row = match.group(0)
+        return ''.join(FIGHT_LINK.sub(rf'\1-{n}', row) for n in range(self.copies))
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                with stub._lock:
+                    stub.requests += 1
+                    fail = stub._random.random() < stub.error_rate
+                    delay = stub.latency + stub._random.random() * stub.jitter
+                if delay:
+                    time.sleep(delay)
+
+                if fail:
+                    with stub._lock:
+                        stub.errors += 1
+                    self._reply(stub.error_status, 'Service Unavailable')
+                    return
+
+                html = stub.page(self.path)
+                if html is None:
+                    self._reply(404, 'Not Found')
+                    return
+                etag = '"' + hashlib.sha1(html.encode('utf-8')).hexdigest()[:16] + '"'
+                if self.headers.get('If-None-Match') == etag:
+                    with stub._lock:
+                        stub.not_modified += 1
+                    self._reply(304, '', etag)
+                else:
+                    self._reply(200, html, etag)
+
+            def _reply(self, status: int, body: str, etag: Optional[str] = None):
+                data = body.encode('utf-8')
+                self.send_response(status)
+                if etag is not None:
+                    self.send_header('ETag', etag)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+                with stub._lock:
+                    stub.bytes_sent += len(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
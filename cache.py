@@ -0,0 +1,209 @@
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+import zlib
+from typing import List, Optional, Tuple
+
+CACHE_DIR = '.http_cache'
+MAX_BYTES = 512 * 1024 * 1024
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+
+# (URL fragment, seconds a cached page stays fresh); None never expires.
+# The first matching fragment wins.
+DEFAULT_TTLS = [
+    ('/fight-details/', None),
+    ('/fighter-details/', 30 * DAY),
+    ('/event-details/', DAY),
+    ('/statistics/events/', HOUR),
+]
+DEFAULT_TTL = DAY
+
+
+class CacheMiss(Exception):
+    """Raised in offline mode when a URL is not in the cache."""
+
+
+class ResponseCache:
+    """
+    Compressed on-disk cache of page bodies keyed by URL, with a per-resource
+    TTL and least-recently-used eviction once the cache grows past max_bytes.
+    """
+
+    def __init__(self, path: str = CACHE_DIR, max_bytes: int = MAX_BYTES,
+                 ttls: Optional[List[Tuple[str, Optional[int]]]] = None,
+                 default_ttl: Optional[int] = DEFAULT_TTL, offline: bool = False):
+        """
+        Args:
+            path (str): folder the cache is stored in
+            max_bytes (int): size of the cache on disk above which old entries are evicted
+            ttls (Optional[List[Tuple[str, Optional[int]]]]): (URL fragment, TTL in seconds) rules
+            default_ttl (Optional[int]): TTL of URLs that match no rule
+            offline (bool): serve only from the cache, never from the network
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttls = DEFAULT_TTLS if ttls is None else ttls
+        self.default_ttl = default_ttl
+        self.offline = offline
+        # Entries read past their TTL, which are then revalidated or served offline, are not hits
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._size = None
+        os.makedirs(path, exist_ok=True)
+
+    def ttl_for(self, url: str) -> Optional[int]:
+        """
+        Args:
+            url (str): URL of page
+
+        Returns:
+            Optional[int]: seconds a cached copy of the page stays fresh, None if forever
+        """
+        for fragment, ttl in self.ttls:
+            if fragment in url:
+                return ttl
+        return self.default_ttl
+
+    def get(self, url: str) -> Optional[dict]:
+        """
+        Args:
+            url (str): URL of page
+
+        Returns:
+            Optional[dict]: cached entry {'url', 'fetched_at', 'etag', 'last_modified', 'body'}, None if not cached
+        """
+        file_path = self._file_path(url)
+        try:
+            with open(file_path, 'rb') as f:
+                entry = json.loads(zlib.decompress(f.read()))
+        except (FileNotFoundError, zlib.error, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        # Reads refresh the access time used for eviction
+        os.utime(file_path)
+        within_ttl = self.within_ttl(entry)
+        with self._lock:
+            if within_ttl:
+                self.hits += 1
+            else:
+                self.stale_hits += 1
+        return entry
+
+    def within_ttl(self, entry: dict) -> bool:
+        """
+        Args:
+            entry (dict): cached entry
+
+        Returns:
+            bool: whether the entry is younger than its URL's TTL
+        """
+        ttl = self.ttl_for(entry['url'])
+        return ttl is None or time.time() - entry['fetched_at'] < ttl
+
+    def is_fresh(self, entry: dict) -> bool:
+        """
+        Args:
+            entry (dict): cached entry
+
+        Returns:
+            bool: whether the entry can be served without asking the server
+        """
+        return self.offline or self.within_ttl(entry)
+
+    def put(self, url: str, body: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> dict:
+        """
+        Args:
+            url (str): URL of page
+            body (str): body of the page
+            etag (Optional[str]): ETag header of the response
+            last_modified (Optional[str]): Last-Modified header of the response
+
+        Returns:
+            dict: the stored entry
+        """
+        entry = {
+            'url': url,
+            'fetched_at': time.time(),
+            'etag': etag,
+            'last_modified': last_modified,
+            'body': body,
+        }
+        data = zlib.compress(json.dumps(entry).encode('utf-8'))
+        file_path = self._file_path(url)
+        # Unique per writer, as crawl processes and hosts sharing the cache folder can store the same page at once
+        tmp_path = f'{file_path}.{socket.gethostname()}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+
+        with self._lock:
+            old_size = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+            os.replace(tmp_path, file_path)
+            if self._size is not None:
+                self._size += len(data) - old_size
+        self.evict()
+
+        return entry
+
+    def touch(self, entry: dict) -> None:
+        """
+        Marks an entry as fetched now, after the server confirmed it is unchanged.
+
+        Args:
+            entry (dict): cached entry
+        """
+        self.put(entry['url'], entry['body'], entry.get('etag'), entry.get('last_modified'))
+
+    def evict(self) -> int:
+        """
+        Removes least recently used entries until the cache fits in max_bytes.
+
+        Returns:
+            int: number of entries removed
+        """
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, _, size in self._scan())
+            if self._size <= self.max_bytes:
+                return 0
+
+            removed = 0
+            for file_path, _, size in sorted(self._scan(), key=lambda item: item[1]):
+                if self._size <= self.max_bytes:
+                    break
+                try:
+                    os.remove(file_path)
+                except FileNotFoundError:
+                    continue
+                self._size -= size
+                removed += 1
+
+            return removed
+
+    def clear(self) -> None:
+        """Removes every entry from the cache."""
+        with self._lock:
+            for file_path, _, _ in self._scan():
+                os.remove(file_path)
+            self._size = 0
+
+    def _scan(self) -> List[Tuple[str, float, int]]:
+        entries = []
+        for filename in os.listdir(self.path):
+            if filename.endswith('.z'):
+                file_path = os.path.join(self.path, filename)
+                stat = os.stat(file_path)
+                entries.append((file_path, stat.st_mtime, stat.st_size))
+        return entries
+
+    def _file_path(self, url: str) -> str:
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.path, key + '.z')
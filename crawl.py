@@ -0,0 +1,453 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+import requests
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from bs4 import BeautifulSoup
+from cache import CACHE_DIR, CacheMiss, ResponseCache
+from fetcher import configure, fetch, fetch_response, map_concurrent, set_cache, set_rate_limiter
+from instrument import add_profile_arguments, count, profiling
+from jobqueue import LEASE_SECONDS, QUEUE_PATH, Job, JobQueue
+from profiles import PROFILES_PATH, ProfileStore, event_fighter_ids
+from scraper import PARSER, get_event_data, get_event_date, get_event_listing, get_event_name, get_fight_data, parse_fight_urls
+from throttle import RateLimiter
+
+EVENTS_URL = 'http://ufcstats.com/statistics/events/completed?page=all'
+EVENTS_FOLDER = 'events'
+MANIFEST_PATH = 'crawl_manifest.json'
+
+# Kinds of queued jobs, with the priority they are claimed in: events that are
+# under way are finished before new ones are started.
+SAVE, FIGHT, EVENT, LISTING = 'save', 'fight', 'event', 'listing'
+PRIORITIES = {SAVE: 0, FIGHT: 1, EVENT: 2, LISTING: 3}
+IDLE_POLL = 1.0
+
+# Errors of parsing a page whose layout the scraper does not expect
+PARSE_ERRORS = (AttributeError, IndexError, KeyError, TypeError, ValueError)
+
+## Files ##
+def event_filename(name: str) -> str:
+    """
+    Args:
+        name (str): name of event, e.g. 'UFC 10: The Tournament'
+
+    Returns:
+        str: name of the JSON file the event is stored in, e.g. 'UFC-10-The-Tournament.json'
+    """
+    return name.replace(':', '').replace('.', '').replace(' ', '-') + '.json'
+
+def save_event(event_data: dict, folder: str = EVENTS_FOLDER) -> str:
+    """
+    Args:
+        event_data (dict): event data as returned by get_event_data
+        folder (str): folder the event files are stored in
+
+    Returns:
+        str: path of the written file
+    """
+    path = os.path.join(folder, event_filename(event_data['event']))
+    with open(path, 'w') as f:
+        json.dump(event_data, f, indent=4)
+
+    return path
+
+def load_manifest(path: str = MANIFEST_PATH) -> Dict[str, dict]:
+    """
+    Args:
+        path (str): path of the crawl manifest
+
+    Returns:
+        Dict[str, dict]: event URL -> {'file', 'etag', 'last_modified', 'fingerprint'}
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def save_manifest(manifest: Dict[str, dict], path: str = MANIFEST_PATH) -> None:
+    """
+    Args:
+        manifest (Dict[str, dict]): event URL -> crawl metadata
+        path (str): path of the crawl manifest
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=4, sort_keys=True)
+    os.replace(tmp_path, path)
+
+## Change Detection ##
+def get_event_fingerprint(soup: BeautifulSoup) -> str:
+    """
+    Args:
+        soup (BeautifulSoup): nested data structure that represents an event page
+
+    Returns:
+        str: hash of the event header and fight table, ignoring the rest of the page
+    """
+    parts = []
+    for element in soup.find_all(['span', 'li', 'tbody'], class_=['b-content__title-highlight',
+                                                                   'b-list__box-list-item',
+                                                                   'b-fight-details__table-body']):
+        parts.append(element.get_text(' ', strip=True))
+    for element in soup.find_all('a', class_='b-flag'):
+        parts.append(element.get('href', ''))
+
+    return hashlib.sha1('\n'.join(parts).encode('utf-8')).hexdigest()
+
+def check_event(url: str, entry: Optional[dict]) -> Tuple[bool, Optional[str], dict]:
+    """
+    Revalidates an event page with a conditional request when validators from a
+    previous crawl are known, falling back to comparing page fingerprints.
+
+    Args:
+        url (str): URL of event
+        entry (Optional[dict]): manifest entry from the previous crawl, None if never crawled
+
+    Returns:
+        Tuple[bool, Optional[str], dict]: (changed, page body or None if not modified, new manifest entry)
+    """
+    entry = dict(entry or {})
+    headers = {}
+    if entry.get('etag'):
+        headers['If-None-Match'] = entry['etag']
+    if entry.get('last_modified'):
+        headers['If-Modified-Since'] = entry['last_modified']
+
+    response = fetch_response(url, headers=headers)
+    if response.status_code == 304:
+        return False, None, entry
+
+    html = response.text
+    fingerprint = get_event_fingerprint(BeautifulSoup(html, PARSER))
+    changed = entry.get('fingerprint') != fingerprint
+    entry['etag'] = response.headers.get('ETag')
+    entry['last_modified'] = response.headers.get('Last-Modified')
+    entry['fingerprint'] = fingerprint
+
+    return changed, html, entry
+
+## Crawl ##
+def crawl(listing_url: str = EVENTS_URL, folder: str = EVENTS_FOLDER, manifest_path: str = MANIFEST_PATH,
+          incremental: bool = True, revalidate: bool = True,
+          max_workers: Optional[int] = None) -> Tuple[List[str], Dict[str, str]]:
+    """
+    Scrapes events from the listing and writes one JSON file per event. In
+    incremental mode only events missing from folder are scraped, plus (with
+    revalidate) events whose page changed since the previous crawl.
+
+    Args:
+        listing_url (str): URL containing links to events
+        folder (str): folder the event files are stored in
+        manifest_path (str): path of the crawl manifest
+        incremental (bool): skip events already in folder
+        revalidate (bool): re-check already scraped events and re-scrape the changed ones
+        max_workers (Optional[int]): number of events processed at once
+
+    Returns:
+        Tuple[List[str], Dict[str, str]]: paths of the written event files, and the error of each event
+                                          that could not be fetched or parsed, which the next crawl retries
+    """
+    os.makedirs(folder, exist_ok=True)
+    manifest = load_manifest(manifest_path)
+    on_disk = set(os.listdir(folder))
+
+    new_urls = []
+    known_urls = []
+    for event_url, name in get_event_listing(listing_url):
+        filename = event_filename(name)
+        if incremental and filename in on_disk:
+            manifest.setdefault(event_url, {})['file'] = filename
+            if revalidate:
+                known_urls.append(event_url)
+        else:
+            new_urls.append(event_url)
+
+    known_url_set = set(known_urls)
+    failed = {}
+
+    def visit(event_url: str) -> Optional[str]:
+        is_new = event_url not in known_url_set
+        first_check = not manifest.get(event_url, {}).get('fingerprint')
+        try:
+            changed, html, entry = check_event(event_url, manifest.get(event_url))
+            # Events already on disk from before the manifest existed are assumed
+            # current, their first check only records a fingerprint.
+            if not is_new and (not changed or first_check):
+                manifest[event_url] = entry
+                return None
+
+            event_data = get_event_data(event_url, html)
+        except (requests.RequestException, CacheMiss, *PARSE_ERRORS) as e:
+            # Left out of the manifest so the next crawl retries it
+            count('crawl.failed_events')
+            failed[event_url] = f'{type(e).__name__}: {e}'
+            return None
+
+        manifest[event_url] = entry
+        if len(event_data) <= 2:
+            # Upcoming or cancelled event without completed fights
+            return None
+        path = save_event(event_data, folder)
+        entry['file'] = os.path.basename(path)
+        return path
+
+    written = map_concurrent(visit, new_urls + known_urls, max_workers)
+    save_manifest(manifest, manifest_path)
+
+    return [path for path in written if path is not None], failed
+
+## Queued Crawl ##
+def configure_fetcher(workers: Optional[int] = None, rate: Optional[float] = None, cache_dir: Optional[str] = CACHE_DIR,
+                      offline: bool = False) -> None:
+    """
+    Args:
+        workers (Optional[int]): maximum number of requests in flight
+        rate (Optional[float]): initial requests per second per host
+        cache_dir (Optional[str]): folder of the on-disk response cache, None to always fetch from the network
+        offline (bool): serve pages only from the cache
+    """
+    if workers:
+        configure(workers)
+    if rate:
+        set_rate_limiter(RateLimiter(rate=rate))
+    if cache_dir:
+        set_cache(ResponseCache(cache_dir, offline=offline))
+
+def seed_queue(queue: JobQueue, listing_url: str = EVENTS_URL, full: bool = False, relist: bool = False) -> None:
+    """
+    Args:
+        queue (JobQueue): crawl queue
+        listing_url (str): URL containing links to events
+        full (bool): drop every queued job and crawl from scratch
+        relist (bool): read the listing again to pick up new events, keeping the jobs already done
+    """
+    if full:
+        queue.clear()
+    # Jobs that failed in an earlier run get a new set of attempts
+    queue.retry_failed()
+    if queue.add(LISTING, [listing_url], priority=PRIORITIES[LISTING]) == 0 and relist:
+        queue.requeue(LISTING, listing_url)
+
+def run_job(queue: JobQueue, job: Job, folder: str = EVENTS_FOLDER, incremental: bool = True):
+    """
+    Runs one job. A listing queues its events, an event queues its fights and
+    stores its header, a fight stores its data, and a save job writes the
+    event file from the stored results once all of its fights are done.
+
+    Args:
+        queue (JobQueue): crawl queue
+        job (Job): claimed job
+        folder (str): folder the event files are stored in
+        incremental (bool): only queue events missing from folder
+
+    Returns:
+        result stored with the job
+    """
+    if job.kind == LISTING:
+        on_disk = set(os.listdir(folder))
+        event_urls = [event_url for event_url, name in get_event_listing(job.url)
+                      if not (incremental and event_filename(name) in on_disk)]
+        queue.add(EVENT, event_urls, parent=job.url, priority=PRIORITIES[EVENT])
+        return {'events': len(event_urls)}
+
+    if job.kind == EVENT:
+        soup = BeautifulSoup(fetch(job.url), PARSER)
+        fight_urls = parse_fight_urls(soup)
+        queue.add(FIGHT, fight_urls, parent=job.url, priority=PRIORITIES[FIGHT])
+        return {'event': get_event_name(soup), 'date': get_event_date(soup), 'fights': len(fight_urls)}
+
+    if job.kind == FIGHT:
+        return get_fight_data(job.url)
+
+    if job.kind == SAVE:
+        header = queue.result(EVENT, job.url)
+        event_data = {'event': header['event'], 'date': header['date']}
+        for fight_data in queue.results(FIGHT, job.url):
+            event_data[fight_data['name']] = fight_data
+        return {'file': os.path.basename(save_event(event_data, folder))}
+
+    raise ValueError(f'unknown job kind {job.kind!r}')
+
+def queue_save(queue: JobQueue, event_url: str) -> None:
+    """
+    Queues writing the event file once the event and all of its fights are
+    done. Whichever worker finishes last queues it, and only once.
+
+    Args:
+        queue (JobQueue): crawl queue
+        event_url (str): URL of event
+    """
+    header = queue.result(EVENT, event_url)
+    if header and header['fights'] and queue.remaining(FIGHT, event_url) == 0:
+        queue.add(SAVE, [event_url], priority=PRIORITIES[SAVE])
+
+def drain_queue(queue_path: str = QUEUE_PATH, folder: str = EVENTS_FOLDER, incremental: bool = True,
+                lease: float = LEASE_SECONDS, journal_mode: str = 'WAL') -> int:
+    """
+    Claims and runs jobs until the queue has none pending or in progress.
+
+    Args:
+        queue_path (str): path of the queue file
+        folder (str): folder the event files are stored in
+        incremental (bool): only queue events missing from folder
+        lease (float): seconds a claimed job stays reserved for this worker
+        journal_mode (str): see JobQueue
+
+    Returns:
+        int: number of jobs this worker completed
+    """
+    queue = JobQueue(queue_path, lease, journal_mode=journal_mode)
+    completed = 0
+    try:
+        while True:
+            job = queue.claim()
+            if job is None:
+                if queue.is_drained():
+                    break
+                # Other workers are still busy and may queue more jobs
+                time.sleep(IDLE_POLL)
+                continue
+
+            try:
+                result = run_job(queue, job, folder, incremental)
+            except Exception as e:
+                # Recorded in the queue, retried until its attempts run out
+                queue.fail(job, f'{type(e).__name__}: {e}')
+                count(f'crawl_queue.failed_{job.kind}_jobs')
+                continue
+
+            if queue.complete(job, result):
+                completed += 1
+                if job.kind == EVENT:
+                    queue_save(queue, job.url)
+                elif job.kind == FIGHT:
+                    queue_save(queue, job.parent)
+    finally:
+        queue.close()
+
+    return completed
+
+def run_queue_worker(queue_path: str, folder: str, incremental: bool, threads: int, fetcher_settings: dict,
+                     journal_mode: str = 'WAL') -> int:
+    """
+    Entry point of a worker process: threads draining the same queue.
+
+    Args:
+        queue_path (str): path of the queue file
+        folder (str): folder the event files are stored in
+        incremental (bool): only queue events missing from folder
+        threads (int): threads claiming jobs in this process
+        fetcher_settings (dict): arguments of configure_fetcher
+        journal_mode (str): see JobQueue
+
+    Returns:
+        int: number of jobs the process completed
+    """
+    configure_fetcher(**fetcher_settings)
+    drain = lambda _: drain_queue(queue_path, folder, incremental, journal_mode=journal_mode)
+    return sum(map_concurrent(drain, range(threads), threads))
+
+def crawl_queue(queue_path: str = QUEUE_PATH, listing_url: str = EVENTS_URL, folder: str = EVENTS_FOLDER,
+                incremental: bool = True, full: bool = False, relist: bool = True, processes: int = 1, threads: int = 8,
+                fetcher_settings: Optional[dict] = None,
+                journal_mode: str = 'WAL') -> Tuple[Dict[str, Dict[str, int]], List[Tuple[str, str, str]]]:
+    """
+    Crawls through the job queue. Every fight is stored in the queue as soon
+    as it is scraped, so an interrupted crawl loses at most the jobs that were
+    in flight, and running this again (on this or another host sharing the
+    queue file) resumes it.
+
+    Args:
+        queue_path (str): path of the queue file
+        listing_url (str): URL containing links to events
+        folder (str): folder the event files are stored in
+        incremental (bool): only queue events missing from folder
+        full (bool): drop every queued job and crawl from scratch
+        relist (bool): read the listing again to pick up new events
+        processes (int): worker processes
+        threads (int): threads claiming jobs in each process
+        fetcher_settings (Optional[dict]): arguments of configure_fetcher for the worker processes
+        journal_mode (str): see JobQueue
+
+    Returns:
+        Tuple[Dict[str, Dict[str, int]], List[Tuple[str, str, str]]]: job counts by kind and state after the
+            crawl, and the (kind, url, error) of the jobs that ran out of attempts
+    """
+    os.makedirs(folder, exist_ok=True)
+    queue = JobQueue(queue_path, journal_mode=journal_mode)
+    seed_queue(queue, listing_url, full, relist)
+
+    if processes > 1:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = [executor.submit(run_queue_worker, queue_path, folder, incremental, threads,
+                                       fetcher_settings or {}, journal_mode) for _ in range(processes)]
+            for future in futures:
+                future.result()
+    else:
+        drain = lambda _: drain_queue(queue_path, folder, incremental, journal_mode=journal_mode)
+        map_concurrent(drain, range(threads), threads)
+
+    counts = queue.counts()
+    failures = queue.failures()
+    queue.close()
+    return counts, failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Scrape ufcstats events into JSON files')
+    parser.add_argument('--full', action='store_true', help='re-scrape every event, not only new ones')
+    parser.add_argument('--no-revalidate', action='store_true', help='do not re-check events already on disk')
+    parser.add_argument('--workers', type=int, default=None, help='maximum number of requests in flight')
+    parser.add_argument('--rate', type=float, default=None, help='initial requests per second per host')
+    parser.add_argument('--folder', default=EVENTS_FOLDER)
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help='folder of the on-disk response cache')
+    parser.add_argument('--no-cache', action='store_true', help='always fetch from the network')
+    parser.add_argument('--offline', action='store_true', help='serve pages only from the cache')
+    parser.add_argument('--profiles', action='store_true',
+                        help='also scrape the profiles of fighters that have none yet or a stale one')
+    parser.add_argument('--queue', metavar='QUEUE_PATH', nargs='?', const=QUEUE_PATH,
+                        help='crawl through a resumable job queue file, which other workers can share')
+    parser.add_argument('--processes', type=int, default=1, help='worker processes draining the queue')
+    parser.add_argument('--threads', type=int, default=8, help='threads claiming queued jobs per process')
+    parser.add_argument('--resume', action='store_true', help='finish the queued jobs without reading the listing again')
+    parser.add_argument('--shared-fs', action='store_true',
+                        help='the queue file is shared with other hosts over a network filesystem')
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    with profiling(args.profile, args.cprofile):
+        fetcher_settings = {'workers': args.workers, 'rate': args.rate,
+                            'cache_dir': None if args.no_cache else args.cache_dir, 'offline': args.offline}
+        configure_fetcher(**fetcher_settings)
+        if args.queue:
+            counts, failures = crawl_queue(args.queue, folder=args.folder, incremental=not args.full,
+                                           full=args.full, relist=not args.resume, processes=args.processes,
+                                           threads=args.threads, fetcher_settings=fetcher_settings,
+                                           journal_mode='DELETE' if args.shared_fs else 'WAL')
+            for kind, url, error in failures:
+                print(f'{kind} {url} failed: {error}')
+            for kind, states in counts.items():
+                print(f'{kind}: ' + ', '.join(f'{count} {state}' for state, count in states.items()))
+        else:
+            written, failed = crawl(folder=args.folder, incremental=not args.full,
+                                    revalidate=not args.no_revalidate, max_workers=args.workers)
+            for event_url, error in failed.items():
+                print(f'failed to scrape {event_url}: {error}')
+            print(f'{len(written)} events written')
+            if failed:
+                print(f'{len(failed)} events failed, run the crawl again to retry them')
+
+        if args.profiles:
+            from revisions import backfill_fighter_ids
+            filled, failed = backfill_fighter_ids(folder=args.folder, max_workers=args.workers)
+            for event_url, error in failed.items():
+                print(f'{event_url}: {error}')
+            print(f'{filled} fighter IDs added to stored fights')
+            store = ProfileStore(PROFILES_PATH)
+            failed = store.refresh(event_fighter_ids(args.folder), args.workers)
+            for ufcstats_id, error in failed.items():
+                print(f'failed to scrape fighter {ufcstats_id}: {error}')
+            print(f'{len(store.profiles)} fighter profiles, {len(failed)} failed')
@@ -0,0 +1,388 @@
+import json
+import os
+import shutil
+import time
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from typing import Dict, List, Optional
+from features import STAT_COLUMNS
+from fighter_state import FighterStateStore
+from loader import STAT_DTYPES
+
+DATASET_FOLDER = 'dataset'
+PARTITION_COLUMN = 'year'
+COMPRESSION = 'zstd'
+
+# String columns loaded as categoricals. They are stored as plain strings so
+# each year's file only dictionary-encodes the names it holds
+CATEGORICAL_COLUMNS = ['event', 'f1', 'f2', 'winner', 'method']
+NAME_COLUMNS = ['f1', 'f2', 'winner']
+
+# CSV outputs of the notebook and the datasets holding the same tables
+CSV_EQUIVALENTS = {'fights': 'fight_df.csv', 'features': 'final_df.csv'}
+
+## Schemas ##
+ARROW_INT_TYPES = {'Int8': pa.int8(), 'Int16': pa.int16(), 'Int32': pa.int32()}
+
+def fight_schema(stat_columns: List[str] = STAT_COLUMNS) -> pa.Schema:
+    """
+    Args:
+        stat_columns (List[str]): stats stored per fighter
+
+    Returns:
+        pa.Schema: schema of the fight table, see loader.compact_fight_df
+    """
+    fields = [
+        pa.field('event', pa.string()),
+        pa.field('date', pa.timestamp('us')),
+        pa.field('fight_name', pa.string()),
+        pa.field('f1', pa.string()),
+        pa.field('f2', pa.string()),
+        pa.field('f1_ufcstats_id', pa.string()),
+        pa.field('f2_ufcstats_id', pa.string()),
+        pa.field('f1_id', pa.int32()),
+        pa.field('f2_id', pa.int32()),
+        pa.field('winner', pa.string()),
+        pa.field('method', pa.string()),
+        pa.field('fight_length', pa.int16()),
+        pa.field('score', pa.list_(pa.int16())),
+    ]
+    for corner in ('f1', 'f2'):
+        for stat in stat_columns:
+            fields.append(pa.field(f'{corner}_{stat}', ARROW_INT_TYPES[STAT_DTYPES.get(stat, 'Int32')]))
+
+    return pa.schema(fields)
+
+def feature_schema(stat_columns: List[str] = STAT_COLUMNS) -> pa.Schema:
+    """
+    Args:
+        stat_columns (List[str]): stats averaged per fighter
+
+    Returns:
+        pa.Schema: schema of final_df, the fight table with the pre-fight features added
+    """
+    fields = list(fight_schema(stat_columns))
+    for corner in ('f1', 'f2'):
+        for stat in stat_columns:
+            fields.append(pa.field(f'{corner}_avg_{stat}', pa.float64()))
+    for corner in ('f1', 'f2'):
+        fields.append(pa.field(f'{corner}_win_rate', pa.float64()))
+        fields.append(pa.field(f'{corner}_finish_rate', pa.float64()))
+        fields.append(pa.field(f'{corner}_total_fights', pa.int32()))
+    fields.append(pa.field('f1_elo', pa.float64()))
+    fields.append(pa.field('f2_elo', pa.float64()))
+
+    return pa.schema(fields)
+
+def fighter_state_schema(stat_columns: List[str] = STAT_COLUMNS) -> pa.Schema:
+    """
+    Args:
+        stat_columns (List[str]): stats the state keeps running sums of
+
+    Returns:
+        pa.Schema: schema of the fighter state, one row per fighter
+    """
+    fields = [
+        pa.field('fighter', pa.string()),
+        pa.field('fights', pa.int32()),
+        pa.field('wins', pa.int32()),
+        pa.field('finishes', pa.int32()),
+        pa.field('elo', pa.float64()),
+    ]
+    for prefix in ('', 'f2_'):
+        for stat in stat_columns:
+            fields.append(pa.field(f'{prefix}{stat}_sum', pa.float64()))
+            fields.append(pa.field(f'{prefix}{stat}_count', pa.int32()))
+
+    return pa.schema(fields)
+
+## Writing ##
+def write_dataset(df: pd.DataFrame, name: str, schema: pa.Schema, root: str = DATASET_FOLDER,
+                  years: Optional[List[int]] = None) -> str:
+    """
+    Writes a table as Parquet files partitioned by event year, replacing any
+    earlier version of the dataset, or only the given years' partitions.
+
+    Args:
+        df (pd.DataFrame): table with a date column and the schema's columns
+        name (str): name of the dataset
+        schema (pa.Schema): schema the columns are cast to
+        root (str): folder the datasets are kept in
+        years (Optional[List[int]]): years whose partitions are replaced, the whole dataset if not given
+
+    Returns:
+        str: path of the dataset
+    """
+    df = df[schema.names].copy()
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype(object)
+    table = pa.Table.from_pandas(df, schema=schema, preserve_index=False).replace_schema_metadata(None)
+    table_years = pa.array(pd.to_datetime(df['date']).dt.year.to_numpy(), type=pa.int16())
+    path = os.path.join(root, name)
+    if years is not None:
+        # Same files as write_to_dataset writes, one year at a time
+        for year in years:
+            folder = os.path.join(path, f'{PARTITION_COLUMN}={year}')
+            os.makedirs(folder, exist_ok=True)
+            file_path = os.path.join(folder, 'part-0.parquet')
+            pq.write_table(table.filter(pc.equal(table_years, year)), file_path + '.tmp',
+                           compression=COMPRESSION)
+            os.replace(file_path + '.tmp', file_path)
+        return path
+
+    table = table.append_column(PARTITION_COLUMN, table_years)
+
+    tmp_path = path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    pq.write_to_dataset(table, tmp_path, partition_cols=[PARTITION_COLUMN], compression=COMPRESSION,
+                        basename_template='part-{i}.parquet')
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+
+    return path
+
+def write_fights(fight_df: pd.DataFrame, root: str = DATASET_FOLDER, years: Optional[List[int]] = None) -> str:
+    """
+    Args:
+        fight_df (pd.DataFrame): fight table with fighter IDs, see loader.compact_fight_df
+        root (str): folder the datasets are kept in
+        years (Optional[List[int]]): years whose partitions are replaced, all if not given
+
+    Returns:
+        str: path of the dataset
+    """
+    return write_dataset(fight_df, 'fights', fight_schema(), root, years)
+
+def write_features(final_df: pd.DataFrame, root: str = DATASET_FOLDER, years: Optional[List[int]] = None) -> str:
+    """
+    Args:
+        final_df (pd.DataFrame): fight table with the pre-fight features
+        root (str): folder the datasets are kept in
+        years (Optional[List[int]]): years whose partitions are replaced, all if not given
+
+    Returns:
+        str: path of the dataset
+    """
+    return write_dataset(final_df, 'features', feature_schema(), root, years)
+
+def write_fighter_state(store: FighterStateStore, root: str = DATASET_FOLDER) -> str:
+    """
+    Writes the fighter state as a single Parquet file. It has no event dates,
+    so it is not partitioned; the stat columns, own_stats_only and the added
+    events are kept in the schema metadata.
+
+    Args:
+        store (FighterStateStore): state to write
+        root (str): folder the datasets are kept in
+
+    Returns:
+        str: path of the file
+    """
+    schema = fighter_state_schema(store.stat_columns)
+    columns: Dict[str, list] = {field.name: [] for field in schema}
+    for fighter, state in store.fighters.items():
+        columns['fighter'].append(fighter)
+        for key in ('fights', 'wins', 'finishes', 'elo'):
+            columns[key].append(state[key])
+        for prefix in ('', 'f2_'):
+            for i, stat in enumerate(store.stat_columns):
+                columns[f'{prefix}{stat}_sum'].append(state[f'{prefix}sums'][i])
+                columns[f'{prefix}{stat}_count'].append(state[f'{prefix}counts'][i])
+
+    metadata = {
+        'stat_columns': json.dumps(store.stat_columns),
+        'own_stats_only': json.dumps(store.own_stats_only),
+        'events': json.dumps(store.events),
+    }
+    table = pa.Table.from_pydict(columns, schema=schema.with_metadata(metadata))
+
+    os.makedirs(root, exist_ok=True)
+    path = os.path.join(root, 'fighter_state.parquet')
+    pq.write_table(table, path + '.tmp', compression=COMPRESSION)
+    os.replace(path + '.tmp', path)
+
+    return path
+
+## Reading ##
+def read_dataset(name: str, columns: Optional[List[str]] = None, years: Optional[List[int]] = None,
+                 root: str = DATASET_FOLDER) -> pd.DataFrame:
+    """
+    Reads a dataset with memory-mapped files, loading only the requested
+    columns and year partitions.
+
+    Args:
+        name (str): name of the dataset, e.g. 'fights' or 'features'
+        columns (Optional[List[str]]): columns to load, all if not given
+        years (Optional[List[int]]): event years to load, all if not given
+        root (str): folder the datasets are kept in
+
+    Returns:
+        pd.DataFrame: the table in date order, names and methods as categoricals, the name columns sharing
+                      one set of categories so they compare with each other
+    """
+    path = os.path.join(root, name)
+    filters = [(PARTITION_COLUMN, 'in', list(years))] if years is not None else None
+    if columns is None:
+        columns = [field for field in pq.read_schema(_first_file(path)).names if field != PARTITION_COLUMN]
+    table = pq.read_table(path, columns=columns, filters=filters, memory_map=True, partitioning='hive',
+                          read_dictionary=[column for column in CATEGORICAL_COLUMNS if column in columns])
+
+    df = table.to_pandas(types_mapper=_pandas_type)
+    names = [column for column in NAME_COLUMNS if column in df]
+    if names:
+        name_dtype = pd.CategoricalDtype(sorted(set().union(*(df[column].cat.categories for column in names))))
+        for column in names:
+            df[column] = df[column].astype(name_dtype)
+
+    return df
+
+def read_fights(columns: Optional[List[str]] = None, years: Optional[List[int]] = None,
+                root: str = DATASET_FOLDER) -> pd.DataFrame:
+    """
+    Args:
+        columns (Optional[List[str]]): columns to load, all if not given
+        years (Optional[List[int]]): event years to load, all if not given
+        root (str): folder the datasets are kept in
+
+    Returns:
+        pd.DataFrame: the fight table
+    """
+    return read_dataset('fights', columns, years, root)
+
+def read_features(columns: Optional[List[str]] = None, years: Optional[List[int]] = None,
+                  root: str = DATASET_FOLDER) -> pd.DataFrame:
+    """
+    Args:
+        columns (Optional[List[str]]): columns to load, all if not given
+        years (Optional[List[int]]): event years to load, all if not given
+        root (str): folder the datasets are kept in
+
+    Returns:
+        pd.DataFrame: final_df
+    """
+    return read_dataset('features', columns, years, root)
+
+def read_fighter_state(root: str = DATASET_FOLDER) -> FighterStateStore:
+    """
+    Args:
+        root (str): folder the datasets are kept in
+
+    Returns:
+        FighterStateStore: the saved state
+    """
+    table = pq.read_table(os.path.join(root, 'fighter_state.parquet'), memory_map=True)
+    metadata = {key.decode(): json.loads(value) for key, value in table.schema.metadata.items()}
+
+    store = FighterStateStore(metadata['stat_columns'], metadata['own_stats_only'])
+    store.events = metadata['events']
+    columns = table.to_pydict()
+    for i, fighter in enumerate(columns['fighter']):
+        store.fighters[fighter] = {
+            'fights': columns['fights'][i],
+            'wins': columns['wins'][i],
+            'finishes': columns['finishes'][i],
+            'elo': columns['elo'][i],
+            'sums': [columns[f'{stat}_sum'][i] for stat in store.stat_columns],
+            'counts': [columns[f'{stat}_count'][i] for stat in store.stat_columns],
+            'f2_sums': [columns[f'f2_{stat}_sum'][i] for stat in store.stat_columns],
+            'f2_counts': [columns[f'f2_{stat}_count'][i] for stat in store.stat_columns],
+        }
+
+    return store
+
+def _first_file(path: str) -> str:
+    for folder, _, filenames in sorted(os.walk(path)):
+        for filename in sorted(filenames):
+            if filename.endswith('.parquet'):
+                return os.path.join(folder, filename)
+    raise FileNotFoundError(f'no Parquet files in {path}')
+
+def _pandas_type(arrow_type: pa.DataType):
+    # Nullable integers instead of floats, like loader.compact_fight_df
+    if arrow_type == pa.int8():
+        return pd.Int8Dtype()
+    if arrow_type == pa.int16():
+        return pd.Int16Dtype()
+    return None
+
+## Reporting ##
+def folder_size(path: str) -> int:
+    """
+    Args:
+        path (str): file or folder
+
+    Returns:
+        int: total size in bytes
+    """
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(folder, filename))
+               for folder, _, filenames in os.walk(path) for filename in filenames)
+
+def compare_with_csv(root: str = DATASET_FOLDER, repeat: int = 5) -> pd.DataFrame:
+    """
+    Times loading each dataset against reading its CSV equivalent with
+    pd.read_csv, and compares their size on disk.
+
+    Args:
+        root (str): folder the datasets are kept in
+        repeat (int): loads per format, the best time is reported
+
+    Returns:
+        pd.DataFrame: one row per table with load times (s) of the CSV and of the whole dataset, three
+                      columns and the last year, and their sizes (bytes)
+    """
+    def best_time(func) -> float:
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    rows = []
+    for name, csv_path in CSV_EQUIVALENTS.items():
+        path = os.path.join(root, name)
+        if not os.path.exists(csv_path) or not os.path.exists(path):
+            continue
+        last_year = max(int(folder.split('=')[1]) for folder in os.listdir(path))
+        rows.append({
+            'table': name,
+            'csv_s': best_time(lambda: pd.read_csv(csv_path)),
+            'parquet_s': best_time(lambda: read_dataset(name, root=root)),
+            'parquet_3_columns_s': best_time(lambda: read_dataset(name, ['date', 'f1', 'f2'], root=root)),
+            'parquet_last_year_s': best_time(lambda: read_dataset(name, years=[last_year], root=root)),
+            'csv_bytes': folder_size(csv_path),
+            'parquet_bytes': folder_size(path),
+        })
+
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    import argparse
+    from fighter_ids import REGISTRY_PATH, FighterRegistry
+    from loader import compact_fight_df, load_fight_df
+    from instrument import add_profile_arguments, profiling
+
+    parser = argparse.ArgumentParser(description='Build the Parquet dataset store from events/')
+    parser.add_argument('--root', default=DATASET_FOLDER, help='folder the datasets are kept in')
+    parser.add_argument('--registry', default=REGISTRY_PATH, help='path of the fighter ID registry')
+    parser.add_argument('--report', action='store_true', help='compare load times and sizes with the CSVs')
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    with profiling(args.profile, args.cprofile):
+        registry = FighterRegistry.load(args.registry)
+        store, final_df = FighterStateStore.rebuild(compact_fight_df(load_fight_df(), registry))
+        registry.save(args.registry)
+        write_fights(final_df, args.root)
+        write_features(final_df, args.root)
+        write_fighter_state(store, args.root)
+        print(f'wrote {len(final_df)} fights and {len(store.fighters)} fighters to {args.root}/')
+
+        if args.report:
+            print(compare_with_csv(args.root).to_string(index=False))
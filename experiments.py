@@ -0,0 +1,302 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+from adjusted import add_adjusted, adjusted_columns
+from aggregates import add_aggregates, parse_column
+from backtest import MIN_TRAIN, code_fingerprint, evaluate, fight_fingerprint, make_folds
+from features import STAT_COLUMNS, add_additional_fighter_metrics, calculate_fighter_historical_averages, sort_fights
+from model import FEATURE_COLUMNS, LogisticModel
+
+CACHE_FOLDER = 'experiments'
+# The cached columns are recomputed when these modules, or any module they import, change
+CACHE_MODULES = ['features.py', 'aggregates.py', 'adjusted.py']
+METRIC_COLUMNS = ['win_rate', 'finish_rate', 'total_fights', 'elo']
+BASE_COLUMNS = ([f'{corner}_avg_{stat}' for corner in ('f1', 'f2') for stat in STAT_COLUMNS]
+                + [f'{corner}_{metric}' for corner in ('f1', 'f2') for metric in METRIC_COLUMNS])
+RESULT_COLUMNS = ['transform', 'n_features', 'n_test', 'accuracy', 'log_loss', 'brier', 'ece']
+
+ATTEMPT_COLUMNS = [f'{corner}_avg_{stat}' for corner in ('f1', 'f2') for stat in ('sig_str_att', 'str_att', 'td_att')]
+TOTAL_FIGHTS_COLUMNS = ['f1_total_fights', 'f2_total_fights']
+RECENT_FORM_COLUMNS = [f'{corner}_{name}_{stat}' for corner in ('f1', 'f2')
+                       for name, stat in (('last5', 'won'), ('decay365', 'won'), ('last3_pm', 'sig_str_landed'),
+                                          ('last3_pm', 'td_comp'), ('pm', 'sig_str_landed'))]
+ADJUSTED_COLUMNS = [f'{corner}_{name}' for corner in ('f1', 'f2')
+                    for name in ('adj_win_score', 'sos', 'adj_sig_str_landed', 'adj_def_sig_str_landed', 'adj_td_comp',
+                                 'adj_def_td_comp', 'sos_sig_str_landed')]
+
+# The variants of keep_columns the notebook switches between by commenting
+# lines in and out. Each experiment names its base columns and a transform
+# from TRANSFORMS; 'drop' removes columns after the transform.
+EXPERIMENTS = [
+    {'name': 'notebook', 'columns': FEATURE_COLUMNS},
+    {'name': 'notebook + attempts', 'columns': FEATURE_COLUMNS + ATTEMPT_COLUMNS},
+    {'name': 'notebook + total fights', 'columns': FEATURE_COLUMNS + TOTAL_FIGHTS_COLUMNS},
+    {'name': 'notebook diff', 'columns': FEATURE_COLUMNS + TOTAL_FIGHTS_COLUMNS, 'transform': 'diff',
+     'drop': ['total_fights_diff']},
+    {'name': 'notebook raw + diff', 'columns': FEATURE_COLUMNS, 'transform': 'raw+diff'},
+    {'name': 'all', 'columns': BASE_COLUMNS},
+    {'name': 'all diff', 'columns': BASE_COLUMNS, 'transform': 'diff'},
+    {'name': 'elo', 'columns': ['f1_elo', 'f2_elo']},
+    {'name': 'elo diff', 'columns': ['f1_elo', 'f2_elo'], 'transform': 'diff'},
+    {'name': 'notebook + recent form', 'columns': FEATURE_COLUMNS + RECENT_FORM_COLUMNS},
+    {'name': 'notebook + recent form diff', 'columns': FEATURE_COLUMNS + TOTAL_FIGHTS_COLUMNS + RECENT_FORM_COLUMNS,
+     'transform': 'diff', 'drop': ['total_fights_diff']},
+    {'name': 'notebook + opponent-adjusted diff', 'columns': FEATURE_COLUMNS + TOTAL_FIGHTS_COLUMNS + ADJUSTED_COLUMNS,
+     'transform': 'diff', 'drop': ['total_fights_diff']},
+]
+
+
+## Transforms ##
+def raw_transform(columns: List[str], X: np.ndarray) -> Tuple[List[str], np.ndarray]:
+    return list(columns), X
+
+def diff_transform(columns: List[str], X: np.ndarray) -> Tuple[List[str], np.ndarray]:
+    """
+    Args:
+        columns (List[str]): names of the columns of X
+        X (np.ndarray): (fights, columns) features
+
+    Returns:
+        Tuple[List[str], np.ndarray]: <name>_diff = f1_<name> - f2_<name> for every column with both corners,
+                                      as in the notebook's diff_df. Columns without a pair are dropped
+    """
+    index = {column: i for i, column in enumerate(columns)}
+    names, diffs = [], []
+    for column in columns:
+        if column.startswith('f1_') and 'f2_' + column[3:] in index:
+            names.append(column[3:] + '_diff')
+            diffs.append(X[:, index[column]] - X[:, index['f2_' + column[3:]]])
+
+    return names, np.column_stack(diffs) if diffs else np.empty((len(X), 0))
+
+def raw_and_diff_transform(columns: List[str], X: np.ndarray) -> Tuple[List[str], np.ndarray]:
+    names, diffs = diff_transform(columns, X)
+    return list(columns) + names, np.hstack([X, diffs])
+
+TRANSFORMS: Dict[str, Callable[[List[str], np.ndarray], Tuple[List[str], np.ndarray]]] = {
+    'raw': raw_transform,
+    'diff': diff_transform,
+    'raw+diff': raw_and_diff_transform,
+}
+
+
+## Feature Cache ##
+class FeatureCache:
+    """
+    Base feature columns saved one file per column under a folder named after
+    the fight table's fingerprint and a hash of the feature code
+    (CACHE_MODULES), so changing either starts a fresh cache. A column is
+    computed the first time any experiment asks for it, together with the
+    other missing columns of its kind (the stat averages, the win/finish/Elo metrics, the aggregates of
+    aggregates.py or the opponent-adjusted stats of adjusted.py), and
+    memory-mapped from then on.
+    """
+
+    def __init__(self, fight_df: pd.DataFrame, folder: str = CACHE_FOLDER, own_stats_only: bool = False):
+        """
+        Args:
+            fight_df (pd.DataFrame): fight table
+            folder (str): folder the caches of all fight tables are kept in
+            own_stats_only (bool): see features.calculate_fighter_historical_averages
+        """
+        self.fight_df = sort_fights(fight_df)
+        self.own_stats_only = own_stats_only
+        self.folder = os.path.join(folder, fight_fingerprint(fight_df, own_stats_only)[:16]
+                                   + '-' + code_fingerprint(CACHE_MODULES)[:8])
+        os.makedirs(self.folder, exist_ok=True)
+        self.computed: List[str] = []
+
+        # Label, dates and events, which the folds are made from
+        if not os.path.exists(os.path.join(self.folder, 'meta.json')):
+            event_codes, events = pd.factorize(self.fight_df['event'].astype(str))
+            self._save('y', (self.fight_df['winner'] == self.fight_df['f1']).to_numpy(dtype=np.int8))
+            self._save('days', self.fight_df['date'].to_numpy().astype('datetime64[D]').astype(np.int64))
+            self._save('events', event_codes.astype(np.int32))
+            with open(os.path.join(self.folder, 'meta.json'), 'w') as f:
+                json.dump({'events': list(events)}, f)
+
+    def ensure(self, columns: List[str]) -> None:
+        """
+        Args:
+            columns (List[str]): base columns to have on disk, from BASE_COLUMNS, aggregates.aggregate_columns or
+                                 adjusted.adjusted_columns
+        """
+        missing = [column for column in dict.fromkeys(columns) if not os.path.exists(self._path(column))]
+        parsed = {column: parse_column(column) for column in missing}
+        adjusted = set(adjusted_columns())
+        unknown = sorted(column for column in missing
+                         if column not in BASE_COLUMNS and parsed[column] is None and column not in adjusted)
+        if unknown:
+            raise KeyError(f'not base feature columns: {unknown}')
+
+        stats = [stat for stat in STAT_COLUMNS if f'f1_avg_{stat}' in missing or f'f2_avg_{stat}' in missing]
+        if stats:
+            averages_df = calculate_fighter_historical_averages(self.fight_df, stats, self.own_stats_only)
+            for stat in stats:
+                for corner in ('f1', 'f2'):
+                    self._save(f'{corner}_avg_{stat}', averages_df[f'{corner}_avg_{stat}'].to_numpy(dtype=float))
+                    self.computed.append(f'{corner}_avg_{stat}')
+        if any(column[3:] in METRIC_COLUMNS for column in missing):
+            metrics_df = add_additional_fighter_metrics(self.fight_df)
+            for corner in ('f1', 'f2'):
+                for metric in METRIC_COLUMNS:
+                    self._save(f'{corner}_{metric}', metrics_df[f'{corner}_{metric}'].to_numpy(dtype=float))
+                    self.computed.append(f'{corner}_{metric}')
+        aggregates = list(dict.fromkeys(value[1] for value in parsed.values() if value is not None))
+        if aggregates:
+            stats = list(dict.fromkeys(value[2] for value in parsed.values() if value is not None))
+            aggregates_df = add_aggregates(self.fight_df, aggregates, stats)
+            for column in missing:
+                if parsed[column] is not None:
+                    self._save(column, aggregates_df[column].to_numpy(dtype=float))
+                    self.computed.append(column)
+        if any(column in adjusted for column in missing):
+            # One fit gives every stat, so all of them are saved
+            adjusted_df = add_adjusted(self.fight_df)
+            for column in adjusted_columns():
+                if not os.path.exists(self._path(column)):
+                    self._save(column, adjusted_df[column].to_numpy(dtype=float))
+                    self.computed.append(column)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.folder, f'{name}.npy')
+
+    def _save(self, name: str, values: np.ndarray) -> None:
+        tmp_path = self._path(name) + '.tmp.npy'
+        np.save(tmp_path, values)
+        os.replace(tmp_path, self._path(name))
+
+
+def load_columns(folder: str, columns: List[str]) -> Dict[str, np.ndarray]:
+    """
+    Args:
+        folder (str): folder of a FeatureCache
+        columns (List[str]): base columns to load
+
+    Returns:
+        Dict[str, np.ndarray]: memory-mapped columns, plus y, days, events and event_names for backtest.make_folds
+    """
+    names = list(dict.fromkeys(['y', 'days', 'events'] + columns))
+    arrays = {name: np.load(os.path.join(folder, f'{name}.npy'), mmap_mode='r') for name in names}
+    with open(os.path.join(folder, 'meta.json'), 'r') as f:
+        arrays['event_names'] = np.asarray(json.load(f)['events'], dtype=object)
+
+    return arrays
+
+def feature_matrix(arrays: Dict[str, np.ndarray], experiment: dict) -> Tuple[List[str], np.ndarray]:
+    """
+    Args:
+        arrays (Dict[str, np.ndarray]): columns from load_columns
+        experiment (dict): 'columns', and optionally 'transform' (a key of TRANSFORMS, 'raw' by default)
+                           and 'drop'
+
+    Returns:
+        Tuple[List[str], np.ndarray]: names and values of the experiment's features
+    """
+    X = np.column_stack([arrays[column] for column in experiment['columns']])
+    names, X = TRANSFORMS[experiment.get('transform', 'raw')](experiment['columns'], X)
+    drop = set(experiment.get('drop', []))
+    if drop:
+        keep = [i for i, name in enumerate(names) if name not in drop]
+        names, X = [names[i] for i in keep], X[:, keep]
+
+    return names, X
+
+
+## Workers ##
+def _run_experiment(job: Tuple[str, dict, str, int]) -> Dict[str, float]:
+    folder, experiment, unit, min_train = job
+    arrays = load_columns(folder, experiment['columns'])
+    names, X = feature_matrix(arrays, experiment)
+    y = np.asarray(arrays['y'])
+
+    rows, p = [], []
+    for _, _, n_train, fold_rows in make_folds(arrays, unit, min_train):
+        model = LogisticModel(names).fit(X[:n_train], y[:n_train])
+        rows.append(fold_rows)
+        p.append(model.predict_proba(X[fold_rows]))
+    rows, p = np.concatenate(rows), np.concatenate(p)
+
+    return {'transform': experiment.get('transform', 'raw'), 'n_features': len(names), 'n_test': len(rows),
+            **evaluate(y[rows], p)}
+
+
+def run_experiments(fight_df: pd.DataFrame, experiments: List[dict] = EXPERIMENTS, folder: str = CACHE_FOLDER,
+                    unit: str = 'year', min_train: int = MIN_TRAIN, processes: Optional[int] = None,
+                    own_stats_only: bool = False) -> pd.DataFrame:
+    """
+    Scores every experiment with the same walk-forward folds as backtest.py.
+    The base columns are computed once into the cache, then the experiments
+    run across worker processes that memory-map the columns they use.
+
+    Args:
+        fight_df (pd.DataFrame): fight table
+        experiments (List[dict]): 'name', 'columns' (from BASE_COLUMNS or aggregates.aggregate_columns), and
+                                  optionally 'transform' and 'drop'
+        folder (str): feature cache folder
+        unit (str): 'year' or 'event', what each fold predicts
+        min_train (int): folds with fewer earlier fights to train on are skipped
+        processes (Optional[int]): worker processes, one per CPU if not given
+        own_stats_only (bool): see features.calculate_fighter_historical_averages
+
+    Returns:
+        pd.DataFrame: one row per experiment indexed by name with rank and RESULT_COLUMNS, best log-loss first
+    """
+    for experiment in experiments:
+        transform = experiment.get('transform', 'raw')
+        if transform not in TRANSFORMS:
+            raise ValueError(f"unknown transform {transform!r} in experiment {experiment['name']!r}")
+    cache = FeatureCache(fight_df, folder, own_stats_only)
+    cache.ensure([column for experiment in experiments for column in experiment['columns']])
+
+    jobs = [(cache.folder, experiment, unit, min_train) for experiment in experiments]
+    processes = processes or os.cpu_count() or 1
+    if processes > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            results = list(executor.map(_run_experiment, jobs))
+    else:
+        results = [_run_experiment(job) for job in jobs]
+
+    results_df = pd.DataFrame(results, index=[experiment['name'] for experiment in experiments],
+                              columns=RESULT_COLUMNS)
+    results_df.index.name = 'experiment'
+    results_df = results_df.sort_values('log_loss', kind='stable')
+    results_df.insert(0, 'rank', np.arange(1, len(results_df) + 1))
+
+    return results_df
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+    from loader import load_fight_df
+    from instrument import add_profile_arguments, profiling
+
+    parser = argparse.ArgumentParser(description='Compare feature sets with walk-forward backtests')
+    parser.add_argument('--config', default=None, help='JSON file with a list of experiments, EXPERIMENTS if not given')
+    parser.add_argument('--unit', choices=['year', 'event'], default='year', help='what each fold predicts')
+    parser.add_argument('--min-train', type=int, default=MIN_TRAIN, help='skip folds with fewer earlier fights')
+    parser.add_argument('--processes', type=int, default=None, help='worker processes, one per CPU by default')
+    parser.add_argument('--folder', default=CACHE_FOLDER, help='feature cache folder')
+    parser.add_argument('--own-stats-only', action='store_true', help='see features.calculate_fighter_historical_averages')
+    parser.add_argument('--out', default=None, help='also write the table to this CSV')
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    with profiling(args.profile, args.cprofile):
+        experiments = EXPERIMENTS
+        if args.config:
+            with open(args.config, 'r') as f:
+                experiments = json.load(f)
+
+        start = time.perf_counter()
+        results_df = run_experiments(load_fight_df(), experiments, args.folder, args.unit, args.min_train,
+                                     args.processes, args.own_stats_only)
+        with pd.option_context('display.float_format', '{:.4f}'.format, 'display.width', 200):
+            print(results_df)
+        print(f'{len(experiments)} experiments in {time.perf_counter() - start:.2f}s')
+        if args.out:
+            results_df.to_csv(args.out)
@@ -0,0 +1,419 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Set, Tuple
+from instrument import count, timed
+from ratings import DEFAULT_MULTIPLIERS, method_category
+
+STAT_COLUMNS = [
+    'kd', 'sig_str_landed', 'sig_str_att', 'str_landed', 'str_att',
+    'td_comp', 'td_att', 'sub_att', 'ctrl_time'
+]
+
+# Methods counted as finishes by finish_rate (exact matches, so of the stored
+# methods only 'Submission' counts, as in the original notebook)
+FINISH_METHODS = ['Stoppage', 'KO', 'Submission']
+
+ELO_BASE_RATING = 1500
+ELO_K = 32
+
+## Ordering ##
+def sort_fights(fight_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Args:
+        fight_df (pd.DataFrame): fight table
+
+    Returns:
+        pd.DataFrame: fight table sorted by date, keeping the input order of fights on the same date
+    """
+    return fight_df.sort_values('date', kind='stable').reset_index(drop=True)
+
+## Reshaping ##
+def fighter_keys(fight_df: pd.DataFrame, corner: str) -> np.ndarray:
+    """
+    Args:
+        fight_df (pd.DataFrame): fight table
+        corner (str): 'f1' or 'f2'
+
+    Returns:
+        np.ndarray: integer fighter IDs of the corner when the table has them (see loader.compact_fight_df),
+                    names otherwise
+    """
+    if f'{corner}_id' in fight_df:
+        return fight_df[f'{corner}_id'].to_numpy()
+    return fight_df[corner].to_numpy(dtype=object)
+
+@timed()
+def to_fighter_rows(fight_df: pd.DataFrame, stat_columns: List[str] = STAT_COLUMNS) -> pd.DataFrame:
+    """
+    Reshapes the fight table to one row per fighter per fight, with the
+    fighter's own stats in unprefixed columns.
+
+    Args:
+        fight_df (pd.DataFrame): fight table with f1/f2 and f1_<stat>/f2_<stat> columns, in fight order
+        stat_columns (List[str]): stats to carry over
+
+    Returns:
+        pd.DataFrame: columns fight (row position in fight_df), corner (1 or 2), fighter and the stats,
+                      ordered by fight then corner
+    """
+    n = len(fight_df)
+    fight = np.arange(n)
+    long_df = pd.DataFrame({
+        'fight': np.concatenate([fight, fight]),
+        'corner': np.repeat(np.array([1, 2], dtype=np.int8), n),
+        'fighter': np.concatenate([fighter_keys(fight_df, 'f1'), fighter_keys(fight_df, 'f2')]),
+    })
+    for stat in stat_columns:
+        long_df[stat] = np.concatenate([
+            fight_df[f'f1_{stat}'].to_numpy(dtype=float, na_value=np.nan),
+            fight_df[f'f2_{stat}'].to_numpy(dtype=float, na_value=np.nan),
+        ])
+
+    return long_df.sort_values(['fight', 'corner'], kind='stable').reset_index(drop=True)
+
+@timed()
+def prior_means(long_df: pd.DataFrame, stat_columns: List[str]) -> pd.DataFrame:
+    """
+    Args:
+        long_df (pd.DataFrame): one row per fighter per fight, ordered by fight
+        stat_columns (List[str]): stats to average
+
+    Returns:
+        pd.DataFrame: for every row, the mean of each stat over the fighter's earlier rows
+                      (missing values skipped, NaN when there are none)
+    """
+    values = long_df[stat_columns]
+    present = values.notna().astype(float)
+    grouped_sums = values.fillna(0.0).groupby(long_df['fighter'], sort=False).cumsum()
+    grouped_counts = present.groupby(long_df['fighter'], sort=False).cumsum()
+
+    # Shift by one row within each fighter so the current fight is excluded
+    prior_sums = grouped_sums - values.fillna(0.0)
+    prior_counts = grouped_counts - present
+    return prior_sums / prior_counts.where(prior_counts > 0)
+
+## Features ##
+@timed()
+def calculate_fighter_historical_averages(fight_df: pd.DataFrame, stat_columns: List[str] = STAT_COLUMNS,
+                                          own_stats_only: bool = False) -> pd.DataFrame:
+    """
+    Calculate historical averages for each fighter prior to each fight, using
+    grouped cumulative sums instead of rescanning the earlier fights per row.
+
+    The original notebook loop averaged the f2_<stat> column of fighter 2's
+    earlier fights, which is the opponent's stat whenever that fighter was in
+    the f1 corner. This is kept by default so the output matches final_df.csv;
+    own_stats_only averages fighter 2's own stats instead, like fighter 1's.
+
+    Args:
+        fight_df (pd.DataFrame): DataFrame with fight data
+        stat_columns (List[str]): stats to average
+        own_stats_only (bool): average only fighter 2's own stats
+
+    Returns:
+        pd.DataFrame: fight_df sorted by date with f1_avg_<stat> and f2_avg_<stat> columns added, holding
+                      each fighter's mean over the rows before the current one
+    """
+    fight_df = sort_fights(fight_df)
+    count('calculate_fighter_historical_averages.rows', len(fight_df))
+
+    long_df = to_fighter_rows(fight_df, stat_columns)
+    own_means = prior_means(long_df, stat_columns)
+    if own_stats_only:
+        f2_means = own_means
+    else:
+        f2_column_df = long_df[['fight', 'corner', 'fighter']].copy()
+        for stat in stat_columns:
+            f2_values = fight_df[f'f2_{stat}'].to_numpy(dtype=float, na_value=np.nan)
+            f2_column_df[stat] = f2_values[long_df['fight'].to_numpy()]
+        f2_means = prior_means(f2_column_df, stat_columns)
+
+    averages = {}
+    for corner, means in ((1, own_means), (2, f2_means)):
+        in_corner = (long_df['corner'] == corner).to_numpy()
+        order = long_df['fight'].to_numpy()[in_corner]
+        corner_means = means[in_corner].to_numpy()
+        placed = np.empty_like(corner_means)
+        placed[order] = corner_means
+        for i, stat in enumerate(stat_columns):
+            averages[f'f{corner}_avg_{stat}'] = placed[:, i]
+
+    return pd.concat([fight_df, pd.DataFrame(averages, index=fight_df.index)], axis=1)
+
+@timed()
+def add_additional_fighter_metrics(fight_df_with_averages: pd.DataFrame) -> pd.DataFrame:
+    """
+    Add historical metrics: win rate, finish rate, total fights, and pre-fight ELO rating.
+
+    Args:
+        fight_df_with_averages (pd.DataFrame): fight table in fight order, e.g. from calculate_fighter_historical_averages
+
+    Returns:
+        pd.DataFrame: the table with f*_win_rate, f*_finish_rate, f*_total_fights and f*_elo columns added
+    """
+    fight_df = fight_df_with_averages.reset_index(drop=True)
+    n = len(fight_df)
+    count('add_additional_fighter_metrics.rows', n)
+
+    long_df = to_fighter_rows(fight_df, [])
+    fight = long_df['fight'].to_numpy()
+    winner = fight_df['winner'].to_numpy(dtype=object)
+    won_by_corner = {
+        1: winner == fight_df['f1'].to_numpy(dtype=object),
+        2: winner == fight_df['f2'].to_numpy(dtype=object),
+    }
+    won = np.where(long_df['corner'].to_numpy() == 1, won_by_corner[1][fight], won_by_corner[2][fight])
+    finished = won & fight_df['method'].isin(FINISH_METHODS).to_numpy()[fight]
+    counts = pd.DataFrame({'fights': 1.0, 'wins': won.astype(float), 'finishes': finished.astype(float)})
+    prior = counts.groupby(long_df['fighter'], sort=False).cumsum() - counts
+
+    metrics = {}
+    for corner in (1, 2):
+        in_corner = (long_df['corner'] == corner).to_numpy()
+        placed = np.empty((n, 3))
+        placed[fight[in_corner]] = prior[in_corner].to_numpy()
+        total = placed[:, 0]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            metrics[f'f{corner}_win_rate'] = np.where(total > 0, placed[:, 1] / total, np.nan)
+            metrics[f'f{corner}_finish_rate'] = np.where(total > 0, placed[:, 2] / total, np.nan)
+        metrics[f'f{corner}_total_fights'] = total.astype(int)
+
+    f1_elo, f2_elo = calculate_elo(fight_df)
+    metrics['f1_elo'] = f1_elo
+    metrics['f2_elo'] = f2_elo
+
+    return pd.concat([fight_df, pd.DataFrame(metrics, index=fight_df.index)], axis=1)
+
+def elo_k(method: str, k: float = ELO_K) -> float:
+    """
+    Args:
+        method (str): method of victory
+        k (float): base K factor
+
+    Returns:
+        float: K factor scaled by how decisive the method is
+    """
+    return k * DEFAULT_MULTIPLIERS[method_category(method)]
+
+def elo_update(f1_elo: float, f2_elo: float, f1_score: float, k: float) -> Tuple[float, float]:
+    """
+    Args:
+        f1_elo (float): fighter 1's rating before the fight
+        f2_elo (float): fighter 2's rating before the fight
+        f1_score (float): 1 if fighter 1 won, 0 if fighter 2 won, 0.5 otherwise
+        k (float): K factor
+
+    Returns:
+        Tuple[float, float]: ratings after the fight
+    """
+    e1 = 1 / (1 + 10 ** ((f2_elo - f1_elo) / 400))
+    e2 = 1 - e1
+    return f1_elo + k * (f1_score - e1), f2_elo + k * ((1 - f1_score) - e2)
+
+@timed()
+def calculate_elo(fight_df: pd.DataFrame, base_rating: float = ELO_BASE_RATING) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Scalar Elo with the default settings, kept bit-for-bit identical to the
+    notebook and FighterStateStore. ratings.Elo replays the same system over
+    arrays for many settings at once.
+
+    Args:
+        fight_df (pd.DataFrame): fight table in fight order
+        base_rating (float): rating of a fighter's first fight
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: pre-fight ratings of fighter 1 and fighter 2
+    """
+    count('calculate_elo.rows', len(fight_df))
+    elo_ratings = {}
+    f1_elos = np.empty(len(fight_df))
+    f2_elos = np.empty(len(fight_df))
+    rows = zip(fighter_keys(fight_df, 'f1'), fighter_keys(fight_df, 'f2'),
+               fight_df['f1'], fight_df['f2'], fight_df['winner'], fight_df['method'])
+    for i, (f1_key, f2_key, f1, f2, winner, method) in enumerate(rows):
+        f1_elo = elo_ratings.get(f1_key, base_rating)
+        f2_elo = elo_ratings.get(f2_key, base_rating)
+        f1_elos[i] = f1_elo
+        f2_elos[i] = f2_elo
+
+        if winner == f1:
+            f1_score = 1
+        elif winner == f2:
+            f1_score = 0
+        else:
+            f1_score = 0.5  # draw/no contest
+        elo_ratings[f1_key], elo_ratings[f2_key] = elo_update(f1_elo, f2_elo, f1_score, elo_k(method))
+
+    return f1_elos, f2_elos
+
+## Refresh ##
+def changed_fights(old_df: pd.DataFrame, new_df: pd.DataFrame, columns: List[str]) -> np.ndarray:
+    """
+    Args:
+        old_df (pd.DataFrame): fight table before a revision
+        new_df (pd.DataFrame): the same fights, in the same order, after it
+        columns (List[str]): columns to compare
+
+    Returns:
+        np.ndarray: True for the rows where any of the columns differ, missing values comparing equal
+    """
+    changed = np.zeros(len(new_df), dtype=bool)
+    for column in columns:
+        old = _comparable(old_df[column])
+        new = _comparable(new_df[column])
+        old_missing = pd.isna(old)
+        new_missing = pd.isna(new)
+        both = ~old_missing & ~new_missing
+        differs = old_missing != new_missing
+        differs[both] = old[both] != new[both]
+        changed |= differs
+
+    return changed
+
+def _comparable(values: pd.Series) -> np.ndarray:
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        return values.to_numpy(dtype=float, na_value=np.nan)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.to_numpy().astype('datetime64[ns]')
+    values = values.astype(object).to_numpy()
+    if values.size and any(isinstance(value, (list, np.ndarray)) for value in values):
+        # List columns (score) compare as tuples
+        values = np.array([tuple(value) if isinstance(value, (list, np.ndarray)) else value for value in values] + [None],
+                          dtype=object)[:-1]
+    return values
+
+def elo_score(f1: str, f2: str, winner: str) -> float:
+    """
+    Returns:
+        float: fighter 1's score, 1 for a win, 0 for a loss and 0.5 for a draw or no contest
+    """
+    if winner == f1:
+        return 1
+    if winner == f2:
+        return 0
+    return 0.5
+
+@timed()
+def refresh_features(final_df: pd.DataFrame, fight_df: pd.DataFrame, stat_columns: List[str] = STAT_COLUMNS,
+                     own_stats_only: bool = False) -> Tuple[pd.DataFrame, np.ndarray, Set, Dict]:
+    """
+    Updates final_df after some of its fights were revised, recomputing only
+    the rows that can change. The averages, win rates and finish rates are
+    recomputed for the fighters of the revised fights from their own fights.
+    Elo is replayed from the first revised fight, only through fights with a
+    fighter whose rating differs from the stored one, so a revised rating
+    reaches later opponents but the rest of the table is left alone.
+
+    Fighters are keyed by fighter_keys, so both tables need fighter IDs or
+    neither does.
+
+    Args:
+        final_df (pd.DataFrame): stored features, in fight order
+        fight_df (pd.DataFrame): revised fight table, the same fights in the same order
+        stat_columns (List[str]): stats averaged per fighter
+        own_stats_only (bool): see calculate_fighter_historical_averages
+
+    Returns:
+        Tuple[pd.DataFrame, np.ndarray, Set, Dict]: the revised final_df, True for its rows that changed, the
+            keys of the fighters whose averages and records were recomputed, and fighter key -> current
+            rating for every fighter whose rating changed
+
+    Raises:
+        ValueError: if fights were added, removed or reordered, which needs a full recompute
+    """
+    fight_df = fight_df.reset_index(drop=True)
+    final_df = final_df.reset_index(drop=True)
+    if (len(fight_df) != len(final_df) or (fight_df['event'].astype(object) != final_df['event'].astype(object)).any()
+            or (fight_df['date'] != final_df['date']).any()):
+        raise ValueError('the fights were added to, removed or reordered, recompute the features instead')
+
+    feature_columns = [column for column in final_df.columns if column not in fight_df.columns]
+    revised = changed_fights(final_df, fight_df, list(fight_df.columns))
+    refreshed_df = pd.concat([fight_df, final_df[feature_columns]], axis=1)
+    updated = revised.copy()
+    if not revised.any():
+        return refreshed_df, updated, set(), {}
+    start = int(np.argmax(revised))
+
+    old_f1 = fighter_keys(final_df, 'f1')
+    old_f2 = fighter_keys(final_df, 'f2')
+    new_f1 = fighter_keys(fight_df, 'f1')
+    new_f2 = fighter_keys(fight_df, 'f2')
+
+    # Averages and records: only the fighters of the revised fights, computed from their fights alone
+    fighters = set(old_f1[revised]) | set(old_f2[revised]) | set(new_f1[revised]) | set(new_f2[revised])
+    involved = np.flatnonzero(pd.Series(new_f1).isin(fighters).to_numpy()
+                              | pd.Series(new_f2).isin(fighters).to_numpy())
+    involved_df = add_additional_fighter_metrics(calculate_fighter_historical_averages(
+        fight_df.iloc[involved], stat_columns, own_stats_only))
+    for corner, corner_keys in ((1, new_f1), (2, new_f2)):
+        columns = ([f'f{corner}_avg_{stat}' for stat in stat_columns]
+                   + [f'f{corner}_win_rate', f'f{corner}_finish_rate', f'f{corner}_total_fights'])
+        in_corner = np.array([corner_keys[row] in fighters for row in involved], dtype=bool) & (involved >= start)
+        rows = involved[in_corner]
+        for column in columns:
+            values = refreshed_df[column].to_numpy(copy=True)
+            values[rows] = involved_df[column].to_numpy()[in_corner]
+            refreshed_df[column] = values
+        updated[rows] = True
+
+    # Elo: ratings that differ from the stored history, carried forward fight by fight. The fighters are
+    # tracked by key, the results compare the winner with the names
+    old_f1_name = final_df['f1'].to_numpy(dtype=object)
+    old_f2_name = final_df['f2'].to_numpy(dtype=object)
+    new_f1_name = fight_df['f1'].to_numpy(dtype=object)
+    new_f2_name = fight_df['f2'].to_numpy(dtype=object)
+    old_winner = final_df['winner'].to_numpy(dtype=object)
+    old_method = final_df['method'].to_numpy(dtype=object)
+    new_winner = fight_df['winner'].to_numpy(dtype=object)
+    new_method = fight_df['method'].to_numpy(dtype=object)
+    f1_elo = final_df['f1_elo'].to_numpy(dtype=float)
+    f2_elo = final_df['f2_elo'].to_numpy(dtype=float)
+    new_f1_elo = f1_elo.copy()
+    new_f2_elo = f2_elo.copy()
+
+    def stored_score(row: int) -> float:
+        return elo_score(old_f1_name[row], old_f2_name[row], old_winner[row])
+
+    def stored_rating(key, row: int) -> float:
+        # Rating after the fighter's last stored fight before row
+        for earlier in range(row - 1, -1, -1):
+            if key in (old_f1[earlier], old_f2[earlier]):
+                after = dict(zip((old_f1[earlier], old_f2[earlier]), elo_update(
+                    f1_elo[earlier], f2_elo[earlier], stored_score(earlier), elo_k(old_method[earlier]))))
+                return after[key]
+        return ELO_BASE_RATING
+
+    ratings: Dict = {}
+    for row in range(start, len(fight_df)):
+        f1, f2 = new_f1[row], new_f2[row]
+        if not revised[row] and f1 not in ratings and f2 not in ratings:
+            continue
+
+        stored_before = {old_f1[row]: f1_elo[row], old_f2[row]: f2_elo[row]}
+        stored_after = dict(zip((old_f1[row], old_f2[row]), elo_update(
+            f1_elo[row], f2_elo[row], stored_score(row), elo_k(old_method[row]))))
+        keys = list(dict.fromkeys([old_f1[row], old_f2[row], f1, f2]))
+        for key in keys:
+            if key not in stored_before:
+                stored_before[key] = stored_after[key] = stored_rating(key, row)
+        before = {key: ratings.get(key, stored_before[key]) for key in keys}
+
+        new_f1_elo[row], new_f2_elo[row] = before[f1], before[f2]
+        after = dict(before)
+        after.update(zip((f1, f2), elo_update(before[f1], before[f2],
+                                              elo_score(new_f1_name[row], new_f2_name[row], new_winner[row]),
+                                              elo_k(new_method[row]))))
+        for key in keys:
+            if after[key] != stored_after[key]:
+                ratings[key] = after[key]
+            else:
+                ratings.pop(key, None)
+
+    elo_changed = (new_f1_elo != f1_elo) | (new_f2_elo != f2_elo)
+    refreshed_df['f1_elo'] = new_f1_elo
+    refreshed_df['f2_elo'] = new_f2_elo
+    updated |= elo_changed
+    count('refresh_features.rows', int(updated.sum()))
+
+    return refreshed_df, updated, fighters, ratings
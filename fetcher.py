@@ -0,0 +1,264 @@
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, TypeVar
+from cache import CacheMiss, ResponseCache
+from instrument import count, timed
+from throttle import RETRY_STATUSES, RateLimiter, parse_retry_after
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+## Connection Pool ##
+MAX_CONNECTIONS = 16
+TIMEOUT = (5, 30)  # seconds to connect, seconds to wait for the response
+MAX_RETRIES = 4
+BACKOFF = 0.5
+MAX_BACKOFF = 30.0
+
+_session = None
+_session_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(MAX_CONNECTIONS)
+_cache = None
+_limiter = RateLimiter()
+
+
+def configure(max_connections: int, timeout: Optional[Tuple[float, float]] = None,
+              max_retries: Optional[int] = None) -> None:
+    """
+    Sets the maximum number of requests in flight at once and resizes the
+    keep-alive connection pool to match.
+
+    Args:
+        max_connections (int): concurrency limit for all fetches
+        timeout (Optional[Tuple[float, float]]): seconds to connect and to wait for the response
+        max_retries (Optional[int]): retries of a failed request before giving up
+    """
+    global MAX_CONNECTIONS, TIMEOUT, MAX_RETRIES, _session, _slots
+    if max_connections < 1:
+        raise ValueError('max_connections must be at least 1')
+
+    with _session_lock:
+        if timeout is not None:
+            TIMEOUT = timeout
+        if max_retries is not None:
+            MAX_RETRIES = max_retries
+        MAX_CONNECTIONS = max_connections
+        _slots = threading.BoundedSemaphore(max_connections)
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+def get_session() -> requests.Session:
+    """
+    Returns:
+        requests.Session: shared session whose connection pool is sized to the concurrency limit
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=MAX_CONNECTIONS)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+        return _session
+
+
+## Rate Limiting ##
+def set_rate_limiter(limiter: Optional[RateLimiter]) -> None:
+    """
+    Args:
+        limiter (Optional[RateLimiter]): per host rate limiter every request waits on, None for no limit
+    """
+    global _limiter
+    _limiter = limiter
+
+
+def get_rate_limiter() -> Optional[RateLimiter]:
+    """
+    Returns:
+        Optional[RateLimiter]: per host rate limiter every request waits on, None if there is no limit
+    """
+    return _limiter
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """
+    Args:
+        attempt (int): number of the failed attempt, starting at 0
+        retry_after (Optional[float]): seconds the server asked us to wait
+
+    Returns:
+        float: seconds to wait before the next attempt, exponential with jitter
+    """
+    delay = min(MAX_BACKOFF, BACKOFF * 2 ** attempt) * random.uniform(0.5, 1.0)
+    return max(delay, retry_after or 0.0)
+
+
+## Cache ##
+def set_cache(cache: Optional[ResponseCache]) -> None:
+    """
+    Args:
+        cache (Optional[ResponseCache]): cache every fetch goes through, None to always use the network
+    """
+    global _cache
+    _cache = cache
+
+
+def get_cache() -> Optional[ResponseCache]:
+    """
+    Returns:
+        Optional[ResponseCache]: cache every fetch goes through, None if caching is off
+    """
+    return _cache
+
+
+def _cached_response(entry: dict) -> requests.Response:
+    response = requests.Response()
+    response.status_code = 200
+    response.url = entry['url']
+    response._content = entry['body'].encode('utf-8')
+    response.encoding = 'utf-8'
+    if entry.get('etag'):
+        response.headers['ETag'] = entry['etag']
+    if entry.get('last_modified'):
+        response.headers['Last-Modified'] = entry['last_modified']
+    return response
+
+
+## Fetching ##
+def fetch(url: str) -> str:
+    """
+    Args:
+        url (str): URL of page
+
+    Returns:
+        str: body of the page
+    """
+    return fetch_response(url).text
+
+
+@timed('fetch')
+def fetch_response(url: str, headers: Optional[Dict[str, str]] = None) -> requests.Response:
+    """
+    Args:
+        url (str): URL of page
+        headers (Optional[Dict[str, str]]): extra request headers, e.g. If-None-Match
+
+    Returns:
+        requests.Response: response from the server, or from the cache if one is set
+    """
+    cache = _cache
+    entry = None
+    if cache is not None:
+        entry = cache.get(url)
+        if entry is None:
+            count('cache.misses')
+        else:
+            count('cache.hits' if cache.within_ttl(entry) else 'cache.stale_hits')
+            if cache.is_fresh(entry):
+                return _cached_response(entry)
+        if cache.offline:
+            raise CacheMiss(url)
+        if entry is not None:
+            # Stale entry, let the server confirm it is still current
+            headers = dict(headers or {})
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+    response = _get(url, headers)
+
+    if cache is not None:
+        if response.status_code == 304 and entry is not None:
+            count('cache.revalidated')
+            cache.touch(entry)
+            return _cached_response(entry)
+        if response.status_code == 200:
+            cache.put(url, response.text, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+
+    return response
+
+
+@timed('http_get')
+def _get(url: str, headers: Optional[Dict[str, str]]) -> requests.Response:
+    session = get_session()
+    response = None
+    error = None
+    for attempt in range(MAX_RETRIES + 1):
+        limiter = _limiter
+        if limiter is not None:
+            limiter.acquire(url)
+
+        if attempt:
+            count('http_retries')
+        start = time.monotonic()
+        retry_after = None
+        try:
+            with _slots:
+                response = session.get(url, headers=headers, timeout=TIMEOUT)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            response = None
+            error = e
+            if limiter is not None:
+                limiter.record(url, time.monotonic() - start, None)
+        else:
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            if limiter is not None:
+                limiter.record(url, time.monotonic() - start, response.status_code, retry_after)
+            if response.status_code not in RETRY_STATUSES:
+                response.raise_for_status()
+                count('http_get.pages')
+                count('http_get.bytes', len(response.content))
+                return response
+
+        if attempt < MAX_RETRIES:
+            time.sleep(backoff_delay(attempt, retry_after))
+
+    if response is not None:
+        response.raise_for_status()
+    raise error
+
+
+def fetch_all(urls: Iterable[str], max_workers: Optional[int] = None) -> List[str]:
+    """
+    Args:
+        urls (Iterable[str]): URLs of pages
+        max_workers (Optional[int]): number of worker threads, defaults to the concurrency limit
+
+    Returns:
+        List[str]: bodies of the pages, in the same order as urls
+    """
+    return map_concurrent(fetch, urls, max_workers)
+
+
+def map_concurrent(func: Callable[[T], R], items: Iterable[T], max_workers: Optional[int] = None) -> List[R]:
+    """
+    Runs func over items on a thread pool. Network access inside func still goes
+    through fetch, so the number of requests in flight never exceeds the
+    concurrency limit even when pools are nested.
+
+    Args:
+        func (Callable[[T], R]): function to apply
+        items (Iterable[T]): inputs to func
+        max_workers (Optional[int]): number of worker threads, defaults to the concurrency limit
+
+    Returns:
+        List[R]: results, in the same order as items
+    """
+    items = list(items)
+    if not items:
+        return []
+
+    workers = min(max_workers or MAX_CONNECTIONS, len(items))
+    if workers == 1:
+        return [func(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(func, items))
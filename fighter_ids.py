@@ -0,0 +1,131 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional
+
+REGISTRY_PATH = 'fighter_ids.json'
+
+
+class FighterRegistry:
+    """
+    Interns fighters to dense, stable integer IDs. A fighter is identified by
+    their ufcstats fighter-details ID when the scraped data has one, and by
+    name otherwise (events scraped before IDs were captured). When a name
+    seen without an ID is later seen with one, the ID is attached to the
+    existing integer, so the integer stays the same. Integers are never
+    reused; renamed fighters keep theirs and namesakes with different
+    ufcstats IDs get separate ones.
+    """
+
+    def __init__(self):
+        self.keys: List[str] = []
+        self.names: List[str] = []
+        self._index: Dict[str, int] = {}
+        self._linked: Dict[int, Optional[str]] = {}
+
+    @staticmethod
+    def _ufcstats_key(ufcstats_id: str) -> str:
+        return f'ufcstats:{ufcstats_id}'
+
+    @staticmethod
+    def _name_key(name: str) -> str:
+        return f'name:{name}'
+
+    def intern(self, name: str, ufcstats_id: Optional[str] = None) -> int:
+        """
+        Args:
+            name (str): name of fighter
+            ufcstats_id (Optional[str]): ufcstats fighter-details ID, None if unknown
+
+        Returns:
+            int: the fighter's integer ID
+        """
+        if ufcstats_id:
+            key = self._ufcstats_key(ufcstats_id)
+            if key in self._index:
+                return self._index[key]
+
+            # Attach the ID to a fighter only known by name so far
+            by_name = self._index.get(self._name_key(name))
+            if by_name is not None and self._linked.get(by_name) is None:
+                self._index[key] = by_name
+                self._linked[by_name] = ufcstats_id
+                return by_name
+
+            fighter_id = self._add(key, name)
+            self._linked[fighter_id] = ufcstats_id
+            self._index.setdefault(self._name_key(name), fighter_id)
+            return fighter_id
+
+        key = self._name_key(name)
+        if key in self._index:
+            return self._index[key]
+        fighter_id = self._add(key, name)
+        self._linked[fighter_id] = None
+        return fighter_id
+
+    def intern_many(self, names: pd.Series, ufcstats_ids: Optional[pd.Series] = None) -> np.ndarray:
+        """
+        Args:
+            names (pd.Series): names of fighters
+            ufcstats_ids (Optional[pd.Series]): ufcstats IDs of the fighters, missing values allowed
+
+        Returns:
+            np.ndarray: int32 IDs of the fighters
+        """
+        if ufcstats_ids is None:
+            ufcstats_ids = pd.Series([None] * len(names), index=names.index)
+        ids = [self.intern(name, ufcstats_id if isinstance(ufcstats_id, str) else None)
+               for name, ufcstats_id in zip(names, ufcstats_ids)]
+        return np.asarray(ids, dtype=np.int32)
+
+    def name(self, fighter_id: int) -> str:
+        """
+        Args:
+            fighter_id (int): integer ID of fighter
+
+        Returns:
+            str: name the fighter was first seen under
+        """
+        return self.names[fighter_id]
+
+    def _add(self, key: str, name: str) -> int:
+        fighter_id = len(self.keys)
+        self.keys.append(key)
+        self.names.append(name)
+        self._index[key] = fighter_id
+        return fighter_id
+
+    ## Persistence ##
+    @classmethod
+    def load(cls, path: str = REGISTRY_PATH) -> 'FighterRegistry':
+        """
+        Args:
+            path (str): path of the saved registry
+
+        Returns:
+            FighterRegistry: the saved registry, empty if the file does not exist
+        """
+        registry = cls()
+        if not os.path.exists(path):
+            return registry
+        with open(path, 'r') as f:
+            data = json.load(f)
+
+        registry.keys = data['keys']
+        registry.names = data['names']
+        registry._index = {key: int(fighter_id) for key, fighter_id in data['index'].items()}
+        registry._linked = {int(fighter_id): linked for fighter_id, linked in data['linked'].items()}
+        return registry
+
+    def save(self, path: str = REGISTRY_PATH) -> None:
+        """
+        Args:
+            path (str): path to save the registry to
+        """
+        data = {'keys': self.keys, 'names': self.names, 'index': self._index, 'linked': self._linked}
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
@@ -0,0 +1,317 @@
+import json
+import math
+import os
+import numpy as np
+import pandas as pd
+from typing import Dict, Iterable, List, Optional, Tuple
+from features import (ELO_BASE_RATING, FINISH_METHODS, STAT_COLUMNS, add_additional_fighter_metrics,
+                      calculate_fighter_historical_averages, elo_k, elo_update, fighter_keys, sort_fights)
+from fighter_ids import FighterRegistry
+from loader import event_fight_rows
+
+STATE_PATH = 'fighter_state.json'
+
+
+def fighter_key(fight: dict, corner: str) -> str:
+    """
+    Args:
+        fight (dict): fight row
+        corner (str): 'f1' or 'f2'
+
+    Returns:
+        str: key of the corner's fighter in the state, their integer ID when the row has one (see
+             loader.compact_fight_df) and their name otherwise
+    """
+    fighter_id = fight.get(f'{corner}_id')
+    if fighter_id is None or pd.isna(fighter_id):
+        return fight[corner]
+    return str(int(fighter_id))
+
+def state_key(key) -> str:
+    """
+    Args:
+        key: fighter key from features.fighter_keys, an integer ID or a name
+
+    Returns:
+        str: the same fighter's key in the state, see fighter_key
+    """
+    return key if isinstance(key, str) else str(int(key))
+
+def _value(row: dict, column: str) -> Optional[float]:
+    value = row.get(column)
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return float(value)
+
+
+class FighterStateStore:
+    """
+    Running per-fighter aggregates (stat sums and counts, wins, finishes and
+    the current Elo) from which the pre-fight features of a new fight are read
+    directly. Appending fights only touches the two fighters involved, and
+    replaying the whole history gives the same rows as
+    calculate_fighter_historical_averages followed by add_additional_fighter_metrics.
+    Fighters are keyed like the feature code keys them, by integer ID when the
+    fights have one (see fighter_key).
+    """
+
+    def __init__(self, stat_columns: List[str] = STAT_COLUMNS, own_stats_only: bool = False):
+        """
+        Args:
+            stat_columns (List[str]): stats to keep running averages of
+            own_stats_only (bool): see calculate_fighter_historical_averages
+        """
+        self.stat_columns = list(stat_columns)
+        self.own_stats_only = own_stats_only
+        self.fighters: Dict[str, dict] = {}
+        self.events: List[str] = []
+
+    ## Persistence ##
+    @classmethod
+    def load(cls, path: str = STATE_PATH) -> 'FighterStateStore':
+        """
+        Args:
+            path (str): path of the saved state
+
+        Returns:
+            FighterStateStore: the saved state, empty if the file does not exist
+        """
+        if not os.path.exists(path):
+            return cls()
+        with open(path, 'r') as f:
+            data = json.load(f)
+
+        store = cls(data['stat_columns'], data['own_stats_only'])
+        store.fighters = data['fighters']
+        store.events = data['events']
+        return store
+
+    def save(self, path: str = STATE_PATH) -> None:
+        """
+        Args:
+            path (str): path to save the state to
+        """
+        data = {
+            'stat_columns': self.stat_columns,
+            'own_stats_only': self.own_stats_only,
+            'events': self.events,
+            'fighters': self.fighters,
+        }
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    ## State ##
+    def fighter(self, key: str) -> dict:
+        """
+        Args:
+            key (str): key of fighter, see fighter_key
+
+        Returns:
+            dict: the fighter's aggregates, a fresh record for a debut
+        """
+        state = self.fighters.get(key)
+        if state is None:
+            n = len(self.stat_columns)
+            state = {
+                'fights': 0, 'wins': 0, 'finishes': 0, 'elo': ELO_BASE_RATING,
+                'sums': [0.0] * n, 'counts': [0] * n,
+                'f2_sums': [0.0] * n, 'f2_counts': [0] * n,
+            }
+        return state
+
+    def pre_fight_features(self, fight: dict) -> dict:
+        """
+        Args:
+            fight (dict): fight row with f1, f2 (and f1_id, f2_id when the fighters have IDs) and the fight's stats
+
+        Returns:
+            dict: f*_avg_<stat>, f*_win_rate, f*_finish_rate, f*_total_fights and f*_elo before the fight
+        """
+        f1 = self.fighter(fighter_key(fight, 'f1'))
+        f2 = self.fighter(fighter_key(fight, 'f2'))
+        features = {}
+
+        f2_sums, f2_counts = ('sums', 'counts') if self.own_stats_only else ('f2_sums', 'f2_counts')
+        for prefix, state, sums, counts in (('f1', f1, 'sums', 'counts'), ('f2', f2, f2_sums, f2_counts)):
+            for i, stat in enumerate(self.stat_columns):
+                count = state[counts][i]
+                features[f'{prefix}_avg_{stat}'] = state[sums][i] / count if count else math.nan
+
+        for prefix, state in (('f1', f1), ('f2', f2)):
+            total = state['fights']
+            features[f'{prefix}_win_rate'] = state['wins'] / total if total else math.nan
+            features[f'{prefix}_finish_rate'] = state['finishes'] / total if total else math.nan
+            features[f'{prefix}_total_fights'] = total
+
+        features['f1_elo'] = f1['elo']
+        features['f2_elo'] = f2['elo']
+
+        return features
+
+    def update(self, fight: dict) -> None:
+        """
+        Adds a finished fight to both fighters' aggregates.
+
+        Args:
+            fight (dict): fight row with f1, f2 (and f1_id, f2_id when the fighters have IDs), winner, method
+                          and the fighters' stats
+        """
+        f1_key = fighter_key(fight, 'f1')
+        f2_key = fighter_key(fight, 'f2')
+        f1 = self.fighter(f1_key)
+        f2 = self.fighter(f2_key)
+        winner = fight['winner']
+
+        for prefix, state in (('f1', f1), ('f2', f2)):
+            state['fights'] += 1
+            if winner == fight[prefix]:
+                state['wins'] += 1
+                if fight['method'] in FINISH_METHODS:
+                    state['finishes'] += 1
+            for i, stat in enumerate(self.stat_columns):
+                own = _value(fight, f'{prefix}_{stat}')
+                if own is not None:
+                    state['sums'][i] += own
+                    state['counts'][i] += 1
+                f2_column = _value(fight, f'f2_{stat}')
+                if f2_column is not None:
+                    state['f2_sums'][i] += f2_column
+                    state['f2_counts'][i] += 1
+
+        if winner == fight['f1']:
+            f1_score = 1
+        elif winner == fight['f2']:
+            f1_score = 0
+        else:
+            f1_score = 0.5  # draw/no contest
+        f1['elo'], f2['elo'] = elo_update(f1['elo'], f2['elo'], f1_score, elo_k(fight['method']))
+
+        self.fighters[f1_key] = f1
+        self.fighters[f2_key] = f2
+
+    ## Appending ##
+    def append_fights(self, fights: Iterable[dict]) -> pd.DataFrame:
+        """
+        Args:
+            fights (Iterable[dict]): fight rows in fight order, all later than the fights already in the store
+
+        Returns:
+            pd.DataFrame: the fights with their pre-fight features, laid out like final_df
+        """
+        rows = []
+        for fight in fights:
+            row = dict(fight)
+            row.update(self.pre_fight_features(fight))
+            self.update(fight)
+            rows.append(row)
+
+        return pd.DataFrame(rows)
+
+    def append_event(self, event_data: dict, registry: Optional[FighterRegistry] = None) -> pd.DataFrame:
+        """
+        Args:
+            event_data (dict): event data as stored in events/
+            registry (Optional[FighterRegistry]): registry the fighters are interned in, which a state built
+                                                  from a table with fighter IDs needs; keyed by name if not given
+
+        Returns:
+            pd.DataFrame: the event's fights with their pre-fight features, empty if the event was already added
+        """
+        if event_data['event'] in self.events:
+            return pd.DataFrame()
+        rows = event_fight_rows(event_data)
+        for row in rows:
+            row['date'] = pd.to_datetime(row['date'], errors='coerce')
+            if registry is not None:
+                for corner in ('f1', 'f2'):
+                    row[f'{corner}_id'] = registry.intern(row[corner], row.get(f'{corner}_ufcstats_id'))
+        feature_df = self.append_fights(rows)
+        self.events.append(event_data['event'])
+
+        return feature_df
+
+    def refresh(self, fight_df: pd.DataFrame, fighters: Iterable, ratings: Dict) -> None:
+        """
+        Applies revised fights to the state without replaying the whole
+        history, see features.refresh_features.
+
+        Args:
+            fight_df (pd.DataFrame): revised fight table in fight order
+            fighters (Iterable): keys of the fighters whose records are recomputed from their fights
+            ratings (Dict): fighter key -> current rating, for the ratings that changed
+        """
+        fighters = {state_key(key) for key in fighters}
+        involved = np.fromiter((state_key(f1) in fighters or state_key(f2) in fighters
+                                for f1, f2 in zip(fighter_keys(fight_df, 'f1'), fighter_keys(fight_df, 'f2'))),
+                               dtype=bool, count=len(fight_df))
+        replay = FighterStateStore(self.stat_columns, self.own_stats_only)
+        for fight in fight_df[involved].to_dict('records'):
+            replay.update(fight)
+
+        for key in fighters:
+            if key not in replay.fighters:
+                self.fighters.pop(key, None)
+                continue
+            # The replay only saw these fighters' fights, so its ratings are not used
+            state = replay.fighters[key]
+            state['elo'] = self.fighter(key)['elo']
+            self.fighters[key] = state
+        for key, rating in ratings.items():
+            key = state_key(key)
+            if key in self.fighters:
+                self.fighters[key]['elo'] = rating
+
+    @classmethod
+    def rebuild(cls, fight_df: pd.DataFrame, stat_columns: List[str] = STAT_COLUMNS,
+                own_stats_only: bool = False) -> Tuple['FighterStateStore', pd.DataFrame]:
+        """
+        Builds the state from the full history.
+
+        Args:
+            fight_df (pd.DataFrame): fight table
+            stat_columns (List[str]): stats to keep running averages of
+            own_stats_only (bool): see calculate_fighter_historical_averages
+
+        Returns:
+            Tuple[FighterStateStore, pd.DataFrame]: the state after the last fight, and final_df
+        """
+        store = cls(stat_columns, own_stats_only)
+        fight_df = sort_fights(fight_df)
+        feature_df = add_additional_fighter_metrics(
+            calculate_fighter_historical_averages(fight_df, stat_columns, own_stats_only))
+
+        for fight in fight_df.to_dict('records'):
+            store.update(fight)
+        store.events = list(dict.fromkeys(fight_df['event']))
+
+        return store, feature_df
+
+
+if __name__ == '__main__':
+    import argparse
+    from fighter_ids import REGISTRY_PATH
+    from loader import compact_fight_df, load_fight_df
+    from instrument import add_profile_arguments, profiling
+
+    parser = argparse.ArgumentParser(description='Maintain the per-fighter feature state')
+    parser.add_argument('events', nargs='*', help='event JSON files to append, in date order')
+    parser.add_argument('--rebuild', action='store_true', help='rebuild the state from every event in events/')
+    parser.add_argument('--state', default=STATE_PATH, help='path of the saved state')
+    parser.add_argument('--registry', default=REGISTRY_PATH, help='path of the fighter ID registry')
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    with profiling(args.profile, args.cprofile):
+        registry = FighterRegistry.load(args.registry)
+        if args.rebuild:
+            store, _ = FighterStateStore.rebuild(compact_fight_df(load_fight_df(), registry))
+        else:
+            store = FighterStateStore.load(args.state)
+        for path in args.events:
+            with open(path, 'r') as f:
+                feature_df = store.append_event(json.load(f), registry)
+            print(f'{path}: {len(feature_df)} fights added')
+        store.save(args.state)
+        registry.save(args.registry)
@@ -0,0 +1,186 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, Hashable, List, Optional, Tuple
+from features import STAT_COLUMNS, fighter_keys, sort_fights
+
+
+class FighterHistory:
+    """
+    Per-fighter fight history for as-of queries. Every fight appears twice,
+    once from each fighter's side with their own stats in f1_<stat> and the
+    opponent's in f2_<stat>. The rows are grouped by fighter and sorted by
+    date, so a fighter's history is one contiguous slice and everything before
+    a date is found with a binary search on that slice.
+
+    This is for ad-hoc lookups, as in the notebook. The feature code needs
+    these values for every fight at once and gets them from running totals
+    instead (features.prior_means, aggregates.py), which is cheaper than a
+    query per fight.
+    """
+
+    def __init__(self, fight_df: pd.DataFrame, stat_columns: List[str] = STAT_COLUMNS):
+        """
+        Args:
+            fight_df (pd.DataFrame): fight table, keyed by fighter ID when it has f1_id/f2_id (see
+                                     loader.compact_fight_df) and by name otherwise
+            stat_columns (List[str]): stats to keep for both sides
+        """
+        fight_df = sort_fights(fight_df)
+        self.stat_columns = list(stat_columns)
+        n = len(fight_df)
+
+        f1_keys = fighter_keys(fight_df, 'f1')
+        f2_keys = fighter_keys(fight_df, 'f2')
+        codes, self.fighters = pd.factorize(np.concatenate([f1_keys, f2_keys]))
+        opponent_codes = np.concatenate([codes[n:], codes[:n]])
+        fight = np.concatenate([np.arange(n), np.arange(n)])
+
+        winner = fight_df['winner'].to_numpy(dtype=object)
+        f1_names = fight_df['f1'].to_numpy(dtype=object)
+        f2_names = fight_df['f2'].to_numpy(dtype=object)
+        f1_result = np.where(winner == f1_names, 1.0, np.where(winner == f2_names, 0.0, 0.5))
+
+        f1_stats = np.column_stack([fight_df[f'f1_{stat}'].to_numpy(dtype=float, na_value=np.nan)
+                                    for stat in stat_columns]) if stat_columns else np.empty((n, 0))
+        f2_stats = np.column_stack([fight_df[f'f2_{stat}'].to_numpy(dtype=float, na_value=np.nan)
+                                    for stat in stat_columns]) if stat_columns else np.empty((n, 0))
+
+        # Fights are in date order, so sorting by fighter then fight keeps each slice date-sorted
+        order = np.lexsort((fight, codes))
+        self.code = codes[order]
+        self.opponent = opponent_codes[order]
+        self.fight = fight[order]
+        self.date = fight_df['date'].to_numpy()[self.fight]
+        self.result = np.concatenate([f1_result, 1.0 - f1_result])[order]
+        self.own = np.concatenate([f1_stats, f2_stats])[order]
+        self.opponent_stats = np.concatenate([f2_stats, f1_stats])[order]
+        self.names = np.concatenate([f1_names, f2_names])[order]
+        self.opponent_names = np.concatenate([f2_names, f1_names])[order]
+        self.event = fight_df['event'].to_numpy(dtype=object)[self.fight]
+        self.method = fight_df['method'].to_numpy(dtype=object)[self.fight]
+        self.starts = np.searchsorted(self.code, np.arange(len(self.fighters) + 1))
+
+        self._codes: Dict[Hashable, int] = {key: code for code, key in enumerate(self.fighters)}
+        # Names resolve to the fighter's key when the table is keyed by ID
+        for keys, names in ((f1_keys, f1_names), (f2_keys, f2_names)):
+            for key, name in zip(keys, names):
+                self._codes.setdefault(name, self._codes[key])
+
+    ## Lookups ##
+    def code_of(self, fighter: Hashable) -> Optional[int]:
+        """
+        Args:
+            fighter (Hashable): fighter key (name or integer ID) or name
+
+        Returns:
+            Optional[int]: index of the fighter in the history, None if they never fought
+        """
+        return self._codes.get(fighter)
+
+    def span(self, fighter: Hashable, before: Optional[pd.Timestamp] = None, inclusive: bool = False) -> Tuple[int, int]:
+        """
+        Args:
+            fighter (Hashable): fighter key or name
+            before (Optional[pd.Timestamp]): only fights before this date, all fights if not given
+            inclusive (bool): also include fights on the date itself
+
+        Returns:
+            Tuple[int, int]: start and end of the fighter's rows, empty if they have none
+        """
+        code = self.code_of(fighter)
+        if code is None:
+            return 0, 0
+        start, end = self.starts[code], self.starts[code + 1]
+        if before is not None:
+            side = 'right' if inclusive else 'left'
+            end = start + np.searchsorted(self.date[start:end], np.datetime64(pd.Timestamp(before)), side=side)
+        return int(start), int(end)
+
+    ## Queries ##
+    def as_of(self, fighter: Hashable, date: Optional[pd.Timestamp] = None, inclusive: bool = False) -> pd.DataFrame:
+        """
+        Args:
+            fighter (Hashable): fighter key or name
+            date (Optional[pd.Timestamp]): only fights before this date, all fights if not given
+            inclusive (bool): also include fights on the date itself
+
+        Returns:
+            pd.DataFrame: the fighter's fights in date order, see rows
+        """
+        return self.rows(*self.span(fighter, date, inclusive))
+
+    def last_n(self, fighter: Hashable, n: int, date: Optional[pd.Timestamp] = None) -> pd.DataFrame:
+        """
+        Args:
+            fighter (Hashable): fighter key or name
+            n (int): number of fights
+            date (Optional[pd.Timestamp]): only fights before this date, all fights if not given
+
+        Returns:
+            pd.DataFrame: the fighter's last n fights before the date, in date order
+        """
+        start, end = self.span(fighter, date)
+        return self.rows(max(start, end - n), end)
+
+    def head_to_head(self, fighter: Hashable, opponent: Hashable, date: Optional[pd.Timestamp] = None) -> pd.DataFrame:
+        """
+        Args:
+            fighter (Hashable): fighter key or name, whose side the rows are from
+            opponent (Hashable): opponent key or name
+            date (Optional[pd.Timestamp]): only fights before this date, all fights if not given
+
+        Returns:
+            pd.DataFrame: the fights between the two in date order
+        """
+        start, end = self.span(fighter, date)
+        opponent_code = self.code_of(opponent)
+        if opponent_code is None:
+            return self.rows(0, 0)
+        matches = start + np.flatnonzero(self.opponent[start:end] == opponent_code)
+        return self.rows(matches)
+
+    def prior_means(self, fighter: Hashable, date: Optional[pd.Timestamp] = None) -> np.ndarray:
+        """
+        Args:
+            fighter (Hashable): fighter key or name
+            date (Optional[pd.Timestamp]): only fights before this date, all fights if not given
+
+        Returns:
+            np.ndarray: mean of each of the fighter's own stats before the date (NaN if there are none)
+        """
+        start, end = self.span(fighter, date)
+        own = self.own[start:end]
+        counts = np.sum(~np.isnan(own), axis=0)
+        with np.errstate(invalid='ignore'):
+            return np.where(counts > 0, np.nansum(own, axis=0) / counts, np.nan)
+
+    def rows(self, start, end: Optional[int] = None) -> pd.DataFrame:
+        """
+        Args:
+            start (int or np.ndarray): first row, or the positions of the rows when end is not given
+            end (Optional[int]): end of the rows
+
+        Returns:
+            pd.DataFrame: date, event, fight (row in the date-sorted fight table), fighter, opponent, result
+                          (1 win, 0 loss, 0.5 otherwise), method, and f1_<stat>/f2_<stat> with the fighter's
+                          own stats as f1
+        """
+        rows = slice(start, end) if end is not None else start
+        columns = {
+            'date': self.date[rows],
+            'event': self.event[rows],
+            'fight': self.fight[rows],
+            'fighter': self.names[rows],
+            'opponent': self.opponent_names[rows],
+            'result': self.result[rows],
+            'method': self.method[rows],
+        }
+        own = self.own[rows]
+        opponent = self.opponent_stats[rows]
+        for i, stat in enumerate(self.stat_columns):
+            columns[f'f1_{stat}'] = own[:, i]
+        for i, stat in enumerate(self.stat_columns):
+            columns[f'f2_{stat}'] = opponent[:, i]
+        history_df = pd.DataFrame(columns, copy=False)
+
+        return history_df
@@ -0,0 +1,199 @@
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, TypeVar
+
+F = TypeVar('F', bound=Callable)
+
+PROFILE_PATH = 'profile.json'
+
+# Instrumentation is off unless a Recorder is installed. Every timed call and
+# counter then costs one global lookup and a None check.
+_recorder = None
+
+
+class Recorder:
+    """
+    Wall-clock timings per instrumented function or section, and named
+    counters. A counter named '<timer>.<unit>' is also reported as units per
+    second of that timer, e.g. 'load_fight_df.rows' gives rows_per_sec.
+    """
+
+    def __init__(self):
+        self.timers: Dict[str, list] = {}  # name -> [calls, total, max]
+        self.counters: Dict[str, float] = {}
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add_time(self, name: str, elapsed: float) -> None:
+        with self._lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                self.timers[name] = [1, elapsed, elapsed]
+            else:
+                timer[0] += 1
+                timer[1] += elapsed
+                if elapsed > timer[2]:
+                    timer[2] = elapsed
+
+    def add_count(self, name: str, n: float) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def report(self) -> dict:
+        """
+        Returns:
+            dict: 'wall_s', 'timers' (calls, total_s, mean_ms, max_ms and <unit>_per_sec, slowest first) and
+                  'counters'
+        """
+        with self._lock:
+            timers = {name: list(values) for name, values in self.timers.items()}
+            counters = dict(self.counters)
+
+        report_timers = {}
+        for name, (calls, total, longest) in sorted(timers.items(), key=lambda item: -item[1][1]):
+            entry = {'calls': calls, 'total_s': round(total, 6), 'mean_ms': round(1000 * total / calls, 4),
+                     'max_ms': round(1000 * longest, 4)}
+            for counter, value in counters.items():
+                timer, _, unit = counter.rpartition('.')
+                if timer == name and total > 0:
+                    entry[f'{unit}_per_sec'] = round(value / total, 2)
+            report_timers[name] = entry
+
+        return {
+            'wall_s': round(time.perf_counter() - self.started, 6),
+            'timers': report_timers,
+            'counters': counters,
+        }
+
+
+## Instrumentation ##
+def timed(name: Optional[str] = None) -> Callable[[F], F]:
+    """
+    Args:
+        name (Optional[str]): name the calls are reported under, the function's name if not given
+
+    Returns:
+        Callable[[F], F]: decorator timing every call of the function while a Recorder is installed
+    """
+    def decorator(func: F) -> F:
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            recorder = _recorder
+            if recorder is None:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                recorder.add_time(label, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+@contextmanager
+def section(name: str):
+    """
+    Times the body of a with block, like timed does for a function.
+
+    Args:
+        name (str): name the block is reported under
+    """
+    recorder = _recorder
+    if recorder is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        recorder.add_time(name, time.perf_counter() - start)
+
+def count(name: str, n: float = 1) -> None:
+    """
+    Args:
+        name (str): name of the counter, e.g. 'fetch.bytes'
+        n (float): amount to add
+    """
+    recorder = _recorder
+    if recorder is not None:
+        recorder.add_count(name, n)
+
+
+## Recording ##
+def enable() -> Recorder:
+    """
+    Returns:
+        Recorder: a new recorder, which every instrumented call reports to from now on
+    """
+    global _recorder
+    _recorder = Recorder()
+    return _recorder
+
+def disable() -> Optional[Recorder]:
+    """
+    Returns:
+        Optional[Recorder]: the recorder that was installed, None if instrumentation was off
+    """
+    global _recorder
+    recorder, _recorder = _recorder, None
+    return recorder
+
+def write_report(report: dict, path: str = PROFILE_PATH) -> str:
+    """
+    Args:
+        report (dict): report from Recorder.report
+        path (str): path of the JSON report
+
+    Returns:
+        str: the written path
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(report, f, indent=4)
+    os.replace(tmp_path, path)
+
+    return path
+
+@contextmanager
+def profiling(path: Optional[str] = PROFILE_PATH, cprofile_path: Optional[str] = None):
+    """
+    Records everything run inside the with block and writes the report when
+    it ends. With cprofile_path the block also runs under cProfile, whose
+    stats file can be opened with snakeviz or turned into a flamegraph with
+    flameprof, with or without the report. Does nothing when both are None.
+
+    Args:
+        path (Optional[str]): path of the JSON report, None to not record one
+        cprofile_path (Optional[str]): path of the cProfile stats file, None to skip cProfile
+    """
+    recorder = enable() if path is not None else None
+    profiler = cProfile.Profile() if cprofile_path else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield recorder
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(cprofile_path)
+        if recorder is not None:
+            disable()
+            write_report(recorder.report(), path)
+
+def add_profile_arguments(parser) -> None:
+    """
+    Args:
+        parser (argparse.ArgumentParser): command line parser to add --profile and --cprofile to
+    """
+    parser.add_argument('--profile', metavar='PROFILE_PATH', nargs='?', const=PROFILE_PATH, default=None,
+                        help='write timings and counters of the run to a JSON report')
+    parser.add_argument('--cprofile', metavar='STATS_PATH', default=None,
+                        help='write cProfile stats (snakeviz, flameprof), with or without --profile')
@@ -0,0 +1,264 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+QUEUE_PATH = 'crawl_queue.db'
+LEASE_SECONDS = 120
+MAX_ATTEMPTS = 3
+
+PENDING = 'pending'
+IN_PROGRESS = 'in_progress'
+DONE = 'done'
+FAILED = 'failed'
+STATES = [PENDING, IN_PROGRESS, DONE, FAILED]
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    url TEXT NOT NULL,
+    parent TEXT,
+    position INTEGER NOT NULL DEFAULT 0,
+    priority INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    owner TEXT,
+    lease_expires REAL,
+    result TEXT,
+    error TEXT,
+    updated REAL NOT NULL,
+    UNIQUE (kind, url)
+);
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (state, priority, id);
+CREATE INDEX IF NOT EXISTS jobs_parent ON jobs (parent, kind);
+'''
+
+
+class Job(NamedTuple):
+    id: int
+    kind: str
+    url: str
+    parent: Optional[str]
+    position: int
+    attempts: int
+
+
+def worker_name() -> str:
+    """
+    Returns:
+        str: name of the calling thread, unique across hosts sharing a queue
+    """
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+
+
+class JobQueue:
+    """
+    Durable queue of crawl jobs in a SQLite file. Workers in any number of
+    threads, processes, or hosts sharing the file claim jobs under a lease;
+    a job whose worker died is handed out again once its lease expires, and
+    done jobs keep their result, so a restarted crawl carries on from where
+    it stopped. Each thread needs its own JobQueue (its own connection).
+
+    WAL journaling lets readers and the writer work at the same time, but only
+    works for processes on one host. Hosts sharing the file over a network
+    filesystem need journal_mode='DELETE' and a filesystem with working locks.
+    """
+
+    def __init__(self, path: str = QUEUE_PATH, lease: float = LEASE_SECONDS, max_attempts: int = MAX_ATTEMPTS,
+                 journal_mode: str = 'WAL'):
+        """
+        Args:
+            path (str): path of the queue file, created if missing
+            lease (float): seconds a claimed job stays reserved for its worker
+            max_attempts (int): claims of a job before a failure is final
+            journal_mode (str): SQLite journal mode, 'WAL' or 'DELETE'
+        """
+        self.path = path
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.owner = worker_name()
+        # Autocommit, transactions are opened explicitly where needed
+        self._db = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self._db.execute(f'PRAGMA journal_mode={journal_mode}')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self._db.close()
+
+    ## Producing ##
+    def add(self, kind: str, urls: Iterable[str], parent: Optional[str] = None, priority: int = 0) -> int:
+        """
+        Args:
+            kind (str): kind of job, e.g. 'event'
+            urls (Iterable[str]): one job per URL, kept in order as the job's position
+            parent (Optional[str]): URL of the job these were found by
+            priority (int): jobs with a lower priority are claimed first
+
+        Returns:
+            int: number of jobs added, URLs already queued with this kind are left as they are
+        """
+        now = time.time()
+        rows = [(kind, url, parent, position, priority, now) for position, url in enumerate(urls)]
+        with self._transaction():
+            before = self._db.total_changes
+            self._db.executemany('INSERT OR IGNORE INTO jobs (kind, url, parent, position, priority, updated) '
+                                 'VALUES (?, ?, ?, ?, ?, ?)', rows)
+            return self._db.total_changes - before
+
+    def requeue(self, kind: str, url: str) -> None:
+        """
+        Args:
+            kind (str): kind of job
+            url (str): URL of a job to run again even though it is done or failed
+        """
+        self._db.execute("UPDATE jobs SET state = 'pending', attempts = 0, owner = NULL, error = NULL, updated = ? "
+                         'WHERE kind = ? AND url = ?', (time.time(), kind, url))
+
+    def clear(self) -> None:
+        """
+        Removes every job, to start a crawl over.
+        """
+        self._db.execute('DELETE FROM jobs')
+
+    def retry_failed(self) -> int:
+        """
+        Returns:
+            int: number of failed jobs put back in the queue
+        """
+        cursor = self._db.execute("UPDATE jobs SET state = 'pending', attempts = 0, updated = ? WHERE state = 'failed'",
+                                  (time.time(),))
+        return cursor.rowcount
+
+    ## Consuming ##
+    def claim(self) -> Optional[Job]:
+        """
+        Returns:
+            Optional[Job]: the next pending job, or one whose lease expired, reserved for this worker; None if
+                           there is none right now
+        """
+        now = time.time()
+        with self._transaction():
+            row = self._db.execute(
+                'SELECT id, kind, url, parent, position, attempts FROM jobs '
+                "WHERE state = 'pending' OR (state = 'in_progress' AND lease_expires < ?) "
+                'ORDER BY priority, id LIMIT 1', (now,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE jobs SET state = 'in_progress', owner = ?, lease_expires = ?, "
+                             'attempts = attempts + 1, updated = ? WHERE id = ?',
+                             (self.owner, now + self.lease, now, row[0]))
+        job = Job(*row)
+        return job._replace(attempts=job.attempts + 1)
+
+    def complete(self, job: Job, result=None) -> bool:
+        """
+        Args:
+            job (Job): job claimed by this worker
+            result: JSON-serializable result stored with the job
+
+        Returns:
+            bool: False if the lease had been lost to another worker, whose result is kept instead
+        """
+        cursor = self._db.execute("UPDATE jobs SET state = 'done', result = ?, error = NULL, owner = NULL, updated = ? "
+                                  "WHERE id = ? AND owner = ? AND state = 'in_progress'",
+                                  (json.dumps(result), time.time(), job.id, self.owner))
+        return cursor.rowcount == 1
+
+    def fail(self, job: Job, error: str) -> str:
+        """
+        Args:
+            job (Job): job claimed by this worker
+            error (str): what went wrong
+
+        Returns:
+            str: the job's new state, pending to be retried or failed once max_attempts is reached
+        """
+        state = FAILED if job.attempts >= self.max_attempts else PENDING
+        self._db.execute('UPDATE jobs SET state = ?, error = ?, owner = NULL, updated = ? '
+                         "WHERE id = ? AND owner = ? AND state = 'in_progress'",
+                         (state, error, time.time(), job.id, self.owner))
+        return state
+
+    ## Queries ##
+    def results(self, kind: str, parent: str) -> List[Optional[dict]]:
+        """
+        Args:
+            kind (str): kind of job
+            parent (str): URL of the parent job
+
+        Returns:
+            List[Optional[dict]]: results of the parent's jobs in position order, None for jobs not done
+        """
+        rows = self._db.execute('SELECT state, result FROM jobs WHERE kind = ? AND parent = ? ORDER BY position',
+                                (kind, parent)).fetchall()
+        return [json.loads(result) if state == DONE else None for state, result in rows]
+
+    def result(self, kind: str, url: str) -> Optional[dict]:
+        """
+        Args:
+            kind (str): kind of job
+            url (str): URL of the job
+
+        Returns:
+            Optional[dict]: result of the job, None if it is not done
+        """
+        row = self._db.execute("SELECT result FROM jobs WHERE kind = ? AND url = ? AND state = 'done'",
+                               (kind, url)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def remaining(self, kind: str, parent: str) -> int:
+        """
+        Args:
+            kind (str): kind of job
+            parent (str): URL of the parent job
+
+        Returns:
+            int: the parent's jobs of this kind that are not done yet
+        """
+        return self._db.execute("SELECT COUNT(*) FROM jobs WHERE kind = ? AND parent = ? AND state != 'done'",
+                                (kind, parent)).fetchone()[0]
+
+    def counts(self) -> Dict[str, Dict[str, int]]:
+        """
+        Returns:
+            Dict[str, Dict[str, int]]: kind -> state -> number of jobs
+        """
+        counts: Dict[str, Dict[str, int]] = {}
+        for kind, state, count in self._db.execute('SELECT kind, state, COUNT(*) FROM jobs GROUP BY kind, state'):
+            counts.setdefault(kind, dict.fromkeys(STATES, 0))[state] = count
+        return counts
+
+    def failures(self) -> List[Tuple[str, str, str]]:
+        """
+        Returns:
+            List[Tuple[str, str, str]]: (kind, url, error) of every job that ran out of attempts
+        """
+        return self._db.execute("SELECT kind, url, error FROM jobs WHERE state = 'failed' ORDER BY id").fetchall()
+
+    def is_drained(self) -> bool:
+        """
+        Returns:
+            bool: True if no job is pending or in progress
+        """
+        row = self._db.execute("SELECT 1 FROM jobs WHERE state IN ('pending', 'in_progress') LIMIT 1").fetchone()
+        return row is None
+
+    def _transaction(self):
+        return _Transaction(self._db)
+
+
+class _Transaction:
+    # BEGIN IMMEDIATE takes the write lock up front, so two workers never claim the same job
+    def __init__(self, db: sqlite3.Connection):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute('BEGIN IMMEDIATE')
+
+    def __exit__(self, exc_type, exc, tb):
+        self.db.execute('COMMIT' if exc_type is None else 'ROLLBACK')
@@ -0,0 +1,367 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from fighter_ids import FighterRegistry
+from instrument import count, timed
+
+EVENTS_FOLDER = 'events'
+BUNDLE_PATH = 'events.ndjson'
+
+# Fight table columns taken from the event and fight, before the f1_/f2_ stats
+FIGHT_COLUMNS = ['event', 'date', 'fight_name', 'f1', 'f2', 'f1_ufcstats_id', 'f2_ufcstats_id',
+                 'winner', 'method', 'fight_length', 'score']
+FIGHT_KEYS = {
+    'fight_name': 'name',
+    'f1': 'fighter1',
+    'f2': 'fighter2',
+    'f1_ufcstats_id': 'fighter1_id',
+    'f2_ufcstats_id': 'fighter2_id',
+    'winner': 'winner',
+    'method': 'method',
+    'fight_length': 'fight_length',
+    'score': 'score',
+}
+
+# Event files handed to each worker at a time
+CHUNKS_PER_PROCESS = 4
+
+# Nullable integer types of the counting stats, wide enough for a 25 minute fight
+STAT_DTYPES: Dict[str, str] = {
+    'kd': 'Int8',
+    'sig_str_landed': 'Int16',
+    'sig_str_att': 'Int16',
+    'str_landed': 'Int16',
+    'str_att': 'Int16',
+    'td_comp': 'Int8',
+    'td_att': 'Int8',
+    'sub_att': 'Int8',
+    'ctrl_time': 'Int16',
+}
+
+def event_fight_rows(data: dict) -> List[dict]:
+    """
+    Args:
+        data (dict): event data as stored in events/, see scraper.get_event_data
+
+    Returns:
+        List[dict]: one row per fight with the fighters' stats prefixed f1_/f2_
+    """
+    fight_rows = []
+    date = data.get("date")
+    event = data.get("event")
+
+    for key, fight in data.items():
+        if isinstance(fight, dict) and 'fighter1' in fight and 'fighter2' in fight:
+            f1_data = fight.get('fighter1_fight_data') or {}
+            f2_data = fight.get('fighter2_fight_data') or {}
+
+            row = {
+                'event': event,
+                'date': date,
+                'fight_name': fight.get('name'),
+                'f1': fight.get('fighter1'),
+                'f2': fight.get('fighter2'),
+                'f1_ufcstats_id': fight.get('fighter1_id'),
+                'f2_ufcstats_id': fight.get('fighter2_id'),
+                'winner': fight.get('winner'),
+                'method': fight.get('method'),
+                'fight_length': fight.get('fight_length'),
+                'score': fight.get('score'),
+            }
+
+            # Add all fighter1 stats with prefix f1_
+            for stat, value in f1_data.items():
+                row[f'f1_{stat}'] = value
+
+            # Add all fighter2 stats with prefix f2_
+            for stat, value in f2_data.items():
+                row[f'f2_{stat}'] = value
+
+            fight_rows.append(row)
+
+    return fight_rows
+
+@timed()
+def load_fight_df(path: str = EVENTS_FOLDER, processes: int = 1) -> pd.DataFrame:
+    """
+    Builds the fight table straight into columns: the events are parsed in
+    chunks, across worker processes when processes > 1, and each chunk's
+    stats are copied into preallocated arrays.
+
+    The workers only pay off with as many free cores. Parsing takes about
+    0.1 ms per event. On one core, 733 events load in 85 ms serially and
+    in 110 ms with 2 workers: 3 ms to start each worker and about 0.025 ms
+    per event to hand out the files and send the columns back. With 2 free
+    cores half the parse time, 0.05 ms per event, is saved instead, so the
+    pool is estimated to win from about 250 events on; with fewer events,
+    or no free cores, leave processes at 1.
+
+    Args:
+        path (str): folder with one JSON file per event, or a bundle written by write_bundle
+        processes (int): worker processes the events are parsed in, 1 to parse them in this process
+
+    Returns:
+        pd.DataFrame: one row per fight, dates parsed, same columns as event_fight_rows
+    """
+    if os.path.isfile(path):
+        with open(path, 'r') as f:
+            sources = [line for line in f if line.strip()]
+        parse = _bundle_chunk_columns
+    else:
+        sources = [os.path.join(path, filename) for filename in sorted(os.listdir(path))
+                   if filename.endswith('.json')]
+        parse = _file_chunk_columns
+
+    chunks = _split_chunks(sources, processes * CHUNKS_PER_PROCESS if processes > 1 else 1)
+    if processes > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            parts = list(executor.map(parse, chunks))
+    else:
+        parts = [parse(chunk) for chunk in chunks]
+
+    fight_df = _assemble_columns(parts)
+    fight_df['date'] = pd.to_datetime(fight_df['date'], errors='coerce')
+    count('load_fight_df.rows', len(fight_df))
+
+    return fight_df
+
+@timed()
+def event_fight_columns(events: Iterable[dict]) -> Tuple[int, Dict[str, list], Dict[str, np.ndarray]]:
+    """
+    Args:
+        events (Iterable[dict]): event data as stored in events/
+
+    Returns:
+        Tuple[int, Dict[str, list], Dict[str, np.ndarray]]: number of fights, the FIGHT_COLUMNS values and
+                                                           the f1_/f2_ stats as float arrays (NaN if missing),
+                                                           in the order the stats were first seen
+    """
+    columns = {column: [] for column in FIGHT_COLUMNS}
+    stat_rows: Dict[str, Tuple[list, list]] = {}
+    n = 0
+
+    for data in events:
+        date = data.get('date')
+        event = data.get('event')
+        for fight in data.values():
+            if not (isinstance(fight, dict) and 'fighter1' in fight and 'fighter2' in fight):
+                continue
+            columns['event'].append(event)
+            columns['date'].append(date)
+            for column, key in FIGHT_KEYS.items():
+                columns[column].append(fight.get(key))
+
+            for prefix, key in (('f1', 'fighter1_fight_data'), ('f2', 'fighter2_fight_data')):
+                for stat, value in (fight.get(key) or {}).items():
+                    rows, values = stat_rows.setdefault(f'{prefix}_{stat}', ([], []))
+                    rows.append(n)
+                    values.append(value)
+            n += 1
+
+    stats = {}
+    for column, (rows, values) in stat_rows.items():
+        stats[column] = np.full(n, np.nan)
+        stats[column][rows] = np.asarray(values, dtype=float)
+
+    return n, columns, stats
+
+def _file_chunk_columns(paths: List[str]) -> Tuple[int, Dict[str, list], Dict[str, np.ndarray]]:
+    return event_fight_columns(_read_event(file_path) for file_path in paths)
+
+def _bundle_chunk_columns(lines: List[str]) -> Tuple[int, Dict[str, list], Dict[str, np.ndarray]]:
+    return event_fight_columns(_parse_event(line) for line in lines)
+
+@timed('read_event')
+def _read_event(file_path: str) -> dict:
+    with open(file_path, 'r') as f:
+        return _parse_event(f.read())
+
+@timed('json_load')
+def _parse_event(text: str) -> dict:
+    count('json_load.bytes', len(text))
+    return json.loads(text)
+
+def _split_chunks(items: list, n_chunks: int) -> List[list]:
+    size = -(-len(items) // max(n_chunks, 1)) or 1
+    return [items[i:i + size] for i in range(0, len(items), size)] or [[]]
+
+def _assemble_columns(parts: List[Tuple[int, Dict[str, list], Dict[str, np.ndarray]]]) -> pd.DataFrame:
+    total = sum(n for n, _, _ in parts)
+    columns = {column: [] for column in FIGHT_COLUMNS}
+    stat_columns = dict.fromkeys(column for _, _, stats in parts for column in stats)
+    stats = {column: np.full(total, np.nan) for column in stat_columns}
+
+    start = 0
+    for n, part_columns, part_stats in parts:
+        for column, values in part_columns.items():
+            columns[column].extend(values)
+        for column, values in part_stats.items():
+            stats[column][start:start + n] = values
+        start += n
+
+    columns.update(stats)
+    return pd.DataFrame(columns)
+
+def iter_events(path: str = EVENTS_FOLDER) -> Iterator[dict]:
+    """
+    Args:
+        path (str): folder with one JSON file per event, or a bundle written by write_bundle
+
+    Returns:
+        Iterator[dict]: the events, in filename order
+    """
+    if os.path.isfile(path):
+        yield from iter_bundle(path)
+        return
+    for filename in sorted(os.listdir(path)):
+        if filename.endswith('.json'):
+            yield _read_event(os.path.join(path, filename))
+
+## Rounds ##
+def load_round_df(path: str = EVENTS_FOLDER) -> pd.DataFrame:
+    """
+    Builds a table of every fighter's stats in every round from the round_stats
+    arrays saved with each fight (see scraper.build_fight_tables). Fights
+    scraped without them are left out.
+
+    Args:
+        path (str): folder with one JSON file per event, or a bundle written by write_bundle
+
+    Returns:
+        pd.DataFrame: one row per fighter per round with event, date, fight_name, corner (1 or 2), fighter,
+                      fighter_id, round and the scraper.ROUND_COLUMNS stats as int16
+    """
+    # Imported here so loading the fight table does not pull in the HTTP stack
+    from scraper import ROUND_COLUMNS
+
+    columns = {column: [] for column in ('event', 'date', 'fight_name', 'corner', 'fighter', 'fighter_id', 'round')}
+    blocks = []
+    for data in iter_events(path):
+        for fight in data.values():
+            if not (isinstance(fight, dict) and fight.get('round_stats')):
+                continue
+            for corner in (1, 2):
+                rounds = fight['round_stats'][f'fighter{corner}']
+                blocks.append(np.asarray(rounds, dtype=np.int16).reshape(-1, len(ROUND_COLUMNS)))
+                n = len(rounds)
+                columns['event'].extend([data.get('event')] * n)
+                columns['date'].extend([data.get('date')] * n)
+                columns['fight_name'].extend([fight.get('name')] * n)
+                columns['corner'].extend([corner] * n)
+                columns['fighter'].extend([fight.get(f'fighter{corner}')] * n)
+                columns['fighter_id'].extend([fight.get(f'fighter{corner}_id')] * n)
+                columns['round'].extend(range(1, n + 1))
+
+    stats = np.concatenate(blocks) if blocks else np.empty((0, len(ROUND_COLUMNS)), dtype=np.int16)
+    round_df = pd.DataFrame(columns)
+    round_df['date'] = pd.to_datetime(round_df['date'], errors='coerce')
+    round_df['corner'] = round_df['corner'].astype(np.int8)
+    round_df['round'] = round_df['round'].astype(np.int8)
+    stat_df = pd.DataFrame(stats, columns=ROUND_COLUMNS, index=round_df.index)
+
+    return pd.concat([round_df, stat_df], axis=1)
+
+## Bundle ##
+def write_bundle(folder_path: str = EVENTS_FOLDER, bundle_path: str = BUNDLE_PATH) -> int:
+    """
+    Consolidates the event files into one newline-delimited JSON file, one
+    compact event per line in filename order, which can be streamed with
+    iter_bundle or loaded with load_fight_df.
+
+    Args:
+        folder_path (str): folder with one JSON file per event
+        bundle_path (str): path of the bundle
+
+    Returns:
+        int: number of events written
+    """
+    count = 0
+    tmp_path = bundle_path + '.tmp'
+    with open(tmp_path, 'w') as bundle:
+        for filename in sorted(os.listdir(folder_path)):
+            if filename.endswith('.json'):
+                with open(os.path.join(folder_path, filename), 'r') as f:
+                    data = json.load(f)
+                bundle.write(json.dumps(data, separators=(',', ':')) + '\n')
+                count += 1
+    os.replace(tmp_path, bundle_path)
+
+    return count
+
+def iter_bundle(bundle_path: str = BUNDLE_PATH) -> Iterator[dict]:
+    """
+    Args:
+        bundle_path (str): path of a bundle written by write_bundle
+
+    Returns:
+        Iterator[dict]: the events, read one line at a time
+    """
+    with open(bundle_path, 'r') as f:
+        for line in f:
+            if line.strip():
+                yield _parse_event(line)
+
+def compact_fight_df(fight_df: pd.DataFrame, registry: Optional[FighterRegistry] = None) -> pd.DataFrame:
+    """
+    Adds integer fighter IDs and converts the fight table to compact dtypes:
+    categoricals for the event, method and fighter name columns and nullable
+    small integers for the counting stats.
+
+    Args:
+        fight_df (pd.DataFrame): fight table from load_fight_df
+        registry (Optional[FighterRegistry]): registry the fighters are interned in, a new one if not given
+
+    Returns:
+        pd.DataFrame: the compact fight table with f1_id and f2_id columns
+    """
+    if registry is None:
+        registry = FighterRegistry()
+    fight_df = fight_df.copy()
+
+    for corner in ('f1', 'f2'):
+        ufcstats_ids = fight_df[f'{corner}_ufcstats_id'] if f'{corner}_ufcstats_id' in fight_df else None
+        fight_df[f'{corner}_id'] = registry.intern_many(fight_df[corner], ufcstats_ids)
+
+    # One set of categories for every name column so they stay comparable
+    names = pd.concat([fight_df['f1'], fight_df['f2'], fight_df['winner']]).dropna().unique()
+    name_dtype = pd.CategoricalDtype(sorted(names))
+    for column in ('f1', 'f2', 'winner'):
+        fight_df[column] = fight_df[column].astype(name_dtype)
+    for column in ('event', 'method', 'f1_ufcstats_id', 'f2_ufcstats_id'):
+        if column in fight_df:
+            fight_df[column] = fight_df[column].astype('category')
+
+    for stat, dtype in STAT_DTYPES.items():
+        for corner in ('f1', 'f2'):
+            column = f'{corner}_{stat}'
+            if column in fight_df:
+                fight_df[column] = fight_df[column].astype(dtype)
+    fight_df['fight_length'] = fight_df['fight_length'].astype('Int16')
+
+    return fight_df
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+    from instrument import add_profile_arguments, profiling
+
+    parser = argparse.ArgumentParser(description='Load the fight table, or bundle events/ into one NDJSON file')
+    parser.add_argument('--path', default=EVENTS_FOLDER, help='events folder or bundle to load')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='worker processes the events are parsed in, only faster with free cores')
+    parser.add_argument('--bundle', metavar='BUNDLE_PATH', nargs='?', const=BUNDLE_PATH,
+                        help='write the events folder to a bundle instead of loading it')
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    with profiling(args.profile, args.cprofile):
+        if args.bundle:
+            print(f'wrote {write_bundle(args.path, args.bundle)} events to {args.bundle}')
+        else:
+            start = time.perf_counter()
+            fight_df = load_fight_df(args.path, args.processes)
+            print(f'loaded {len(fight_df)} fights in {time.perf_counter() - start:.3f}s')
@@ -1,47 +1,39 @@
-import pandas as pd 
-import json 
-import os 
-
-folder_path = 'events'  
-fight_rows = []
-
-# Loop through all JSON files
-for filename in os.listdir(folder_path):
-    if filename.endswith('.json'):
-        with open(os.path.join(folder_path, filename), 'r') as f:
-            data = json.load(f)
-
-        date = data.get("date")
-        event = data.get("event")
-
-        for key, fight in data.items():
-            if isinstance(fight, dict) and 'fighter1' in fight and 'fighter2' in fight:
-                f1_data = fight.get('fighter1_fight_data') or {}
-                f2_data = fight.get('fighter2_fight_data') or {}
-
-                row = {
-                    'event': event,
-                    'date': date,
-                    'fight_name': fight.get('name'),
-                    'f1': fight.get('fighter1'),
-                    'f2': fight.get('fighter2'),
-                    'winner': fight.get('winner'),
-                    'method': fight.get('method'),
-                    'fight_length': fight.get('fight_length'),
-                    'score': fight.get('score'),
-                }
-
-                # Add all fighter1 stats with prefix f1_
-                for stat, value in f1_data.items():
-                    row[f'f1_{stat}'] = value
-
-                # Add all fighter2 stats with prefix f2_
-                for stat, value in f2_data.items():
-                    row[f'f2_{stat}'] = value
-
-                fight_rows.append(row)
-
-# Create DataFrame
-df = pd.DataFrame(fight_rows)
-
-
+from pipeline import STAGE_NAMES, STATE_PATH, default_config, run_pipeline
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+    from instrument import add_profile_arguments, profiling
+
+    defaults = default_config()
+    parser = argparse.ArgumentParser(description='Run the pipeline stages, skipping those that are up to date')
+    parser.add_argument('stages', nargs='*', metavar='STAGE',
+                        help=f'stages to run, some of {", ".join(STAGE_NAMES)}; all by default')
+    parser.add_argument('--skip', nargs='+', choices=STAGE_NAMES, default=[], help='stages to leave out')
+    parser.add_argument('--force', action='store_true', help='run the stages even if they are up to date')
+    parser.add_argument('--state', default=STATE_PATH, help='path of the pipeline state')
+    parser.add_argument('--events', default=defaults['events'], help='folder of the event files')
+    parser.add_argument('--dataset', default=defaults['dataset'], help='folder of the Parquet datasets')
+    parser.add_argument('--own-stats-only', action='store_true', help='see features.calculate_fighter_historical_averages')
+    parser.add_argument('--revalidate', action='store_true', help='also re-check events already crawled')
+    parser.add_argument('--workers', type=int, default=None, help='maximum number of requests in flight')
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    for name in args.stages:
+        if name not in STAGE_NAMES:
+            parser.error(f'unknown stage {name!r}, expected some of {", ".join(STAGE_NAMES)}')
+
+    stages = [name for name in (args.stages or STAGE_NAMES) if name not in args.skip]
+    config = {
+        'events': args.events,
+        'dataset': args.dataset,
+        'own_stats_only': args.own_stats_only,
+        'revalidate': args.revalidate,
+        'workers': args.workers,
+    }
+    with profiling(args.profile, args.cprofile):
+        start = time.perf_counter()
+        statuses = run_pipeline(stages, config, args.force, args.state)
+        ran = [name for name, status in statuses.items() if status == 'ran']
+        print(f'{len(ran)} of {len(statuses)} stages ran in {time.perf_counter() - start:.2f}s')
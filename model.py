@@ -0,0 +1,136 @@
+import json
+import os
+import numpy as np
+from typing import List, Optional
+
+MODEL_PATH = 'model.json'
+
+# Features the notebook trains on (keep_columns without the label)
+FEATURE_COLUMNS = [
+    'f1_elo', 'f2_elo',
+    'f1_avg_kd', 'f1_avg_sig_str_landed', 'f1_avg_str_landed', 'f1_avg_td_comp', 'f1_avg_sub_att', 'f1_avg_ctrl_time',
+    'f2_avg_kd', 'f2_avg_sig_str_landed', 'f2_avg_str_landed', 'f2_avg_td_comp', 'f2_avg_sub_att', 'f2_avg_ctrl_time',
+    'f1_win_rate', 'f1_finish_rate',
+    'f2_win_rate', 'f2_finish_rate',
+]
+
+
+class LogisticModel:
+    """
+    Logistic regression on mean-imputed, standardized features, fitted with
+    Newton's method and serialized to JSON so predicting needs only numpy.
+    It minimizes the same objective as scikit-learn's
+    LogisticRegression(class_weight='balanced', C=1 / l2).
+    """
+
+    def __init__(self, columns: List[str] = FEATURE_COLUMNS, l2: float = 1.0):
+        """
+        Args:
+            columns (List[str]): names of the feature columns, in order
+            l2 (float): inverse of scikit-learn's C, the L2 penalty on the coefficients
+        """
+        self.columns = list(columns)
+        self.l2 = l2
+        self.means = np.zeros(len(columns))
+        self.scales = np.ones(len(columns))
+        self.coef = np.zeros(len(columns))
+        self.intercept = 0.0
+
+    def fit(self, X: np.ndarray, y: np.ndarray, class_weight: Optional[str] = 'balanced',
+            max_iter: int = 50, tol: float = 1e-8) -> 'LogisticModel':
+        """
+        Args:
+            X (np.ndarray): (fights, columns) features, NaN where missing
+            y (np.ndarray): 1 if fighter 1 won, 0 otherwise
+            class_weight (Optional[str]): 'balanced' to weight both classes equally, None for equal sample weights
+            max_iter (int): maximum number of Newton steps
+            tol (float): stop once no coefficient moves more than this
+
+        Returns:
+            LogisticModel: self
+        """
+        X = np.asarray(X, dtype=float)
+        y = np.asarray(y, dtype=float)
+        if len(np.unique(y)) < 2:
+            raise ValueError('y needs both outcomes to fit a model')
+        self.means = np.nanmean(X, axis=0)
+        self.means = np.where(np.isnan(self.means), 0.0, self.means)
+        self.scales = np.where(np.isnan(X), self.means, X).std(axis=0)
+        self.scales = np.where(self.scales == 0, 1.0, self.scales)
+        Z = np.column_stack([self._standardize(X), np.ones(len(X))])
+
+        weights = np.ones(len(y))
+        if class_weight == 'balanced':
+            for label in (0.0, 1.0):
+                count = np.sum(y == label)
+                if count:
+                    weights[y == label] = len(y) / (2 * count)
+
+        penalty = np.full(Z.shape[1], self.l2)
+        penalty[-1] = 0.0  # intercept is not penalized
+        beta = np.zeros(Z.shape[1])
+        for _ in range(max_iter):
+            p = 1 / (1 + np.exp(-Z @ beta))
+            gradient = Z.T @ (weights * (p - y)) + penalty * beta
+            hessian = (Z * (weights * p * (1 - p))[:, None]).T @ Z + np.diag(penalty)
+            step = np.linalg.solve(hessian, gradient)
+            beta -= step
+            if np.max(np.abs(step)) < tol:
+                break
+
+        self.coef = beta[:-1]
+        self.intercept = float(beta[-1])
+        return self
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """
+        Args:
+            X (np.ndarray): (fights, columns) features, NaN where missing
+
+        Returns:
+            np.ndarray: probability that fighter 1 wins each fight
+        """
+        X = np.atleast_2d(np.asarray(X, dtype=float))
+        return 1 / (1 + np.exp(-(self._standardize(X) @ self.coef + self.intercept)))
+
+    def _standardize(self, X: np.ndarray) -> np.ndarray:
+        X = np.where(np.isnan(X), self.means, X)
+        return (X - self.means) / self.scales
+
+    ## Persistence ##
+    def save(self, path: str = MODEL_PATH) -> None:
+        """
+        Args:
+            path (str): path to save the model to
+        """
+        data = {
+            'columns': self.columns,
+            'l2': self.l2,
+            'means': self.means.tolist(),
+            'scales': self.scales.tolist(),
+            'coef': self.coef.tolist(),
+            'intercept': self.intercept,
+        }
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=4)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = MODEL_PATH) -> 'LogisticModel':
+        """
+        Args:
+            path (str): path of the saved model
+
+        Returns:
+            LogisticModel: the saved model
+        """
+        with open(path, 'r') as f:
+            data = json.load(f)
+
+        model = cls(data['columns'], data['l2'])
+        model.means = np.asarray(data['means'])
+        model.scales = np.asarray(data['scales'])
+        model.coef = np.asarray(data['coef'])
+        model.intercept = data['intercept']
+        return model
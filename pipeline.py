@@ -0,0 +1,391 @@
+import ast
+import hashlib
+import inspect
+import json
+import os
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+# Only the standard library is imported at startup, so a run that skips every stage never imports pandas.
+# Each stage imports what it needs when it runs.
+
+STATE_PATH = 'pipeline_state.json'
+EVENTS_FOLDER = 'events'
+DATASET_FOLDER = 'dataset'
+FIGHTER_STATE_PATH = 'fighter_state.json'
+REGISTRY_PATH = 'fighter_ids.json'
+MODEL_PATH = 'model.json'
+SNAPSHOT_FOLDER = 'snapshot'
+
+# The stages' source files are found next to this one, wherever the pipeline is run from
+CODE_FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+STAGE_NAMES = ['crawl', 'load', 'features', 'ratings', 'train', 'predict']
+MISSING = 'missing'
+
+
+class Stage(NamedTuple):
+    name: str
+    inputs: List[str]   # files and folders the stage reads
+    outputs: List[str]  # files and folders the stage writes
+    modules: List[str]  # source files the stage's run function imports, see module_closure
+    run: Callable[[dict], None]
+    always_run: bool = False
+
+
+## Hashing ##
+class FileHashes:
+    """
+    Content hashes of files, remembered with the size and modification time
+    they were computed at. A file whose size and mtime are unchanged is not
+    read again, so hashing an unchanged tree costs one stat per file.
+    """
+
+    def __init__(self, known: Optional[Dict[str, list]] = None):
+        """
+        Args:
+            known (Optional[Dict[str, list]]): path -> [size, mtime_ns, sha1] from an earlier run
+        """
+        self.known = dict(known or {})
+
+    def file(self, path: str) -> str:
+        """
+        Args:
+            path (str): path of a file
+
+        Returns:
+            str: sha1 of the file's content
+        """
+        stat = os.stat(path)
+        entry = self.known.get(path)
+        if entry is None or entry[0] != stat.st_size or entry[1] != stat.st_mtime_ns:
+            digest = hashlib.sha1()
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+            entry = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+            self.known[path] = entry
+
+        return entry[2]
+
+    def existing(self) -> Dict[str, list]:
+        """
+        Returns:
+            Dict[str, list]: the remembered hashes of files that still exist
+        """
+        return {path: entry for path, entry in self.known.items() if os.path.isfile(path)}
+
+    def path(self, path: str) -> str:
+        """
+        Args:
+            path (str): path of a file or folder
+
+        Returns:
+            str: sha1 of a file's content, or of the names and contents of every file under a folder;
+                 MISSING if nothing is there
+        """
+        if os.path.isfile(path):
+            return self.file(path)
+        if not os.path.isdir(path):
+            return MISSING
+
+        digest = hashlib.sha1()
+        for folder, folders, filenames in os.walk(path):
+            folders.sort()
+            for filename in sorted(filenames):
+                file_path = os.path.join(folder, filename)
+                digest.update(os.path.relpath(file_path, path).encode('utf-8'))
+                digest.update(self.file(file_path).encode('ascii'))
+
+        return digest.hexdigest()
+
+
+def local_imports(module: str, hashes: FileHashes, known: Dict[str, list]) -> List[str]:
+    """
+    Args:
+        module (str): source file in CODE_FOLDER, e.g. 'features.py'
+        hashes (FileHashes): hashes of the files seen so far
+        known (Dict[str, list]): module -> [sha1, imports] from an earlier run, updated in place
+
+    Returns:
+        List[str]: the source files in CODE_FOLDER the module imports anywhere in its body, including the
+                   imports inside functions but not those of its command line block, which stages never run
+    """
+    digest = hashes.file(os.path.join(CODE_FOLDER, module))
+    entry = known.get(module)
+    if entry is None or entry[0] != digest:
+        with open(os.path.join(CODE_FOLDER, module), 'r') as f:
+            tree = ast.parse(f.read(), filename=module)
+        tree.body = [node for node in tree.body if not _is_main_block(node)]
+        names = set()
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names.update(alias.name.split('.')[0] for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                names.add(node.module.split('.')[0])
+        imports = sorted(f'{name}.py' for name in names if os.path.isfile(os.path.join(CODE_FOLDER, f'{name}.py')))
+        entry = [digest, imports]
+        known[module] = entry
+
+    return entry[1]
+
+def _is_main_block(node: ast.stmt) -> bool:
+    # if __name__ == '__main__':
+    return (isinstance(node, ast.If) and isinstance(node.test, ast.Compare)
+            and isinstance(node.test.left, ast.Name) and node.test.left.id == '__name__'
+            and any(isinstance(c, ast.Constant) and c.value == '__main__' for c in node.test.comparators))
+
+def module_closure(modules: List[str], hashes: FileHashes, known: Dict[str, list]) -> List[str]:
+    """
+    Args:
+        modules (List[str]): source files in CODE_FOLDER
+        hashes (FileHashes): hashes of the files seen so far
+        known (Dict[str, list]): imports from an earlier run, see local_imports
+
+    Returns:
+        List[str]: the modules and every source file in CODE_FOLDER they import, directly or not, sorted
+    """
+    seen = set()
+    todo = list(modules)
+    while todo:
+        module = todo.pop()
+        if module not in seen:
+            seen.add(module)
+            todo.extend(local_imports(module, hashes, known))
+
+    return sorted(seen)
+
+def stage_key(stage: Stage, hashes: FileHashes, params: dict, known_imports: Dict[str, list]) -> str:
+    """
+    Args:
+        stage (Stage): stage to key
+        hashes (FileHashes): hashes of the files seen so far
+        params (dict): settings the stage's output depends on
+        known_imports (Dict[str, list]): imports from an earlier run, see local_imports
+
+    Returns:
+        str: hash of the stage's inputs, code and settings; the stage is up to date while it is unchanged
+    """
+    key = {
+        'inputs': {path: hashes.path(path) for path in stage.inputs},
+        'code': {module: hashes.file(os.path.join(CODE_FOLDER, module))
+                 for module in module_closure(stage.modules, hashes, known_imports)},
+        'run': inspect.getsource(stage.run),
+        'params': params,
+    }
+    return hashlib.sha1(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+## State ##
+def load_state(path: str = STATE_PATH) -> dict:
+    """
+    Args:
+        path (str): path of the pipeline state
+
+    Returns:
+        dict: 'stages' (name -> key, output hashes and timing of the last run), 'files' (remembered file
+              hashes, see FileHashes) and 'imports' (remembered imports, see local_imports); empty if there
+              is no state yet
+    """
+    state = {'stages': {}, 'files': {}, 'imports': {}}
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            state.update(json.load(f))
+
+    return state
+
+def save_state(state: dict, path: str = STATE_PATH) -> None:
+    """
+    Args:
+        state (dict): state from load_state
+        path (str): path of the pipeline state
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=4)
+    os.replace(tmp_path, path)
+
+
+## Stages ##
+def run_crawl(config: dict) -> None:
+    from crawl import crawl
+    _, failed = crawl(folder=config['events'], revalidate=config['revalidate'], max_workers=config['workers'])
+    for event_url, error in failed.items():
+        print(f'crawl: failed to scrape {event_url}: {error}')
+
+def run_load(config: dict) -> None:
+    from datastore import write_fights
+    from fighter_ids import FighterRegistry
+    from loader import compact_fight_df, load_fight_df
+    # The registry is kept between runs so a fighter keeps their ID when earlier events are added
+    registry = FighterRegistry.load(config['fighter_ids'])
+    fight_df = compact_fight_df(load_fight_df(config['events']), registry)
+    registry.save(config['fighter_ids'])
+    write_fights(fight_df, config['dataset'])
+
+def run_features(config: dict) -> None:
+    from datastore import read_fights, write_features
+    from features import STAT_COLUMNS, add_additional_fighter_metrics, calculate_fighter_historical_averages, sort_fights
+    fight_df = sort_fights(read_fights(root=config['dataset']))
+    final_df = add_additional_fighter_metrics(
+        calculate_fighter_historical_averages(fight_df, STAT_COLUMNS, config['own_stats_only']))
+    write_features(final_df, config['dataset'])
+
+def run_ratings(config: dict) -> None:
+    from datastore import read_fights
+    from features import STAT_COLUMNS
+    from fighter_state import FighterStateStore
+    fight_df = read_fights(root=config['dataset'])
+    store, _ = FighterStateStore.rebuild(fight_df, STAT_COLUMNS, config['own_stats_only'])
+    store.save(config['fighter_state'])
+
+def run_train(config: dict) -> None:
+    from datastore import read_features
+    from model import FEATURE_COLUMNS, LogisticModel
+    final_df = read_features(['f1', 'winner'] + FEATURE_COLUMNS, root=config['dataset'])
+    labels = (final_df['winner'].astype(object) == final_df['f1'].astype(object)).astype(int).to_numpy()
+    model = LogisticModel(FEATURE_COLUMNS).fit(final_df[FEATURE_COLUMNS].to_numpy(dtype=float), labels)
+    model.save(config['model'])
+
+def run_predict(config: dict) -> None:
+    from datastore import read_fights
+    from model import LogisticModel
+    from predict import build_snapshot
+    fight_df = read_fights(root=config['dataset'])
+    build_snapshot(fight_df, config['snapshot'], config['own_stats_only'], LogisticModel.load(config['model']))
+
+
+def make_stages(config: dict) -> List[Stage]:
+    """
+    Args:
+        config (dict): paths and settings, see default_config
+
+    Returns:
+        List[Stage]: the stages in the order they run
+    """
+    fights = os.path.join(config['dataset'], 'fights')
+    features = os.path.join(config['dataset'], 'features')
+    return [
+        # The crawl's input is the website, it runs every time and only fetches new events
+        Stage('crawl', [], [config['events']], ['crawl.py'], run_crawl, always_run=True),
+        Stage('load', [config['events']], [fights, config['fighter_ids']], ['datastore.py', 'loader.py'], run_load),
+        Stage('features', [fights], [features], ['datastore.py', 'features.py'], run_features),
+        Stage('ratings', [fights], [config['fighter_state']], ['datastore.py', 'features.py', 'fighter_state.py'],
+              run_ratings),
+        Stage('train', [features], [config['model']], ['datastore.py', 'model.py'], run_train),
+        Stage('predict', [fights, config['model']], [config['snapshot']], ['datastore.py', 'model.py', 'predict.py'],
+              run_predict),
+    ]
+
+def default_config() -> dict:
+    """
+    Returns:
+        dict: default paths and settings of the stages
+    """
+    return {
+        'events': EVENTS_FOLDER,
+        'dataset': DATASET_FOLDER,
+        'fighter_state': FIGHTER_STATE_PATH,
+        'fighter_ids': REGISTRY_PATH,
+        'model': MODEL_PATH,
+        'snapshot': SNAPSHOT_FOLDER,
+        'own_stats_only': False,
+        'revalidate': False,
+        'workers': None,
+    }
+
+def stage_params(stage: Stage, config: dict) -> dict:
+    """
+    Args:
+        stage (Stage): stage
+        config (dict): paths and settings
+
+    Returns:
+        dict: the settings the stage's output depends on, part of its key
+    """
+    params = {path: config[path] for path in ('events', 'dataset', 'fighter_state', 'fighter_ids', 'model', 'snapshot')}
+    if stage.name in ('features', 'ratings', 'predict'):
+        params['own_stats_only'] = config['own_stats_only']
+    return params
+
+
+## Running ##
+def run_pipeline(stages: Optional[List[str]] = None, config: Optional[dict] = None, force: bool = False,
+                 state_path: str = STATE_PATH) -> Dict[str, str]:
+    """
+    Runs the requested stages in order. A stage is skipped when its inputs,
+    code and settings hash to the key of its last run and its outputs are
+    as that run left them; a stage whose output did not change leaves the
+    stages after it up to date.
+
+    Args:
+        stages (Optional[List[str]]): names of the stages to run, all of STAGE_NAMES if not given
+        config (Optional[dict]): paths and settings overriding default_config
+        force (bool): run the stages even if they are up to date
+        state_path (str): path of the pipeline state
+
+    Returns:
+        Dict[str, str]: stage name -> 'ran' or 'skipped'
+    """
+    config = {**default_config(), **(config or {})}
+    stages = STAGE_NAMES if stages is None else stages
+    unknown = [name for name in stages if name not in STAGE_NAMES]
+    if unknown:
+        raise ValueError(f'unknown stages {unknown}, expected some of {STAGE_NAMES}')
+
+    state = load_state(state_path)
+    hashes = FileHashes(state['files'])
+    statuses = {}
+    for stage in make_stages(config):
+        if stage.name not in stages:
+            continue
+        key = stage_key(stage, hashes, stage_params(stage, config), state['imports'])
+        record = state['stages'].get(stage.name)
+        if (not force and not stage.always_run and record is not None and record['key'] == key
+                and all(hashes.path(path) == record['outputs'].get(path) for path in stage.outputs)):
+            statuses[stage.name] = 'skipped'
+            print(f'{stage.name}: up to date')
+            continue
+
+        start = time.perf_counter()
+        stage.run(config)
+        elapsed = time.perf_counter() - start
+        state['stages'][stage.name] = {
+            'key': key,
+            'outputs': {path: hashes.path(path) for path in stage.outputs},
+            'seconds': round(elapsed, 3),
+            'finished': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+        statuses[stage.name] = 'ran'
+        print(f'{stage.name}: ran in {elapsed:.2f}s')
+        # Saved after every stage, so a failure later on keeps the work done so far
+        state['files'] = hashes.existing()
+        save_state(state, state_path)
+
+    state['files'] = hashes.existing()
+    save_state(state, state_path)
+
+    return statuses
+
+def mark_current(stages: List[str], config: Optional[dict] = None, state_path: str = STATE_PATH) -> None:
+    """
+    Records stages as up to date with their current inputs and outputs, for
+    outputs brought up to date outside the pipeline (see revisions.py).
+
+    Args:
+        stages (List[str]): names of the stages
+        config (Optional[dict]): paths and settings overriding default_config
+        state_path (str): path of the pipeline state
+    """
+    config = {**default_config(), **(config or {})}
+    state = load_state(state_path)
+    hashes = FileHashes(state['files'])
+    for stage in make_stages(config):
+        if stage.name in stages:
+            record = state['stages'].get(stage.name, {})
+            record['key'] = stage_key(stage, hashes, stage_params(stage, config), state['imports'])
+            record['outputs'] = {path: hashes.path(path) for path in stage.outputs}
+            state['stages'][stage.name] = record
+
+    state['files'] = hashes.existing()
+    save_state(state, state_path)
@@ -0,0 +1,319 @@
+import json
+import os
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from instrument import timed
+from model import FEATURE_COLUMNS, MODEL_PATH, LogisticModel
+
+# Only numpy (and the standard library) is imported at startup. Building the snapshot needs pandas and
+# the feature code, which are imported inside build_snapshot.
+
+SNAPSHOT_FOLDER = 'snapshot'
+BASE_ELO = 1500
+
+
+def snapshot_columns(stat_columns: List[str]) -> List[str]:
+    """
+    Args:
+        stat_columns (List[str]): stats averaged per fighter
+
+    Returns:
+        List[str]: columns of a fighter's row in the snapshot. f1_avg_<stat> is the average used when the
+                   fighter is fighter 1 and f2_avg_<stat> the one used when they are fighter 2 (see
+                   features.calculate_fighter_historical_averages)
+    """
+    return ([f'f1_avg_{stat}' for stat in stat_columns] + [f'f2_avg_{stat}' for stat in stat_columns]
+            + ['win_rate', 'finish_rate', 'total_fights', 'elo'])
+
+@timed()
+def build_snapshot(fight_df, folder: str = SNAPSHOT_FOLDER, own_stats_only: bool = False,
+                   model: Optional[LogisticModel] = None) -> str:
+    """
+    Replays the fight history and writes, for every fighter, their feature row
+    after each of their fights, plus a model trained on the full history.
+    Fighters are told apart by integer ID when the table has them, and are
+    looked up by name; a name shared by several fighters stands for the one
+    who fought last.
+
+    Args:
+        fight_df (pd.DataFrame): fight table, with fighter IDs from loader.compact_fight_df or keyed by name
+        folder (str): folder to write the snapshot to
+        own_stats_only (bool): see features.calculate_fighter_historical_averages
+        model (Optional[LogisticModel]): model already trained on the full history, trained here if not given
+
+    Returns:
+        str: the snapshot folder
+    """
+    from features import STAT_COLUMNS, add_additional_fighter_metrics, calculate_fighter_historical_averages, sort_fights
+    from fighter_state import FighterStateStore, fighter_key
+
+    fight_df = sort_fights(fight_df)
+    columns = snapshot_columns(STAT_COLUMNS)
+    store = FighterStateStore(STAT_COLUMNS, own_stats_only)
+
+    history: Dict[str, List[Tuple[int, list]]] = {}
+    names: Dict[str, str] = {}
+    days = fight_df['date'].to_numpy().astype('datetime64[D]').astype(np.int64)
+    for day, fight in zip(days, fight_df.to_dict('records')):
+        store.update(fight)
+        for corner in ('f1', 'f2'):
+            key = fighter_key(fight, corner)
+            names[key] = fight[corner]
+            # Both corners set to the same fighter gives their f1 and f2 averages in one call
+            features = store.pre_fight_features({'f1': key, 'f2': key})
+            row = [features[column] for column in columns[:2 * len(STAT_COLUMNS)]]
+            row += [features['f1_win_rate'], features['f1_finish_rate'], features['f1_total_fights'],
+                    features['f1_elo']]
+            history.setdefault(key, []).append((int(day), row))
+
+    # Ordered by last fight, so the Predictor's name index keeps the latest of fighters sharing a name
+    fighters = sorted(history, key=lambda key: (history[key][-1][0], names[key]))
+    starts = [0]
+    state_rows = []
+    state_days = []
+    for key in fighters:
+        for day, row in history[key]:
+            state_days.append(day)
+            state_rows.append(row)
+        starts.append(len(state_rows))
+
+    if model is None:
+        final_df = add_additional_fighter_metrics(calculate_fighter_historical_averages(fight_df, STAT_COLUMNS, own_stats_only))
+        labels = (final_df['winner'] == final_df['f1']).astype(int).to_numpy()
+        model = LogisticModel(FEATURE_COLUMNS).fit(final_df[FEATURE_COLUMNS].to_numpy(dtype=float), labels)
+
+    os.makedirs(folder, exist_ok=True)
+    np.save(os.path.join(folder, 'state.npy'), np.asarray(state_rows, dtype=np.float64))
+    np.save(os.path.join(folder, 'days.npy'), np.asarray(state_days, dtype=np.int64))
+    model.save(os.path.join(folder, MODEL_PATH))
+    meta = {
+        'columns': columns,
+        'fighters': [names[key] for key in fighters],
+        'starts': starts,
+        'last_date': str(fight_df['date'].max().date()),
+    }
+    with open(os.path.join(folder, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+    return folder
+
+
+class Predictor:
+    """
+    Answers matchup queries from a snapshot written by build_snapshot. The
+    fighter rows are memory-mapped and grouped by fighter in date order, so a
+    query is two dictionary lookups, two binary searches and one dot product.
+    """
+
+    def __init__(self, folder: str = SNAPSHOT_FOLDER):
+        """
+        Args:
+            folder (str): snapshot folder
+        """
+        with open(os.path.join(folder, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+        self.columns = meta['columns']
+        self.last_date = meta['last_date']
+        self.starts = meta['starts']
+        self._index = {name: i for i, name in enumerate(meta['fighters'])}
+        self.state = np.load(os.path.join(folder, 'state.npy'), mmap_mode='r')
+        self.days = np.load(os.path.join(folder, 'days.npy'), mmap_mode='r')
+        self.model = LogisticModel.load(os.path.join(folder, MODEL_PATH))
+
+        # Row of a fighter who has not fought yet
+        self.debut = np.full(len(self.columns), np.nan)
+        self.debut[self.columns.index('total_fights')] = 0
+        self.debut[self.columns.index('elo')] = BASE_ELO
+
+        # Where each model feature comes from in fighter 1's and fighter 2's rows
+        self._f1_features, self._f1_columns = [], []
+        self._f2_features, self._f2_columns = [], []
+        for i, feature in enumerate(self.model.columns):
+            corner, column = feature[:2], feature[3:]
+            if column.startswith('avg_'):
+                column = feature
+            if corner == 'f1':
+                self._f1_features.append(i)
+                self._f1_columns.append(self.columns.index(column))
+            else:
+                self._f2_features.append(i)
+                self._f2_columns.append(self.columns.index(column))
+
+    def fighter_row(self, name: str, as_of: Optional[str] = None, allow_debut: bool = False) -> np.ndarray:
+        """
+        Args:
+            name (str): name of fighter
+            as_of (Optional[str]): 'YYYY-MM-DD', the row before any fight on or after this date; latest if not given
+            allow_debut (bool): return the debut row for fighters not in the snapshot instead of raising KeyError
+
+        Returns:
+            np.ndarray: the fighter's row, in self.columns order
+        """
+        i = self._index.get(name)
+        if i is None:
+            if allow_debut:
+                return self.debut
+            raise KeyError(f'no fights for {name!r} in the snapshot')
+        start, end = self.starts[i], self.starts[i + 1]
+        if as_of is not None:
+            day = np.datetime64(as_of, 'D').astype(np.int64)
+            end = start + int(np.searchsorted(self.days[start:end], day, side='left'))
+        if end == start:
+            return self.debut
+        return self.state[end - 1]
+
+    def fighter_rows(self, names: List[str], as_of: Optional[str] = None, allow_debut: bool = False) -> np.ndarray:
+        """
+        Args:
+            names (List[str]): names of fighters
+            as_of (Optional[str]): 'YYYY-MM-DD', see fighter_row
+            allow_debut (bool): see fighter_row
+
+        Returns:
+            np.ndarray: (fighters, columns) rows of the fighters, in self.columns order
+        """
+        indices = np.fromiter((self._index.get(name, -1) for name in names), dtype=np.int64, count=len(names))
+        if not allow_debut and np.any(indices < 0):
+            name = names[int(np.argmax(indices < 0))]
+            raise KeyError(f'no fights for {name!r} in the snapshot')
+
+        starts = np.asarray(self.starts, dtype=np.int64)
+        known = indices >= 0
+        start = np.where(known, starts[indices], 0)
+        end = np.where(known, starts[indices + 1], 0)
+        if as_of is not None:
+            day = np.datetime64(as_of, 'D').astype(np.int64)
+            for i in np.flatnonzero(known):
+                end[i] = start[i] + np.searchsorted(self.days[start[i]:end[i]], day, side='left')
+
+        # Fighters without a row before the date take the debut row, appended after the snapshot rows
+        rows = np.where(end > start, end - 1, len(self.state))
+        return np.vstack([self.state, self.debut])[rows] if np.any(end == start) else self.state[rows]
+
+    def features(self, fighter1: str, fighter2: str, as_of: Optional[str] = None,
+                 allow_debut: bool = False) -> np.ndarray:
+        """
+        Args:
+            fighter1 (str): name of fighter 1
+            fighter2 (str): name of fighter 2
+            as_of (Optional[str]): 'YYYY-MM-DD', see fighter_row
+            allow_debut (bool): see fighter_row
+
+        Returns:
+            np.ndarray: the model features of the matchup, in FEATURE_COLUMNS order
+        """
+        x = np.empty(len(self.model.columns))
+        x[self._f1_features] = self.fighter_row(fighter1, as_of, allow_debut)[self._f1_columns]
+        x[self._f2_features] = self.fighter_row(fighter2, as_of, allow_debut)[self._f2_columns]
+        return x
+
+    def predict(self, fighter_a: str, fighter_b: str, as_of: Optional[str] = None,
+                allow_debut: bool = False) -> float:
+        """
+        The model is not symmetric in the corners, so the matchup is scored
+        both ways round and the two probabilities are averaged.
+
+        Args:
+            fighter_a (str): name of fighter
+            fighter_b (str): name of opponent
+            as_of (Optional[str]): 'YYYY-MM-DD', see fighter_row
+            allow_debut (bool): see fighter_row
+
+        Returns:
+            float: probability that fighter_a wins
+        """
+        X = np.vstack([self.features(fighter_a, fighter_b, as_of, allow_debut),
+                       self.features(fighter_b, fighter_a, as_of, allow_debut)])
+        p = self.model.predict_proba(X)
+        return float((p[0] + 1 - p[1]) / 2)
+
+    @timed()
+    def predict_many(self, fighters_a: List[str], fighters_b: List[str], as_of: Optional[str] = None,
+                     allow_debut: bool = False) -> np.ndarray:
+        """
+        Scores every matchup, both ways round, in one model call.
+
+        Args:
+            fighters_a (List[str]): names of fighters
+            fighters_b (List[str]): names of their opponents
+            as_of (Optional[str]): 'YYYY-MM-DD', see fighter_row
+            allow_debut (bool): see fighter_row
+
+        Returns:
+            np.ndarray: probability that each of fighters_a wins
+        """
+        n = len(fighters_a)
+        rows = self.fighter_rows(list(fighters_a) + list(fighters_b), as_of, allow_debut)
+        rows_a, rows_b = rows[:n], rows[n:]
+
+        X = np.empty((2 * n, len(self.model.columns)))
+        X[:n, self._f1_features] = rows_a[:, self._f1_columns]
+        X[:n, self._f2_features] = rows_b[:, self._f2_columns]
+        X[n:, self._f1_features] = rows_b[:, self._f1_columns]
+        X[n:, self._f2_features] = rows_a[:, self._f2_columns]
+        p = self.model.predict_proba(X)
+        return (p[:n] + 1 - p[n:]) / 2
+
+    def is_known(self, name: str) -> bool:
+        """
+        Args:
+            name (str): name of fighter
+
+        Returns:
+            bool: True if the fighter has fights in the snapshot
+        """
+        return name in self._index
+
+
+_predictors: Dict[str, Predictor] = {}
+
+@timed()
+def predict(fighter_a: str, fighter_b: str, as_of_date: Optional[str] = None,
+            folder: str = SNAPSHOT_FOLDER) -> float:
+    """
+    Args:
+        fighter_a (str): name of fighter
+        fighter_b (str): name of opponent
+        as_of_date (Optional[str]): 'YYYY-MM-DD', use the fighters' records before this date; latest if not given
+        folder (str): snapshot folder, loaded once per process
+
+    Returns:
+        float: probability that fighter_a wins
+    """
+    predictor = _predictors.get(folder)
+    if predictor is None:
+        predictor = _predictors[folder] = Predictor(folder)
+    return predictor.predict(fighter_a, fighter_b, as_of_date)
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+    from instrument import add_profile_arguments, profiling
+
+    parser = argparse.ArgumentParser(description='Predict the winner of a matchup from the fighter snapshot')
+    parser.add_argument('fighters', nargs='*', metavar='FIGHTER', help='the two fighters')
+    parser.add_argument('--date', default=None, help='as-of date, YYYY-MM-DD')
+    parser.add_argument('--snapshot', default=SNAPSHOT_FOLDER, help='snapshot folder')
+    parser.add_argument('--build', action='store_true', help='rebuild the snapshot and model from events/')
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    with profiling(args.profile, args.cprofile):
+        if args.build:
+            from fighter_ids import FighterRegistry
+            from loader import compact_fight_df, load_fight_df
+            registry = FighterRegistry.load()
+            build_snapshot(compact_fight_df(load_fight_df(), registry), args.snapshot)
+            registry.save()
+            print(f'wrote {args.snapshot}/')
+        if len(args.fighters) == 2:
+            start = time.perf_counter()
+            try:
+                p = predict(args.fighters[0], args.fighters[1], args.date, args.snapshot)
+            except KeyError as e:
+                parser.exit(1, f'{e.args[0]}\n')
+            elapsed = (time.perf_counter() - start) * 1000
+            print(f'{args.fighters[0]} {p:.1%}, {args.fighters[1]} {1 - p:.1%} ({elapsed:.1f} ms)')
+        elif not args.build:
+            parser.error('give two fighters, or --build')
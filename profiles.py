@@ -0,0 +1,188 @@
+import json
+import os
+import time
+import pandas as pd
+import requests
+from typing import Dict, Iterable, Optional, Set
+from cache import DAY, CacheMiss
+from fetcher import map_concurrent
+from instrument import count
+from loader import EVENTS_FOLDER, iter_events
+from scraper import get_fighter_profile
+
+PROFILES_PATH = 'fighter_profiles.json'
+MAX_AGE = 30 * DAY
+
+# Profile fields joined onto the fight table as f1_<field>/f2_<field>. The
+# career statistics are as of the scrape, so on past fights they include
+# fights that had not happened yet.
+PROFILE_COLUMNS = ['height', 'weight', 'reach', 'stance', 'dob',
+                   'slpm', 'str_acc', 'sapm', 'str_def', 'td_avg', 'td_acc', 'td_def', 'sub_avg']
+
+
+class ProfileStore:
+    """
+    Fighter profiles keyed by ufcstats ID, persisted between crawls. get
+    fetches a profile only the first time it is asked for, so a fighter with
+    many fights is scraped once, and refresh re-fetches the stale ones in one
+    concurrent batch.
+    """
+
+    def __init__(self, path: str = PROFILES_PATH, max_age: Optional[float] = MAX_AGE):
+        """
+        Args:
+            path (str): path of the saved profiles
+            max_age (Optional[float]): seconds after which a profile is stale, None to never refresh
+        """
+        self.path = path
+        self.max_age = max_age
+        self.profiles: Dict[str, dict] = {}
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self.profiles = json.load(f)
+
+    def save(self) -> None:
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.profiles, f, indent=4, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def is_stale(self, ufcstats_id: str, now: Optional[float] = None) -> bool:
+        """
+        Args:
+            ufcstats_id (str): ufcstats fighter-details ID
+            now (Optional[float]): current time, time.time() if not given
+
+        Returns:
+            bool: True if the profile is missing or older than max_age
+        """
+        profile = self.profiles.get(ufcstats_id)
+        if profile is None:
+            return True
+        if self.max_age is None:
+            return False
+        return (now or time.time()) - profile['scraped_at'] > self.max_age
+
+    def get(self, ufcstats_id: str) -> dict:
+        """
+        Args:
+            ufcstats_id (str): ufcstats fighter-details ID
+
+        Returns:
+            dict: the fighter's profile, fetched only if it has never been scraped
+        """
+        profile = self.profiles.get(ufcstats_id)
+        if profile is None:
+            profile = self._fetch(ufcstats_id)
+        return profile
+
+    def refresh(self, ufcstats_ids: Iterable[str], max_workers: Optional[int] = None) -> Dict[str, str]:
+        """
+        Fetches the missing and stale profiles among ufcstats_ids, each once,
+        and saves the store.
+
+        Args:
+            ufcstats_ids (Iterable[str]): fighters to have profiles for, duplicates allowed
+            max_workers (Optional[int]): number of profiles fetched at once
+
+        Returns:
+            Dict[str, str]: ID -> error of the profiles that could not be fetched
+        """
+        now = time.time()
+        todo = sorted({ufcstats_id for ufcstats_id in ufcstats_ids if ufcstats_id and self.is_stale(ufcstats_id, now)})
+        failed = {}
+
+        def visit(ufcstats_id: str) -> None:
+            try:
+                self._fetch(ufcstats_id)
+            except (requests.RequestException, CacheMiss) as e:
+                count('profiles.failed')
+                failed[ufcstats_id] = f'{type(e).__name__}: {e}'
+
+        map_concurrent(visit, todo, max_workers)
+        self.save()
+
+        return failed
+
+    def _fetch(self, ufcstats_id: str) -> dict:
+        profile = get_fighter_profile(ufcstats_id)
+        profile['scraped_at'] = time.time()
+        self.profiles[ufcstats_id] = profile
+        return profile
+
+    def to_df(self) -> pd.DataFrame:
+        """
+        Returns:
+            pd.DataFrame: one row per fighter indexed by ufcstats ID, with name, record and PROFILE_COLUMNS
+        """
+        profile_df = pd.DataFrame.from_dict(self.profiles, orient='index',
+                                            columns=['name', 'record'] + PROFILE_COLUMNS)
+        profile_df.index.name = 'ufcstats_id'
+        profile_df['dob'] = pd.to_datetime(profile_df['dob'], errors='coerce')
+        return profile_df
+
+
+def event_fighter_ids(path: str = EVENTS_FOLDER) -> Set[str]:
+    """
+    Args:
+        path (str): folder with one JSON file per event, or a bundle
+
+    Returns:
+        Set[str]: ufcstats IDs of every fighter in the events, each once. Events crawled before the scraper
+                  recorded the IDs have none until revisions.backfill_fighter_ids adds them
+    """
+    ufcstats_ids = set()
+    for data in iter_events(path):
+        for fight in data.values():
+            if isinstance(fight, dict):
+                ufcstats_ids.update(fight.get(key) for key in ('fighter1_id', 'fighter2_id') if fight.get(key))
+
+    return ufcstats_ids
+
+def join_profiles(fight_df: pd.DataFrame, profile_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Args:
+        fight_df (pd.DataFrame): fight table with f1_ufcstats_id and f2_ufcstats_id
+        profile_df (pd.DataFrame): profiles from ProfileStore.to_df
+
+    Returns:
+        pd.DataFrame: fight_df with f1_<field>/f2_<field> for PROFILE_COLUMNS and f1_age/f2_age (years on the
+                      fight date) added, missing for fighters without a profile
+    """
+    fight_df = fight_df.copy()
+    for corner in ('f1', 'f2'):
+        joined = profile_df[PROFILE_COLUMNS].reindex(fight_df[f'{corner}_ufcstats_id'])
+        for column in PROFILE_COLUMNS:
+            fight_df[f'{corner}_{column}'] = joined[column].to_numpy()
+        fight_df[f'{corner}_age'] = (fight_df['date'] - fight_df[f'{corner}_dob']).dt.days / 365.25
+
+    return fight_df
+
+
+if __name__ == '__main__':
+    import argparse
+    from instrument import add_profile_arguments, profiling
+
+    parser = argparse.ArgumentParser(description='Scrape the profile of every fighter in events/')
+    parser.add_argument('--path', default=EVENTS_FOLDER, help='events folder or bundle')
+    parser.add_argument('--profiles', default=PROFILES_PATH, help='path of the saved profiles')
+    parser.add_argument('--max-age', type=float, default=MAX_AGE / DAY, help='days before a profile is re-fetched')
+    parser.add_argument('--workers', type=int, default=None, help='maximum number of requests in flight')
+    parser.add_argument('--no-backfill', action='store_true',
+                        help='do not add fighter IDs to events crawled before the scraper recorded them')
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    with profiling(args.profile, args.cprofile):
+        if not args.no_backfill and os.path.isdir(args.path):
+            from revisions import backfill_fighter_ids
+            filled, failed = backfill_fighter_ids(folder=args.path, max_workers=args.workers)
+            for event_url, error in failed.items():
+                print(f'{event_url}: {error}')
+            print(f'{filled} fighter IDs added to stored fights')
+        store = ProfileStore(args.profiles, args.max_age * DAY)
+        ufcstats_ids = event_fighter_ids(args.path)
+        failed = store.refresh(ufcstats_ids, args.workers)
+        for ufcstats_id, error in failed.items():
+            print(f'failed to scrape fighter {ufcstats_id}: {error}')
+        print(f'{len(store.profiles)} profiles, {len(failed)} failed')
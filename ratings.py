@@ -0,0 +1,361 @@
+import itertools
+import math
+import numpy as np
+import pandas as pd
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+# Method categories the K factor is scaled by, see method_category
+OTHER, MAJORITY, UNANIMOUS, FINISH = range(4)
+N_CATEGORIES = 4
+
+DEFAULT_MULTIPLIERS = (1.0, 1.5, 3.0, 5.0)
+
+
+class FightArrays(NamedTuple):
+    """Fight history encoded as integer-indexed arrays, in fight order."""
+    f1: np.ndarray        # fighter index of fighter 1
+    f2: np.ndarray        # fighter index of fighter 2
+    score: np.ndarray     # 1 if fighter 1 won, 0 if fighter 2 won, 0.5 for draws and no contests
+    category: np.ndarray  # method category, see method_category
+    day: np.ndarray       # days since the epoch
+    fighters: np.ndarray  # fighter name of each index
+
+
+## Encoding ##
+def method_category(method: str) -> int:
+    """
+    Args:
+        method (str): method of victory
+
+    Returns:
+        int: MAJORITY, UNANIMOUS, FINISH or OTHER, matched like features.elo_k
+    """
+    if 'Majority' in method:
+        return MAJORITY
+    elif 'Unanimous' in method:
+        return UNANIMOUS
+    elif 'Stoppage' in method or 'KO' in method or 'Submission' in method:
+        return FINISH
+    return OTHER
+
+def encode_fights(fight_df: pd.DataFrame) -> FightArrays:
+    """
+    Args:
+        fight_df (pd.DataFrame): fight table in fight order
+
+    Returns:
+        FightArrays: the fights with fighters interned to dense integer indexes, by fighter ID when the
+                     table has f1_id/f2_id columns and by name otherwise
+    """
+    n = len(fight_df)
+    if 'f1_id' in fight_df:
+        keys = np.concatenate([fight_df['f1_id'].to_numpy(), fight_df['f2_id'].to_numpy()])
+    else:
+        keys = np.concatenate([fight_df['f1'].to_numpy(dtype=object), fight_df['f2'].to_numpy(dtype=object)])
+    codes, fighters = pd.factorize(keys)
+    winner = fight_df['winner'].to_numpy(dtype=object)
+    score = np.full(n, 0.5)
+    score[winner == fight_df['f1'].to_numpy(dtype=object)] = 1.0
+    score[winner == fight_df['f2'].to_numpy(dtype=object)] = 0.0
+    category = np.fromiter((method_category(method) for method in fight_df['method']), dtype=np.int8, count=n)
+    day = pd.to_datetime(fight_df['date']).to_numpy().astype('datetime64[D]').astype(np.int64)
+
+    return FightArrays(codes[:n], codes[n:], score, category, day, np.asarray(fighters))
+
+
+## Rating Systems ##
+class RatingSystem(ABC):
+    """
+    A rating system evaluated for several parameter settings at once. State is
+    kept in (configs, fighters) arrays and every fight updates the two
+    fighters' columns for all settings in one vectorized step.
+    """
+    name = 'rating'
+
+    def __init__(self, n_configs: int):
+        self.n_configs = n_configs
+
+    @abstractmethod
+    def init_state(self, n_fighters: int) -> Dict[str, np.ndarray]:
+        """Returns the state before any fight, (configs, fighters) arrays including 'rating'."""
+
+    def ratings(self, state: Dict[str, np.ndarray], i: int, j: int) -> Tuple[np.ndarray, np.ndarray]:
+        return state['rating'][:, i], state['rating'][:, j]
+
+    @abstractmethod
+    def expected(self, state: Dict[str, np.ndarray], i: int, j: int, day: int) -> np.ndarray:
+        """Returns fighter i's expected score against fighter j on day, one per setting."""
+
+    @abstractmethod
+    def update(self, state: Dict[str, np.ndarray], i: int, j: int, score: float, category: int, day: int) -> None:
+        """Updates both fighters' state in place with the result of their fight."""
+
+    @abstractmethod
+    def configs(self) -> List[dict]:
+        """Returns the parameters of each setting, in state order."""
+
+
+class Elo(RatingSystem):
+    """
+    Elo with a K factor scaled by the method of victory (by default 32, times
+    1.5 for majority decisions, 3 for unanimous decisions and 5 for finishes).
+    """
+    name = 'elo'
+
+    def __init__(self, k: Sequence[float] = (32.0,), multipliers: Sequence[Sequence[float]] = (DEFAULT_MULTIPLIERS,),
+                 base: float = 1500.0):
+        """
+        Args:
+            k (Sequence[float]): base K factor of each setting
+            multipliers (Sequence[Sequence[float]]): K multipliers per method category of each setting
+            base (float): rating of a fighter's first fight
+        """
+        super().__init__(len(k))
+        self.k = np.asarray(k, dtype=float)
+        self.multipliers = np.asarray(multipliers, dtype=float).reshape(len(k), N_CATEGORIES)
+        self.base = base
+
+    @classmethod
+    def grid(cls, k: Sequence[float], majority: Sequence[float] = (1.5,), unanimous: Sequence[float] = (3.0,),
+             finish: Sequence[float] = (5.0,), base: float = 1500.0) -> 'Elo':
+        """
+        Returns:
+            Elo: one setting per combination of the given K factors and multipliers
+        """
+        combos = list(itertools.product(k, majority, unanimous, finish))
+        return cls([c[0] for c in combos], [(1.0, c[1], c[2], c[3]) for c in combos], base)
+
+    def init_state(self, n_fighters: int) -> Dict[str, np.ndarray]:
+        return {'rating': np.full((self.n_configs, n_fighters), self.base)}
+
+    def expected(self, state, i, j, day):
+        rating = state['rating']
+        return 1 / (1 + 10 ** ((rating[:, j] - rating[:, i]) / 400))
+
+    def update(self, state, i, j, score, category, day):
+        rating = state['rating']
+        e1 = self.expected(state, i, j, day)
+        e2 = 1 - e1
+        k = self.k * self.multipliers[:, category]
+        r1 = rating[:, i] + k * (score - e1)
+        r2 = rating[:, j] + k * ((1 - score) - e2)
+        rating[:, i] = r1
+        rating[:, j] = r2
+
+    def configs(self):
+        return [{'k': k, 'majority': m[MAJORITY], 'unanimous': m[UNANIMOUS], 'finish': m[FINISH]}
+                for k, m in zip(self.k, self.multipliers)]
+
+
+class Glicko(RatingSystem):
+    """
+    Glicko-1 treating each fight as its own rating period. Rating variance
+    grows by c^2 per day out of the octagon (capped at the initial deviation)
+    and shrinks with every fight, so long layoffs and debuts move
+    ratings more. Outcomes can be weighted by method like Elo's K factor.
+    """
+    name = 'glicko'
+    Q = math.log(10) / 400
+
+    def __init__(self, rd: Sequence[float] = (350.0,), c: Sequence[float] = (1.0,),
+                 multipliers: Sequence[Sequence[float]] = ((1.0, 1.0, 1.0, 1.0),), base: float = 1500.0,
+                 min_rd: float = 30.0):
+        """
+        Args:
+            rd (Sequence[float]): initial rating deviation of each setting
+            c (Sequence[float]): deviation growth per sqrt(day) of inactivity of each setting
+            multipliers (Sequence[Sequence[float]]): update weight per method category of each setting
+            base (float): rating of a fighter's first fight
+            min_rd (float): lowest rating deviation
+        """
+        super().__init__(len(rd))
+        self.rd = np.asarray(rd, dtype=float)
+        self.c = np.asarray(c, dtype=float)
+        self.multipliers = np.asarray(multipliers, dtype=float).reshape(len(rd), N_CATEGORIES)
+        self.base = base
+        self.min_rd = min_rd
+
+    @classmethod
+    def grid(cls, rd: Sequence[float], c: Sequence[float], finish: Sequence[float] = (1.0,),
+             base: float = 1500.0) -> 'Glicko':
+        """
+        Returns:
+            Glicko: one setting per combination of the given deviations, growth rates and finish weights
+        """
+        combos = list(itertools.product(rd, c, finish))
+        return cls([x[0] for x in combos], [x[1] for x in combos], [(1.0, 1.0, 1.0, x[2]) for x in combos], base)
+
+    def init_state(self, n_fighters: int) -> Dict[str, np.ndarray]:
+        return {
+            'rating': np.full((self.n_configs, n_fighters), self.base),
+            'rd': np.repeat(self.rd[:, None], n_fighters, axis=1),
+            'last_day': np.full(n_fighters, np.iinfo(np.int64).min, dtype=np.int64),
+        }
+
+    def _current_rd(self, state, i, day):
+        last = state['last_day'][i]
+        if last == np.iinfo(np.int64).min:
+            return state['rd'][:, i]
+        return np.minimum(np.sqrt(state['rd'][:, i] ** 2 + self.c ** 2 * (day - last)), self.rd)
+
+    @classmethod
+    def _g(cls, rd):
+        return 1 / np.sqrt(1 + 3 * cls.Q ** 2 * rd ** 2 / math.pi ** 2)
+
+    def expected(self, state, i, j, day):
+        rating = state['rating']
+        rd = np.sqrt(self._current_rd(state, i, day) ** 2 + self._current_rd(state, j, day) ** 2)
+        return 1 / (1 + 10 ** (-self._g(rd) * (rating[:, i] - rating[:, j]) / 400))
+
+    def update(self, state, i, j, score, category, day):
+        rating = state['rating']
+        rd_i = self._current_rd(state, i, day)
+        rd_j = self._current_rd(state, j, day)
+        weight = self.multipliers[:, category]
+
+        new = {}
+        for me, opp, rd_me, rd_opp, s in ((i, j, rd_i, rd_j, score), (j, i, rd_j, rd_i, 1 - score)):
+            g = self._g(rd_opp)
+            e = 1 / (1 + 10 ** (-g * (rating[:, me] - rating[:, opp]) / 400))
+            d2 = 1 / (self.Q ** 2 * g ** 2 * e * (1 - e))
+            precision = 1 / rd_me ** 2 + 1 / d2
+            new[me] = (rating[:, me] + weight * self.Q / precision * g * (s - e),
+                       np.maximum(np.sqrt(1 / precision), self.min_rd))
+
+        for fighter, (r, rd) in new.items():
+            rating[:, fighter] = r
+            state['rd'][:, fighter] = rd
+            state['last_day'][fighter] = day
+
+    def configs(self):
+        return [{'rd': rd, 'c': c, 'finish': m[FINISH]} for rd, c, m in zip(self.rd, self.c, self.multipliers)]
+
+
+## Replay ##
+def replay(fights: FightArrays, system: RatingSystem) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Replays the fight history under every setting of the system at once.
+
+    Args:
+        fights (FightArrays): encoded fight history
+        system (RatingSystem): rating system with one or more settings
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: (configs, fights) arrays of fighter 1's and fighter 2's
+                                                   pre-fight ratings and fighter 1's expected score
+    """
+    n = len(fights.f1)
+    state = system.init_state(len(fights.fighters))
+    f1_ratings = np.empty((system.n_configs, n))
+    f2_ratings = np.empty((system.n_configs, n))
+    expected = np.empty((system.n_configs, n))
+
+    for t in range(n):
+        i = fights.f1[t]
+        j = fights.f2[t]
+        day = fights.day[t]
+        f1_ratings[:, t], f2_ratings[:, t] = system.ratings(state, i, j)
+        expected[:, t] = system.expected(state, i, j, day)
+        system.update(state, i, j, fights.score[t], fights.category[t], day)
+
+    return f1_ratings, f2_ratings, expected
+
+def log_loss(expected: np.ndarray, score: np.ndarray, mask: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Args:
+        expected (np.ndarray): (configs, fights) predicted probability that fighter 1 wins
+        score (np.ndarray): outcome of each fight, 1, 0 or 0.5
+        mask (Optional[np.ndarray]): fights to score, by default every fight with a winner
+
+    Returns:
+        np.ndarray: log-loss of each setting
+    """
+    if mask is None:
+        mask = score != 0.5
+    p = np.clip(expected[:, mask], 1e-15, 1 - 1e-15)
+    y = score[mask]
+    return -(y * np.log(p) + (1 - y) * np.log(1 - p)).mean(axis=1)
+
+def _evaluate(fights: FightArrays, system: RatingSystem, burn_in: int) -> Tuple[np.ndarray, np.ndarray]:
+    _, _, expected = replay(fights, system)
+    mask = fights.score != 0.5
+    mask[:burn_in] = False
+    accuracy = ((expected[:, mask] > 0.5) == (fights.score[mask] == 1)).mean(axis=1)
+    return log_loss(expected, fights.score, mask), accuracy
+
+def _split(system: RatingSystem, parts: int) -> List[RatingSystem]:
+    chunks = np.array_split(np.arange(system.n_configs), parts)
+    systems = []
+    for chunk in chunks:
+        if len(chunk) == 0:
+            continue
+        part = object.__new__(type(system))
+        part.__dict__.update(system.__dict__)
+        for name, value in system.__dict__.items():
+            if isinstance(value, np.ndarray) and value.shape[:1] == (system.n_configs,):
+                setattr(part, name, value[chunk])
+        part.n_configs = len(chunk)
+        systems.append(part)
+    return systems
+
+def sweep(fight_df: pd.DataFrame, system: RatingSystem, burn_in: int = 0, processes: int = 1) -> pd.DataFrame:
+    """
+    Scores every setting of a rating system by how well its pre-fight
+    expectations predicted the results.
+
+    Args:
+        fight_df (pd.DataFrame): fight table in fight order
+        system (RatingSystem): rating system with one or more settings, e.g. Elo.grid(...)
+        burn_in (int): number of early fights left out of the scores
+        processes (int): worker processes the settings are split across
+
+    Returns:
+        pd.DataFrame: one row per setting with its parameters, log_loss and accuracy, best first
+    """
+    fights = encode_fights(fight_df)
+    if processes > 1 and system.n_configs > 1:
+        parts = _split(system, processes)
+        with ProcessPoolExecutor(max_workers=len(parts)) as executor:
+            results = list(executor.map(_evaluate, [fights] * len(parts), parts, [burn_in] * len(parts)))
+        losses = np.concatenate([loss for loss, _ in results])
+        accuracies = np.concatenate([accuracy for _, accuracy in results])
+    else:
+        losses, accuracies = _evaluate(fights, system, burn_in)
+
+    result_df = pd.DataFrame(system.configs())
+    result_df.insert(0, 'system', system.name)
+    result_df['log_loss'] = losses
+    result_df['accuracy'] = accuracies
+
+    return result_df.sort_values('log_loss', kind='stable').reset_index(drop=True)
+
+
+if __name__ == '__main__':
+    import argparse
+    from features import sort_fights
+    from loader import load_fight_df
+    from instrument import add_profile_arguments, profiling
+
+    parser = argparse.ArgumentParser(description='Score rating system settings by predictive log-loss')
+    parser.add_argument('--system', choices=['elo', 'glicko'], default='elo')
+    parser.add_argument('--k', type=float, nargs='+', default=[16, 24, 32, 40, 48])
+    parser.add_argument('--majority', type=float, nargs='+', default=[1.5])
+    parser.add_argument('--unanimous', type=float, nargs='+', default=[1, 2, 3])
+    parser.add_argument('--finish', type=float, nargs='+', default=[1, 3, 5])
+    parser.add_argument('--rd', type=float, nargs='+', default=[200, 350])
+    parser.add_argument('--c', type=float, nargs='+', default=[0.5, 1, 2, 4])
+    parser.add_argument('--burn-in', type=int, default=1000, help='early fights left out of the scores')
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--top', type=int, default=10)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    with profiling(args.profile, args.cprofile):
+        if args.system == 'elo':
+            system = Elo.grid(args.k, args.majority, args.unanimous, args.finish)
+        else:
+            system = Glicko.grid(args.rd, args.c, args.finish)
+        result_df = sweep(sort_fights(load_fight_df()), system, args.burn_in, args.processes)
+        print(result_df.head(args.top).to_string(index=False))
@@ -0,0 +1,457 @@
+import hashlib
+import json
+import os
+import requests
+from typing import Dict, List, Optional, Tuple
+from bs4 import BeautifulSoup
+from cache import CacheMiss
+from crawl import EVENTS_URL, EVENTS_FOLDER, event_filename
+from fetcher import fetch, fetch_response, map_concurrent
+from instrument import count, timed
+from scraper import PARSER, get_event_listing, parse_fight_page, parse_fight_urls, parse_upcoming_fights
+
+REVISIONS_PATH = 'revisions.json'
+
+
+## Manifest ##
+def load_revisions(path: str = REVISIONS_PATH) -> dict:
+    """
+    Args:
+        path (str): path of the revision manifest
+
+    Returns:
+        dict: 'events' (event URL -> {'file', 'fights'}, the fight URLs in card order) and 'fights'
+              (fight URL -> {'file', 'fight', 'etag', 'last_modified', 'fingerprint'})
+    """
+    if not os.path.exists(path):
+        return {'events': {}, 'fights': {}}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def save_revisions(revisions: dict, path: str = REVISIONS_PATH) -> None:
+    """
+    Args:
+        revisions (dict): manifest from load_revisions
+        path (str): path of the revision manifest
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(revisions, f, indent=4, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+## Comparison ##
+def stored_view(page_data: dict, stored: dict) -> dict:
+    """
+    Args:
+        page_data (dict): fight data parsed from the fight page, see scraper.parse_fight_page
+        stored (dict): the fight as stored in events/
+
+    Returns:
+        dict: the page's values of the fields the stored fight has, nested dictionaries included. Fields
+              scraped only by newer versions of the scraper are left out so older files compare equal
+    """
+    page_data = json.loads(json.dumps(page_data))  # tuples (score) as stored, lists
+    view = {}
+    for key, value in stored.items():
+        page_value = page_data.get(key)
+        if isinstance(value, dict) and isinstance(page_value, dict):
+            page_value = stored_view(page_value, value)
+        view[key] = page_value
+
+    return view
+
+def fight_fingerprint(fight: dict) -> str:
+    """
+    Args:
+        fight (dict): fight data
+
+    Returns:
+        str: hash of the fight's fields and values
+    """
+    return hashlib.sha1(json.dumps(fight, sort_keys=True).encode('utf-8')).hexdigest()
+
+def changed_fields(stored: dict, revised: dict, prefix: str = '') -> List[str]:
+    """
+    Args:
+        stored (dict): the fight as stored in events/
+        revised (dict): the page's values of the same fields, see stored_view
+
+    Returns:
+        List[str]: the fields that differ, nested ones as e.g. 'fighter1_fight_data.ctrl_time'
+    """
+    fields = []
+    for key, value in stored.items():
+        if isinstance(value, dict) and isinstance(revised.get(key), dict):
+            fields += changed_fields(value, revised[key], f'{prefix}{key}.')
+        elif revised.get(key) != value:
+            fields.append(prefix + key)
+
+    return fields
+
+
+## Sweep ##
+def check_fight(url: str, entry: Optional[dict]) -> Tuple[Optional[dict], dict]:
+    """
+    Revalidates a fight page with a conditional request when validators from a
+    previous sweep are known.
+
+    Args:
+        url (str): URL of fight
+        entry (Optional[dict]): manifest entry from the previous sweep, None if never checked
+
+    Returns:
+        Tuple[Optional[dict], dict]: (fight data parsed from the page, None if not modified; new manifest entry)
+    """
+    entry = dict(entry or {})
+    headers = {}
+    if entry.get('etag'):
+        headers['If-None-Match'] = entry['etag']
+    if entry.get('last_modified'):
+        headers['If-Modified-Since'] = entry['last_modified']
+
+    response = fetch_response(url, headers=headers)
+    if response.status_code == 304:
+        count('revisions.not_modified')
+        return None, entry
+
+    entry['etag'] = response.headers.get('ETag')
+    entry['last_modified'] = response.headers.get('Last-Modified')
+    return parse_fight_page(response.text), entry
+
+def event_fights(event_data: dict) -> List[str]:
+    """
+    Args:
+        event_data (dict): event data as stored in events/
+
+    Returns:
+        List[str]: keys of the event's fights, in card order
+    """
+    return [key for key, fight in event_data.items()
+            if isinstance(fight, dict) and 'fighter1' in fight and 'fighter2' in fight]
+
+def index_events(revisions: dict, listing_url: str = EVENTS_URL, folder: str = EVENTS_FOLDER,
+                 max_workers: Optional[int] = None) -> Dict[str, str]:
+    """
+    Adds the stored events missing from the manifest, with the URLs of their
+    fights. Each event page is fetched once, on the first sweep after the
+    event was crawled.
+
+    Args:
+        revisions (dict): manifest from load_revisions, updated in place
+        listing_url (str): URL containing links to events
+        folder (str): folder the event files are stored in
+        max_workers (Optional[int]): number of event pages fetched at once
+
+    Returns:
+        Dict[str, str]: event URL -> error of the events that could not be indexed, retried on the next sweep
+    """
+    on_disk = set(os.listdir(folder))
+    missing = [(event_url, event_filename(name)) for event_url, name in get_event_listing(listing_url)
+               if event_filename(name) in on_disk and event_url not in revisions['events']]
+
+    failed = {}
+
+    def visit(item: Tuple[str, str]) -> Optional[Tuple[str, str, List[str]]]:
+        event_url, filename = item
+        try:
+            return event_url, filename, parse_fight_urls(BeautifulSoup(fetch(event_url), PARSER))
+        except requests.RequestException as e:
+            failed[event_url] = f'failed to index: {e}'
+            return None
+
+    for result in map_concurrent(visit, missing, max_workers):
+        if result is not None:
+            event_url, filename, fight_urls = result
+            revisions['events'][event_url] = {'file': filename, 'fights': fight_urls}
+
+    return failed
+
+@timed()
+def sweep(listing_url: str = EVENTS_URL, folder: str = EVENTS_FOLDER, revisions_path: str = REVISIONS_PATH,
+          max_workers: Optional[int] = None, dry_run: bool = False) -> Tuple[List[dict], Dict[str, str]]:
+    """
+    Checks every stored fight against its page on ufcstats. Pages are
+    revalidated with conditional requests, so only pages that changed since
+    the previous sweep are downloaded and parsed; the first sweep downloads
+    them all. A downloaded page is compared with the stored fight on the
+    fields the stored fight has, and the fights that differ are rewritten in
+    their event files, leaving every other fight as it is.
+
+    Args:
+        listing_url (str): URL containing links to events
+        folder (str): folder the event files are stored in
+        revisions_path (str): path of the revision manifest
+        max_workers (Optional[int]): number of pages fetched at once
+        dry_run (bool): report the revised fights without rewriting them
+
+    Returns:
+        Tuple[List[dict], Dict[str, str]]: one entry per revised fight with 'file', 'fight', 'url' and
+            'fields', the changed fields, and URL -> error of the events and fights that could not be checked
+    """
+    revisions = load_revisions(revisions_path)
+    failed = index_events(revisions, listing_url, folder, max_workers)
+
+    events: Dict[str, dict] = {}
+    checks = []
+    for event_url, event in revisions['events'].items():
+        path = os.path.join(folder, event['file'])
+        if not os.path.exists(path):
+            continue
+        with open(path, 'r') as f:
+            events[event['file']] = json.load(f)
+        fights = event_fights(events[event['file']])
+        for position, fight_url in enumerate(event['fights']):
+            checks.append((fight_url, event['file'], fights[position] if len(fights) == len(event['fights']) else None))
+
+    def visit(check: Tuple[str, str, Optional[str]]) -> Optional[dict]:
+        fight_url, filename, fight = check
+        entry = revisions['fights'].get(fight_url)
+        try:
+            page_data, entry = check_fight(fight_url, entry)
+        except requests.RequestException as e:
+            failed[fight_url] = f'failed to check: {e}'
+            return None
+        entry['file'] = filename
+        if page_data is None:
+            return {'url': fight_url, 'entry': entry}
+
+        # Fights are matched to the page by card position, by name if the card changed since the crawl
+        fight = entry.get('fight') or fight or page_data['name']
+        stored = events[filename].get(fight)
+        if stored is None:
+            failed[fight_url] = f'no stored fight in {filename}, re-crawl the event'
+            return None
+        revised = stored_view(page_data, stored)
+        entry['fight'] = fight
+        entry['fingerprint'] = fight_fingerprint(revised)
+        if entry['fingerprint'] == fight_fingerprint(stored):
+            return {'url': fight_url, 'entry': entry}
+        return {'url': fight_url, 'entry': entry, 'file': filename, 'fight': fight, 'revised': revised,
+                'fields': changed_fields(stored, revised)}
+
+    results = [result for result in map_concurrent(visit, checks, max_workers) if result is not None]
+    changes = [result for result in results if 'revised' in result]
+    count('revisions.checked', len(checks))
+    count('revisions.revised', len(changes))
+    count('revisions.failed', len(failed))
+    if dry_run:
+        return [{key: change[key] for key in ('file', 'fight', 'url', 'fields')} for change in changes], failed
+
+    for filename in sorted({change['file'] for change in changes}):
+        event_data = events[filename]
+        for change in changes:
+            if change['file'] == filename:
+                rename_fight(event_data, change['fight'], change['revised'])
+        write_event(event_data, os.path.join(folder, filename))
+
+    for result in results:
+        entry = result['entry']
+        if 'revised' in result:
+            entry['fight'] = result['revised'].get('name', result['fight'])
+        revisions['fights'][result['url']] = entry
+    save_revisions(revisions, revisions_path)
+
+    return [{key: change[key] for key in ('file', 'fight', 'url', 'fields')} for change in changes], failed
+
+def rename_fight(event_data: dict, fight: str, revised: dict) -> None:
+    """
+    Replaces a fight in its event, keeping its place on the card. The fight's
+    key follows its name, which a revision can change.
+
+    Args:
+        event_data (dict): event data as stored in events/, updated in place
+        fight (str): key of the fight
+        revised (dict): the fight's revised data
+    """
+    key = revised.get('name', fight)
+    items = [(key, revised) if name == fight else (name, value) for name, value in event_data.items()]
+    event_data.clear()
+    event_data.update(items)
+
+def write_event(event_data: dict, path: str) -> None:
+    """
+    Args:
+        event_data (dict): event data as stored in events/
+        path (str): path of the event file
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(event_data, f, indent=4)
+    os.replace(tmp_path, path)
+
+
+## Fighter IDs ##
+def missing_fighter_ids(event_data: dict) -> bool:
+    """
+    Args:
+        event_data (dict): event data as stored in events/
+
+    Returns:
+        bool: True if a fight of the event has no fighter1_id or fighter2_id
+    """
+    return any(not event_data[fight].get('fighter1_id') or not event_data[fight].get('fighter2_id')
+               for fight in event_fights(event_data))
+
+def fill_fighter_ids(event_data: dict, bouts: List[dict]) -> int:
+    """
+    Args:
+        event_data (dict): event data as stored in events/, updated in place
+        bouts (List[dict]): the event's bouts with fighter names and IDs, see scraper.parse_upcoming_fights
+
+    Returns:
+        int: number of fighter IDs set
+    """
+    ids = {}
+    for bout in bouts:
+        for corner in ('1', '2'):
+            ids[bout[f'fighter{corner}']] = bout[f'fighter{corner}_id']
+
+    filled = 0
+    for fight in event_fights(event_data):
+        for corner in ('1', '2'):
+            fight_data = event_data[fight]
+            ufcstats_id = ids.get(fight_data[f'fighter{corner}'])
+            if not fight_data.get(f'fighter{corner}_id') and ufcstats_id:
+                fight_data[f'fighter{corner}_id'] = ufcstats_id
+                filled += 1
+
+    return filled
+
+def backfill_fighter_ids(listing_url: str = EVENTS_URL, folder: str = EVENTS_FOLDER,
+                         max_workers: Optional[int] = None) -> Tuple[int, Dict[str, str]]:
+    """
+    Adds the fighters' ufcstats IDs to stored fights crawled before the
+    scraper recorded them, which the profile stage needs. The event page lists
+    every bout with links to both fighters, so an event costs one request
+    whatever the size of its card; fighters are matched to the stored fights
+    by name. Events whose fights all have IDs are not fetched.
+
+    Args:
+        listing_url (str): URL containing links to events
+        folder (str): folder the event files are stored in
+        max_workers (Optional[int]): number of event pages fetched at once
+
+    Returns:
+        Tuple[int, Dict[str, str]]: number of IDs added, and event URL -> error of the events that could not
+            be fetched
+    """
+    on_disk = set(os.listdir(folder))
+    todo = []
+    for event_url, name in get_event_listing(listing_url):
+        filename = event_filename(name)
+        if filename not in on_disk:
+            continue
+        with open(os.path.join(folder, filename), 'r') as f:
+            event_data = json.load(f)
+        if missing_fighter_ids(event_data):
+            todo.append((event_url, filename, event_data))
+
+    failed = {}
+
+    def visit(item: Tuple[str, str, dict]) -> int:
+        event_url, filename, event_data = item
+        try:
+            bouts = parse_upcoming_fights(BeautifulSoup(fetch(event_url), PARSER))
+        except (requests.RequestException, CacheMiss) as e:
+            failed[event_url] = f'failed to fetch: {e}'
+            return 0
+        filled = fill_fighter_ids(event_data, bouts)
+        if filled:
+            write_event(event_data, os.path.join(folder, filename))
+        return filled
+
+    filled = sum(map_concurrent(visit, todo, max_workers))
+    count('revisions.fighter_ids', filled)
+
+    return filled, failed
+
+
+## Downstream ##
+def refresh_downstream(folder: str = EVENTS_FOLDER, root: Optional[str] = None, state_path: Optional[str] = None,
+                       own_stats_only: bool = False, registry_path: Optional[str] = None) -> int:
+    """
+    Brings the pipeline's fight and feature datasets and fighter state up to
+    date with revised event files. Only the feature rows and fighter records
+    the revisions can change are recomputed (see features.refresh_features),
+    and only the year partitions holding them are rewritten.
+
+    Args:
+        folder (str): folder the event files are stored in
+        root (Optional[str]): folder of the datasets, the pipeline's if not given
+        state_path (Optional[str]): path of the fighter state, the pipeline's if not given
+        own_stats_only (bool): see features.calculate_fighter_historical_averages
+        registry_path (Optional[str]): path of the fighter ID registry, the pipeline's if not given
+
+    Returns:
+        int: number of feature rows that changed
+
+    Raises:
+        ValueError: if fights were added or removed, which needs the load, features and ratings stages rerun
+    """
+    from datastore import read_features, write_features, write_fights
+    from features import STAT_COLUMNS, refresh_features, sort_fights
+    from fighter_ids import FighterRegistry
+    from fighter_state import FighterStateStore
+    from loader import compact_fight_df, load_fight_df
+    from pipeline import DATASET_FOLDER, FIGHTER_STATE_PATH, REGISTRY_PATH, mark_current
+
+    root = root or DATASET_FOLDER
+    state_path = state_path or FIGHTER_STATE_PATH
+    registry_path = registry_path or REGISTRY_PATH
+    registry = FighterRegistry.load(registry_path)
+    load_df = compact_fight_df(load_fight_df(folder), registry)
+    fight_df = sort_fights(load_df)
+    final_df = read_features(root=root)
+
+    final_df, updated, fighters, ratings = refresh_features(final_df, fight_df, STAT_COLUMNS, own_stats_only)
+    registry.save(registry_path)
+
+    years = sorted(set(final_df.loc[updated, 'date'].dt.year.tolist()))
+    if years:
+        # The fights are written in load order, like the pipeline's load stage writes them
+        write_fights(load_df, root, years)
+        write_features(final_df, root, years)
+        store = FighterStateStore.load(state_path)
+        store.refresh(fight_df, fighters, ratings)
+        store.save(state_path)
+    mark_current(['load', 'features', 'ratings'], {'events': folder, 'dataset': root, 'fighter_state': state_path,
+                                                   'fighter_ids': registry_path, 'own_stats_only': own_stats_only})
+
+    return int(updated.sum())
+
+
+if __name__ == '__main__':
+    import argparse
+    from crawl import configure_fetcher
+    from instrument import add_profile_arguments, profiling
+
+    parser = argparse.ArgumentParser(description='Check the stored fights against ufcstats and apply revisions')
+    parser.add_argument('--url', default=EVENTS_URL, help='URL listing the events')
+    parser.add_argument('--folder', default=EVENTS_FOLDER, help='folder of the event files')
+    parser.add_argument('--revisions', default=REVISIONS_PATH, help='path of the revision manifest')
+    parser.add_argument('--workers', type=int, default=None, help='maximum number of requests in flight')
+    parser.add_argument('--rate', type=float, default=None, help='maximum requests per second')
+    parser.add_argument('--dry-run', action='store_true', help='report revised fights without rewriting them')
+    parser.add_argument('--no-refresh', action='store_true', help='leave the datasets and fighter state as they are')
+    parser.add_argument('--own-stats-only', action='store_true', help='see features.calculate_fighter_historical_averages')
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    with profiling(args.profile, args.cprofile):
+        # Conditional requests go to the site, not to the response cache
+        configure_fetcher(args.workers, args.rate, cache_dir=None)
+        changes, failed = sweep(args.url, args.folder, args.revisions, args.workers, args.dry_run)
+        for url, error in failed.items():
+            print(f'{url}: {error}')
+        for change in changes:
+            print(f"{change['file']}: {change['fight']} ({', '.join(change['fields'])})")
+        print(f'{len(changes)} revised fights')
+        if changes and not args.dry_run and not args.no_refresh:
+            from pipeline import DATASET_FOLDER
+            if os.path.isdir(os.path.join(DATASET_FOLDER, 'features')):
+                try:
+                    rows = refresh_downstream(args.folder, own_stats_only=args.own_stats_only)
+                    print(f'refreshed {rows} feature rows')
+                except ValueError as e:
+                    print(f'{e}, run: python main.py load features ratings')
@@ -1,21 +1,69 @@
 
-import requests
-from typing import List, Tuple
-from bs4 import BeautifulSoup
+from datetime import datetime
+from typing import List, Optional, Tuple
+from bs4 import BeautifulSoup, SoupStrainer
+from fetcher import fetch, map_concurrent
+from instrument import timed
+
+try:
+    import lxml  # noqa: F401
+    PARSER = 'lxml'
+except ImportError:
+    PARSER = 'html.parser'
+
+# Only the fighters, the fight details and the stat tables of a fight page are
+# needed, everything else (header, nav, footer, scripts) is never built.
+FIGHT_PAGE_SECTIONS = {'b-fight-details__persons', 'b-fight-details__fight', 'b-fight-details__table-body'}
+
+def _is_fight_page_section(class_value: Optional[str]) -> bool:
+    # While parsing, class is still the raw attribute string ('b-fight-details__persons clearfix')
+    return class_value is not None and not FIGHT_PAGE_SECTIONS.isdisjoint(class_value.split())
+
+FIGHT_PAGE_STRAINER = SoupStrainer(class_=_is_fight_page_section)
+
+FIGHTER_URL = 'http://ufcstats.com/fighter-details/'
+
+# Career statistics of a fighter page and the keys they are stored under
+CAREER_STATS = {
+    'SLpM': 'slpm',
+    'Str. Acc.': 'str_acc',
+    'SApM': 'sapm',
+    'Str. Def': 'str_def',
+    'TD Avg.': 'td_avg',
+    'TD Acc.': 'td_acc',
+    'TD Def.': 'td_def',
+    'Sub. Avg.': 'sub_avg',
+}
+
+# A fight page has four stat tables: totals, totals per round, significant
+# strikes by target and position, and the same per round. Every table body is
+# one row of cells with fighter 1 and fighter 2 alternating, names first.
+TOTALS_CELLS = 20
+SIG_STR_CELLS = 18
+TOTALS_COLUMNS = ['kd', 'sig_str_landed', 'sig_str_att', 'str_landed', 'str_att',
+                  'td_comp', 'td_att', 'sub_att', 'rev', 'ctrl_time']
+SIG_STR_TARGETS = ['head', 'body', 'leg', 'distance', 'clinch', 'ground']
+SIG_STR_COLUMNS = [f'{target}_{count}' for target in SIG_STR_TARGETS for count in ('landed', 'att')]
+
+# Columns of each round in fight_data['round_stats']
+ROUND_COLUMNS = TOTALS_COLUMNS + SIG_STR_COLUMNS
 
 ## Scrape Stats ## 
-def get_event_data(url: str) -> Tuple[str, List[dict]]:
+@timed()
+def get_event_data(url: str, html: Optional[str] = None) -> Tuple[str, List[dict]]:
     """
     Args:
         url (str): URL of event
+        html (Optional[str]): already downloaded event page, fetched from url if not given
 
     Returns:
         Tuple[str, List[dict]]: name of event, list of dictionaries of match data
 
     """
     event_data = {}
-    response = requests.get(url)
-    soup = BeautifulSoup(response.text, 'html.parser')
+    if html is None:
+        html = fetch(url)
+    soup = BeautifulSoup(html, PARSER)
 
     name = get_event_name(soup)
     date = get_event_date(soup)
@@ -23,7 +71,7 @@ def get_event_data(url: str) -> Tuple[str, List[dict]]:
     event_data['event'] = name
     event_data['date'] = date
 
-    fight_urls = get_fight_urls(url)
+    fight_urls = parse_fight_urls(soup)
     fight_data_list = get_fights_data(fight_urls)
 
     for fight_data in fight_data_list:
@@ -57,20 +105,81 @@ def get_event_date(soup: BeautifulSoup) -> str:
 
     return event_date
 
-def get_fights_data(urls: List[str]) -> List[dict]:
+@timed()
+def get_upcoming_event(url: str, html: Optional[str] = None) -> dict:
+    """
+    Args:
+        url (str): URL of an event that has not happened yet
+        html (Optional[str]): already downloaded event page, fetched from url if not given
+
+    Returns:
+        dict: 'event', 'date', 'url' and 'fights', the scheduled bouts (see parse_upcoming_fights)
+    """
+    if html is None:
+        html = fetch(url)
+    soup = BeautifulSoup(html, PARSER)
+
+    return {
+        'event': get_event_name(soup),
+        'date': get_event_date(soup),
+        'url': url,
+        'fights': parse_upcoming_fights(soup),
+    }
+
+@timed()
+def parse_upcoming_fights(soup: BeautifulSoup) -> List[dict]:
+    """
+    Upcoming bouts have no result, so there is no win flag to follow and the
+    fighters are read from the event table itself.
+
+    Args:
+        soup (BeautifulSoup): nested data structure that represents an event page
+
+    Returns:
+        List[dict]: one dictionary per bout in card order, with 'fighter1', 'fighter2', 'fighter1_id',
+                    'fighter2_id', 'weight_class' and 'url' (the matchup page)
+    """
+    fights = []
+    for row in soup.find_all('tr', class_='b-fight-details__table-row'):
+        links = row.find_all('a', class_='b-link b-link_style_black')
+        if len(links) < 2:
+            continue
+        columns = row.find_all('td', class_='b-fight-details__table-col')
+        weight_class = columns[2].get_text(strip=True) if len(columns) > 2 else ''
+        fights.append({
+            'fighter1': links[0].get_text(strip=True),
+            'fighter2': links[1].get_text(strip=True),
+            'fighter1_id': parse_fighter_id(links[0].get('href')),
+            'fighter2_id': parse_fighter_id(links[1].get('href')),
+            'weight_class': weight_class,
+            'url': row.get('data-link'),
+        })
+
+    return fights
+
+def get_events_data(urls: List[str], max_workers: Optional[int] = None) -> List[dict]:
+    """
+    Args:
+        urls (List[str]): list of URLs of events
+        max_workers (Optional[int]): number of events scraped at once
+
+    Returns:
+        List[dict]: list of dictionaries of event data, in the same order as urls
+    """
+    return map_concurrent(get_event_data, urls, max_workers)
+
+def get_fights_data(urls: List[str], max_workers: Optional[int] = None) -> List[dict]:
     """
     Args: 
         urls (List[str]): list of URLs of fights
+        max_workers (Optional[int]): number of fights fetched at once
 
     Returns:
-        List[dict]: list of dictionaries with data of fights
+        List[dict]: list of dictionaries with data of fights, in the same order as urls
     """
-    fight_data_list = []
-    for url in urls:
-        fight_data_list.append(get_fight_data(url))
-    
-    return fight_data_list
+    return map_concurrent(get_fight_data, urls, max_workers)
 
+@timed()
 def get_fight_data(url: str) -> dict:
     """
     Args:
@@ -80,25 +189,40 @@ def get_fight_data(url: str) -> dict:
         dict: dictionary with fight data
              
     """
+    return parse_fight_page(fetch(url))
+
+@timed()
+def get_fight_data_from_soup(soup: BeautifulSoup) -> dict:
+    """
+    Builds the fight data with one search per field. parse_fight_page returns
+    the same dictionary from a single pass and is faster when starting from HTML.
+
+    Args:
+        soup (BeautifulSoup): nested data structure that represents a fight page
+
+    Returns:
+        dict: dictionary with fight data
+    """
     fight_data = {}
-    
-    response = requests.get(url)
-    soup = BeautifulSoup(response.text, 'html.parser')
 
     fighters = get_fighters(soup)
+    fighter_ids = get_fighter_ids(soup)
     name = fighters[0] + ' vs ' + fighters[1]
     winner = get_winner(soup)
     method = get_method(soup)
     time_end = get_time_end(soup)
     round_end = get_round_end(soup)
-    fight_length = 60 * (round_end - 1) + get_time(time_end)
+    fight_length = 300 * (round_end - 1) + get_time(time_end)
     score = None
     fighter1_fight_stats, fighter2_fight_stats = get_fighter_fight_stats(soup)
+    sig_str_breakdown, round_stats = build_fight_tables(get_fight_tables(soup))
    
 
     fight_data['name'] = name
     fight_data['fighter1'] = fighters[0]
     fight_data['fighter2'] = fighters[1]
+    fight_data['fighter1_id'] = fighter_ids[0]
+    fight_data['fighter2_id'] = fighter_ids[1]
     fight_data['winner'] = winner
     fight_data['method'] = method
     fight_data['time_end'] = time_end
@@ -109,9 +233,80 @@ def get_fight_data(url: str) -> dict:
     fight_data['score'] = score
     fight_data['fighter1_fight_data'] = fighter1_fight_stats
     fight_data['fighter2_fight_data'] = fighter2_fight_stats
+    fight_data['sig_str_breakdown'] = sig_str_breakdown
+    fight_data['round_stats'] = round_stats
+
+    return fight_data
+
+@timed()
+def parse_fight_page(html: str, parser: str = PARSER) -> dict:
+    """
+    Builds the same dictionary as get_fight_data_from_soup, but only parses the
+    relevant parts of the page and collects every field in one walk over them.
+
+    Args:
+        html (str): fight page
+        parser (str): BeautifulSoup tree builder, 'lxml' when installed
+
+    Returns:
+        dict: dictionary with fight data
+    """
+    soup = BeautifulSoup(html, parser, parse_only=FIGHT_PAGE_STRAINER)
+
+    fighters = []
+    fighter_ids = []
+    statuses = []
+    text_items = []
+    tables = []
+    method = ''
+    for tag in soup.find_all(True):
+        classes = tag.get('class') or ()
+        if 'b-fight-details__person-link' in classes:
+            fighters.append(tag.contents[0].strip())
+            fighter_ids.append(parse_fighter_id(tag.get('href')))
+        elif 'b-fight-details__person-status' in classes:
+            statuses.append(tag.get_text(strip=True))
+        elif 'b-fight-details__text-item' in classes:
+            text_items.append(tag.get_text(strip=True))
+        elif 'b-fight-details__table-body' in classes:
+            tables.append([])
+        elif 'b-fight-details__table-text' in classes:
+            tables[-1].append(tag.get_text(strip=True))
+        elif not method and tag.name == 'i' and tag.get('style') == 'font-style: normal':
+            method = tag.get_text(strip=True)
+
+    winner = ''
+    for fighter, status in zip(fighters, statuses):
+        if status == 'W':
+            winner = fighter
+            break
+
+    time_end = text_items[1][-4:]
+    round_end = int(text_items[0][-1])
+    table_texts = [text for table in tables for text in table][:TOTALS_CELLS]
+    fighter1_fight_stats, fighter2_fight_stats = build_fighter_fight_stats(table_texts[2:])
+    sig_str_breakdown, round_stats = build_fight_tables(tables)
+
+    fight_data = {}
+    fight_data['name'] = fighters[0] + ' vs ' + fighters[1]
+    fight_data['fighter1'] = fighters[0]
+    fight_data['fighter2'] = fighters[1]
+    fight_data['fighter1_id'] = fighter_ids[0]
+    fight_data['fighter2_id'] = fighter_ids[1]
+    fight_data['winner'] = winner
+    fight_data['method'] = method
+    fight_data['time_end'] = time_end
+    fight_data['round_end'] = round_end
+    fight_data['fight_length'] = 300 * (round_end - 1) + get_time(time_end)
+    fight_data['score'] = parse_score(text_items) if 'Decision' in method else None
+    fight_data['fighter1_fight_data'] = fighter1_fight_stats
+    fight_data['fighter2_fight_data'] = fighter2_fight_stats
+    fight_data['sig_str_breakdown'] = sig_str_breakdown
+    fight_data['round_stats'] = round_stats
 
     return fight_data
 
+@timed()
 def get_fighter_fight_stats(soup: BeautifulSoup) -> Tuple[dict, dict]:
     """
     Args:
@@ -120,16 +315,26 @@ def get_fighter_fight_stats(soup: BeautifulSoup) -> Tuple[dict, dict]:
     Returns:
         Tuple[dict, dict]: ()
     """ 
-    fighter1_fight_stats = {}
-    fighter2_fight_stats = {}
     elements = soup.find_all('p', class_='b-fight-details__table-text', limit=20)[2:]
     stats = []
     for element in elements:
         stats.append(element.get_text(strip=True))
+
+    return build_fighter_fight_stats(stats)
+
+def build_fighter_fight_stats(stats: List[str]) -> Tuple[dict, dict]:
+    """
+    Args:
+        stats (List[str]): cell texts of the totals row, fighter 1 and fighter 2 alternating, without the names
+
+    Returns:
+        Tuple[dict, dict]: (fighter 1 stats, fighter 2 stats), (None, None) if the fight has no stats
+    """
+    fighter1_fight_stats = {}
+    fighter2_fight_stats = {}
     
     if stats == []:
         return (None, None)
-    #return elements
     
     fighter1_fight_stats['kd'] = int(stats[0])
     fighter2_fight_stats['kd'] = int(stats[1])
@@ -163,6 +368,91 @@ def get_fighter_fight_stats(soup: BeautifulSoup) -> Tuple[dict, dict]:
 
     return fighter1_fight_stats, fighter2_fight_stats    
 
+@timed()
+def get_fight_tables(soup: BeautifulSoup) -> List[List[str]]:
+    """
+    Args:
+        soup (BeautifulSoup): nested data structure that represents a fight page
+
+    Returns:
+        List[List[str]]: cell texts of every stat table body, in page order
+    """
+    tables = []
+    for body in soup.find_all(class_='b-fight-details__table-body'):
+        tables.append([element.get_text(strip=True)
+                       for element in body.find_all('p', class_='b-fight-details__table-text')])
+
+    return tables
+
+@timed()
+def build_fight_tables(tables: List[List[str]]) -> Tuple[Optional[dict], Optional[dict]]:
+    """
+    Args:
+        tables (List[List[str]]): cell texts of every stat table body, in page order
+
+    Returns:
+        Tuple[Optional[dict], Optional[dict]]: significant strikes by target and position
+            ({'fighter1': [...], 'fighter2': [...]} in SIG_STR_COLUMNS order) and the stats of every round
+            ({'fighter1': [[...], ...], 'fighter2': [[...], ...]}, one list per round in ROUND_COLUMNS
+            order), None when the page does not have the tables
+    """
+    totals = [table for table in tables if len(table) == TOTALS_CELLS]
+    sig_str = [table for table in tables if len(table) == SIG_STR_CELLS]
+
+    sig_str_breakdown = None
+    if sig_str:
+        fighter1_sig_str, fighter2_sig_str = parse_sig_str_row(sig_str[0])
+        sig_str_breakdown = {'fighter1': fighter1_sig_str, 'fighter2': fighter2_sig_str}
+
+    # The first totals and significant strikes tables cover the whole fight
+    round_totals = totals[1:]
+    round_sig_str = sig_str[1:]
+    round_stats = None
+    if round_totals and len(round_totals) == len(round_sig_str):
+        round_stats = {'fighter1': [], 'fighter2': []}
+        for totals_row, sig_str_row in zip(round_totals, round_sig_str):
+            fighter1_totals, fighter2_totals = parse_totals_row(totals_row)
+            fighter1_sig_str, fighter2_sig_str = parse_sig_str_row(sig_str_row)
+            round_stats['fighter1'].append(fighter1_totals + fighter1_sig_str)
+            round_stats['fighter2'].append(fighter2_totals + fighter2_sig_str)
+
+    return sig_str_breakdown, round_stats
+
+def parse_totals_row(cells: List[str]) -> Tuple[List[int], List[int]]:
+    """
+    Args:
+        cells (List[str]): cell texts of a totals row, names included
+
+    Returns:
+        Tuple[List[int], List[int]]: (fighter 1 stats, fighter 2 stats) in TOTALS_COLUMNS order
+    """
+    rows = ([], [])
+    for i, row in enumerate(rows):
+        row.append(int(cells[2 + i]))
+        row.extend(parse_of(cells[4 + i]))
+        row.extend(parse_of(cells[8 + i]))
+        row.extend(parse_of(cells[10 + i]))
+        row.append(int(cells[14 + i]))
+        row.append(int(cells[16 + i]))
+        row.append(get_time(cells[18 + i]))
+
+    return rows
+
+def parse_sig_str_row(cells: List[str]) -> Tuple[List[int], List[int]]:
+    """
+    Args:
+        cells (List[str]): cell texts of a significant strikes row, names included
+
+    Returns:
+        Tuple[List[int], List[int]]: (fighter 1 stats, fighter 2 stats) in SIG_STR_COLUMNS order
+    """
+    rows = ([], [])
+    for i, row in enumerate(rows):
+        for column in range(len(SIG_STR_TARGETS)):
+            row.extend(parse_of(cells[6 + 2 * column + i]))
+
+    return rows
+
 def get_time(time_str: str) -> int:
     """
     Args:
@@ -192,6 +482,7 @@ def parse_of(s: str) -> Tuple[int, int]:
     second = int(parts[1])
     return first, second
 
+@timed()
 def get_score(soup: BeautifulSoup) -> Tuple[int, int]:
     """
     Args:
@@ -200,12 +491,21 @@ def get_score(soup: BeautifulSoup) -> Tuple[int, int]:
     Returns:
         Tuple[int, int]: (judges score for losing fighter, judges score for winning fighter)
     """ 
-    
+    elements = soup.find_all('i', class_='b-fight-details__text-item')
+    return parse_score([element.get_text(strip=True) for element in elements])
+
+def parse_score(text_items: List[str]) -> Tuple[int, int]:
+    """
+    Args:
+        text_items (List[str]): texts of the fight details items (round, time, format, referee, judges)
+
+    Returns:
+        Tuple[int, int]: (judges score for losing fighter, judges score for winning fighter)
+    """
     try:
-        elements = soup.find_all('i', class_='b-fight-details__text-item')
-        judge1 = elements[4].get_text(strip=True)[-8:-1]
-        judge2 = elements[5].get_text(strip=True)[-8:-1]
-        judge3 = elements[6].get_text(strip=True)[-8:-1]
+        judge1 = text_items[4][-8:-1]
+        judge2 = text_items[5][-8:-1]
+        judge3 = text_items[6][-8:-1]
         judges = [judge1, judge2, judge3]
         score = [0, 0]
         for judge in judges:
@@ -215,6 +515,7 @@ def get_score(soup: BeautifulSoup) -> Tuple[int, int]:
     except IndexError:    
         return None
      
+@timed()
 def get_time_end(soup: BeautifulSoup) -> str:
     """
     Args:
@@ -226,6 +527,7 @@ def get_time_end(soup: BeautifulSoup) -> str:
     element = soup.find_all('i', class_='b-fight-details__text-item')[1]
     return element.get_text(strip=True)[-4:]
 
+@timed()
 def get_round_end(soup: BeautifulSoup) -> int:
     """
     Args:
@@ -238,6 +540,7 @@ def get_round_end(soup: BeautifulSoup) -> int:
     round = int(element.get_text(strip=True)[-1])
     return round
 
+@timed()
 def get_method(soup: BeautifulSoup) -> str:
     """
     Args: 
@@ -251,6 +554,7 @@ def get_method(soup: BeautifulSoup) -> str:
         return element.get_text(strip=True)
     return ''
 
+@timed()
 def get_winner(soup: BeautifulSoup) -> str:
     """
     Args: 
@@ -270,6 +574,7 @@ def get_winner(soup: BeautifulSoup) -> str:
     
     return ''
 
+@timed()
 def get_fighters(soup: BeautifulSoup) -> Tuple[str, str]:
     """
     Args:
@@ -285,6 +590,128 @@ def get_fighters(soup: BeautifulSoup) -> Tuple[str, str]:
     
     return fighter1, fighter2
 
+@timed()
+def get_fighter_ids(soup: BeautifulSoup) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Args:
+        soup (BeautifulSoup): nested data structure that represents a document
+
+    Returns:
+        Tuple[Optional[str], Optional[str]]: ufcstats fighter-details IDs of (fighter1, fighter2)
+    """
+    elements = soup.find_all('a', class_='b-link b-fight-details__person-link')
+
+    return parse_fighter_id(elements[0].get('href')), parse_fighter_id(elements[1].get('href'))
+
+def parse_fighter_id(url: Optional[str]) -> Optional[str]:
+    """
+    Args:
+        url (Optional[str]): fighter-details URL, e.g. 'http://ufcstats.com/fighter-details/1c5879330d42255f'
+
+    Returns:
+        Optional[str]: the fighter's ufcstats ID, e.g. '1c5879330d42255f'
+    """
+    if not url or '/fighter-details/' not in url:
+        return None
+    return url.rstrip('/').rsplit('/', 1)[-1]
+
+## Scrape Fighters ##
+@timed()
+def get_fighter_profile(ufcstats_id: str) -> dict:
+    """
+    Args:
+        ufcstats_id (str): ufcstats fighter-details ID
+
+    Returns:
+        dict: fighter profile, see parse_fighter_page
+    """
+    profile = parse_fighter_page(fetch(FIGHTER_URL + ufcstats_id))
+    profile['id'] = ufcstats_id
+    return profile
+
+@timed()
+def parse_fighter_page(html: str, parser: str = PARSER) -> dict:
+    """
+    Args:
+        html (str): fighter page
+        parser (str): BeautifulSoup tree builder, 'lxml' when installed
+
+    Returns:
+        dict: name, record, height and reach (inches), weight (lbs), stance, dob ('YYYY-MM-DD') and the
+              career statistics (percentages as fractions), None for values the page does not list
+    """
+    soup = BeautifulSoup(html, parser)
+
+    name = soup.find('span', class_='b-content__title-highlight')
+    record = soup.find('span', class_='b-content__title-record')
+    items = {}
+    for element in soup.find_all('li', class_='b-list__box-list-item'):
+        title = element.find('i', class_='b-list__box-item-title')
+        if title is None:
+            continue
+        key = title.get_text(strip=True).rstrip(':')
+        title.extract()
+        items[key] = element.get_text(strip=True)
+
+    profile = {
+        'name': name.get_text(strip=True) if name else None,
+        'record': record.get_text(strip=True).replace('Record:', '').strip() if record else None,
+        'height': parse_height(items.get('Height')),
+        'weight': parse_number(items.get('Weight', '').replace('lbs.', '')),
+        'reach': parse_number(items.get('Reach', '').replace('"', '')),
+        'stance': items.get('STANCE') or None,
+        'dob': parse_dob(items.get('DOB')),
+    }
+    for title, key in CAREER_STATS.items():
+        value = items.get(title, '')
+        if value.endswith('%'):
+            number = parse_number(value[:-1])
+            profile[key] = number / 100 if number is not None else None
+        else:
+            profile[key] = parse_number(value)
+
+    return profile
+
+def parse_height(height: Optional[str]) -> Optional[int]:
+    """
+    Args:
+        height (Optional[str]): height as listed, e.g. '5\' 11"'
+
+    Returns:
+        Optional[int]: height in inches, None if not listed
+    """
+    try:
+        feet, inches = height.replace('"', '').split("'")
+        return int(feet) * 12 + int(inches)
+    except (AttributeError, ValueError):
+        return None
+
+def parse_number(value: Optional[str]) -> Optional[float]:
+    """
+    Args:
+        value (Optional[str]): number as listed, '--' when unknown
+
+    Returns:
+        Optional[float]: the number, None if not listed
+    """
+    try:
+        return float(value.strip())
+    except (AttributeError, ValueError):
+        return None
+
+def parse_dob(dob: Optional[str]) -> Optional[str]:
+    """
+    Args:
+        dob (Optional[str]): date of birth as listed, e.g. 'Jul 14, 1988'
+
+    Returns:
+        Optional[str]: date of birth as 'YYYY-MM-DD', None if not listed
+    """
+    try:
+        return datetime.strptime(dob, '%b %d, %Y').strftime('%Y-%m-%d')
+    except (TypeError, ValueError):
+        return None
+
 ## Scrape URLs ##
 def get_event_urls(url: str) -> List[str]:
     """
@@ -294,14 +721,45 @@ def get_event_urls(url: str) -> List[str]:
     Returns:
         List[str]: list of event URLs
     """
-    event_urls = []
-    response = requests.get(url)
-    soup = BeautifulSoup(response.text, 'html.parser')
+    soup = BeautifulSoup(fetch(url), PARSER)
+    return parse_event_urls(soup)
+
+def parse_event_urls(soup: BeautifulSoup) -> List[str]:
+    """
+    Args:
+        soup (BeautifulSoup): nested data structure that represents a page listing events
+
+    Returns:
+        List[str]: list of event URLs
+    """
+    return [event_url for event_url, _ in parse_event_listing(soup)]
+
+def get_event_listing(url: str) -> List[Tuple[str, str]]:
+    """
+    Args:
+        url (str): URL containing links to events
+
+    Returns:
+        List[Tuple[str, str]]: list of (event URL, event name)
+    """
+    soup = BeautifulSoup(fetch(url), PARSER)
+    return parse_event_listing(soup)
+
+@timed()
+def parse_event_listing(soup: BeautifulSoup) -> List[Tuple[str, str]]:
+    """
+    Args:
+        soup (BeautifulSoup): nested data structure that represents a page listing events
+
+    Returns:
+        List[Tuple[str, str]]: list of (event URL, event name)
+    """
+    events = []
     elements = soup.find_all('a', class_='b-link b-link_style_black')
     for element in elements:
-        event_urls.append(element['href'])
+        events.append((element['href'], element.get_text(strip=True)))
 
-    return event_urls
+    return events
 
 
 def get_fight_urls(url: str) -> List[str]:
@@ -309,12 +767,22 @@ def get_fight_urls(url: str) -> List[str]:
     Args:
         url (str): URL containing links to matches
 
+    Returns:
+        List[str]: list of match URLs
+    """
+    soup = BeautifulSoup(fetch(url), PARSER)
+    return parse_fight_urls(soup)
+
+@timed()
+def parse_fight_urls(soup: BeautifulSoup) -> List[str]:
+    """
+    Args:
+        soup (BeautifulSoup): nested data structure that represents an event page
+
     Returns:
         List[str]: list of match URLs
     """
     fight_urls = []
-    response = requests.get(url)
-    soup = BeautifulSoup(response.text, 'html.parser')
     elements = soup.find_all('a', class_='b-flag b-flag_style_green')
     for element in elements:
         fight_urls.append(element['href'])
@@ -0,0 +1,145 @@
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+# Responses that mean the server is overloaded or rate limiting us
+THROTTLE_STATUSES = {429, 503}
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Token bucket whose refill rate adapts to the server: it grows additively
+    while requests succeed at normal latency and is cut multiplicatively on
+    errors, throttling responses and latency spikes.
+    """
+
+    def __init__(self, rate: float = 10.0, capacity: float = 10.0, min_rate: float = 0.5, max_rate: float = 50.0,
+                 increase: float = 0.1, decrease: float = 0.5, slow_factor: float = 3.0):
+        """
+        Args:
+            rate (float): initial requests per second
+            capacity (float): largest burst of requests
+            min_rate (float): lowest requests per second the bucket backs off to
+            max_rate (float): highest requests per second the bucket grows to
+            increase (float): requests per second added after each healthy response
+            decrease (float): factor the rate is multiplied by after an error
+            slow_factor (float): latency above this multiple of the usual latency counts as slow
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.slow_factor = slow_factor
+        self.latency = None
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """
+        Blocks until a request may be sent.
+
+        Returns:
+            float: seconds spent waiting
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = max(self._paused_until - now, (1 - self._tokens) / self.rate)
+            time.sleep(delay)
+            waited += delay
+
+    def record(self, latency: float, status: Optional[int], retry_after: Optional[float] = None) -> None:
+        """
+        Adapts the rate to the outcome of a request.
+
+        Args:
+            latency (float): seconds the request took
+            status (Optional[int]): status code, None if the request failed without a response
+            retry_after (Optional[float]): seconds the server asked us to wait
+        """
+        with self._lock:
+            failed = status is None or status in RETRY_STATUSES
+            slow = self.latency is not None and latency > self.slow_factor * self.latency
+
+            if failed or slow:
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+            else:
+                self.rate = min(self.max_rate, self.rate + self.increase)
+
+            if not failed:
+                # Moving average of healthy latencies, the baseline for 'slow'
+                self.latency = latency if self.latency is None else 0.9 * self.latency + 0.1 * latency
+
+            if status in THROTTLE_STATUSES or retry_after:
+                pause = retry_after if retry_after else 1.0 / self.rate
+                self._paused_until = max(self._paused_until, time.monotonic() + pause)
+                self._tokens = min(self._tokens, 0.0)
+
+
+class RateLimiter:
+    """
+    One adaptive token bucket per host.
+    """
+
+    def __init__(self, **bucket_options):
+        """
+        Args:
+            **bucket_options: options of every TokenBucket, see TokenBucket.__init__
+        """
+        self.bucket_options = bucket_options
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, url: str) -> TokenBucket:
+        """
+        Args:
+            url (str): URL of page
+
+        Returns:
+            TokenBucket: bucket of the URL's host
+        """
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._buckets:
+                self._buckets[host] = TokenBucket(**self.bucket_options)
+            return self._buckets[host]
+
+    def acquire(self, url: str) -> float:
+        return self.bucket(url).acquire()
+
+    def record(self, url: str, latency: float, status: Optional[int], retry_after: Optional[float] = None) -> None:
+        self.bucket(url).record(latency, status, retry_after)
+
+    def rates(self) -> Dict[str, float]:
+        """
+        Returns:
+            Dict[str, float]: host -> current requests per second
+        """
+        with self._lock:
+            return {host: bucket.rate for host, bucket in self._buckets.items()}
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Args:
+        value (Optional[str]): Retry-After header
+
+    Returns:
+        Optional[float]: seconds to wait, None if missing or given as a date
+    """
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
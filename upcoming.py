@@ -0,0 +1,97 @@
+import csv
+import os
+from typing import List, Optional
+from fetcher import map_concurrent
+from predict import SNAPSHOT_FOLDER, Predictor
+from scraper import get_event_urls, get_upcoming_event
+
+UPCOMING_URL = 'http://ufcstats.com/statistics/events/upcoming?page=all'
+PREDICTIONS_PATH = 'predictions.csv'
+PREDICTION_COLUMNS = ['event', 'date', 'fighter1', 'fighter2', 'weight_class',
+                      'fighter1_debut', 'fighter2_debut', 'p_fighter1', 'p_fighter2']
+
+
+def get_upcoming_events(url: str = UPCOMING_URL, max_workers: Optional[int] = None) -> List[dict]:
+    """
+    Args:
+        url (str): URL listing the scheduled events
+        max_workers (Optional[int]): number of event pages fetched at once
+
+    Returns:
+        List[dict]: every scheduled event in listing order, see scraper.get_upcoming_event
+    """
+    return map_concurrent(get_upcoming_event, get_event_urls(url), max_workers)
+
+def score_cards(events: List[dict], predictor: Predictor) -> List[dict]:
+    """
+    Builds the features of every bout on every card from the fighters'
+    latest rows and scores them all in one Predictor.predict_many call.
+    Fighters not in the snapshot are scored as debutants.
+
+    Args:
+        events (List[dict]): scheduled events from get_upcoming_events
+        predictor (Predictor): loaded fighter snapshot
+
+    Returns:
+        List[dict]: one row per bout with PREDICTION_COLUMNS
+    """
+    rows = []
+    for event in events:
+        for fight in event['fights']:
+            rows.append({
+                'event': event['event'],
+                'date': event['date'],
+                'fighter1': fight['fighter1'],
+                'fighter2': fight['fighter2'],
+                'weight_class': fight['weight_class'],
+                'fighter1_debut': not predictor.is_known(fight['fighter1']),
+                'fighter2_debut': not predictor.is_known(fight['fighter2']),
+            })
+
+    p = predictor.predict_many([row['fighter1'] for row in rows], [row['fighter2'] for row in rows],
+                               allow_debut=True)
+    for row, p_fighter1 in zip(rows, p.tolist()):
+        row['p_fighter1'] = round(p_fighter1, 4)
+        row['p_fighter2'] = round(1 - p_fighter1, 4)
+
+    return rows
+
+def write_predictions(rows: List[dict], path: str = PREDICTIONS_PATH) -> str:
+    """
+    Args:
+        rows (List[dict]): scored bouts from score_cards
+        path (str): path of the CSV file
+
+    Returns:
+        str: the written path
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=PREDICTION_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(tmp_path, path)
+
+    return path
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+    from instrument import add_profile_arguments, profiling
+
+    parser = argparse.ArgumentParser(description='Predict every bout of the scheduled events')
+    parser.add_argument('--url', default=UPCOMING_URL, help='URL listing the scheduled events')
+    parser.add_argument('--snapshot', default=SNAPSHOT_FOLDER, help='snapshot folder, see predict.py --build')
+    parser.add_argument('--out', default=PREDICTIONS_PATH, help='path of the predictions CSV')
+    parser.add_argument('--workers', type=int, default=None, help='maximum number of requests in flight')
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    with profiling(args.profile, args.cprofile):
+        events = get_upcoming_events(args.url, args.workers)
+        start = time.perf_counter()
+        rows = score_cards(events, Predictor(args.snapshot))
+        elapsed = (time.perf_counter() - start) * 1000
+        write_predictions(rows, args.out)
+        print(f'scored {len(rows)} bouts on {len(events)} cards in {elapsed:.1f} ms, wrote {args.out}')